@@ -1,6 +1,7 @@
-import pandas as pd
 import os
+import numpy as np
 from Fuels import Fuels
+from utils import DATA_DIR
 
 class Engine:
     """
@@ -61,52 +62,34 @@ class Engine:
         Returns:
             list: A list of Engine objects created from the CSV files.
         """
-        RF_engines = pd.read_csv(os.path.join('data', 'RFEngines.csv'))
-        SRB = pd.read_csv(os.path.join('data', 'SRB.csv'))
+        return Engine.catalog(allowedEngines).to_engines()
 
-        engines = []
-
-        for idx, eng in RF_engines.iterrows():
-            # Determine if the engine is radial or not
-            if eng['Size'] == 'Radial mounted':
-                isRadial = True
-            else:
-                isRadial = False
-
-            # Determine the fuel type and amount of built-in fuel for the engine
-            if eng['Name'] == 'Nerv':
-                fuelType = 'LF'
-            elif eng['Name'] == 'Dawn':
-                fuelType = 'Xenon'
-            else:
-                fuelType = 'LFOX'
-
-            if eng['Name'] == 'Twin-Boar':
-                builtInFuel = 6400
-            else:
-                builtInFuel = 0
+    @staticmethod
+    def catalog(allowedEngines: dict) -> 'EngineCatalog':
+        """
+        Reads the rocket engine data from CSV files into a columnar EngineCatalog.
 
-            # Create a new Engine object and add it to the list of engines
-            if eng['Name'] in allowedEngines and allowedEngines[eng['Name']]:
-                engines.append(Engine(eng['Name'], eng['Mass'], eng['Thrust ASL'], eng['Thrust VAC'], eng['ISP ASL'],
-                                      eng['ISP VAC'], eng['Cost'], isRadial, fuelType, builtInFuel))
+        Args:
+            allowedEngines (dict): Maps engine names to True if the engine may be used in the game.
 
-        for idx, eng in SRB.iterrows():
-            if eng['Name'] in allowedEngines and allowedEngines[eng['Name']]:
-                solidFuelCost = Fuels.SolidFuel['Cost']
-                emptyCost = eng['Cost'] - solidFuelCost * eng['Solid Fuel']
+        Returns:
+            EngineCatalog: The allowed engines in CSV order, liquid engines first and SRBs second.
+        """
+        import pandas as pd
 
-                if eng['Size'] == 'Radial mounted':
-                    isRadial = True
-                else:
-                    isRadial = False
+        RF_engines = pd.read_csv(os.path.join(DATA_DIR, 'RFEngines.csv'))
+        SRB = pd.read_csv(os.path.join(DATA_DIR, 'SRB.csv'))
 
-                engines.append(SRB_Engine(eng['Name'], eng['Mass Empty'], eng['Thrust ASL'], eng['Thrust VAC'], eng['ISP ASL'],
-                                      eng['ISP VAC'], emptyCost, isRadial, 'SolidFuel', eng['Solid Fuel'],
-                               eng['Mass Empty'] / eng['Mass Full']))
+        # Determine the fuel type and amount of built-in fuel for the engine
+        names = RF_engines['Name'].to_numpy()
+        fuel_type = np.where(names == 'Nerv', 'LF', np.where(names == 'Dawn', 'Xenon', 'LFOX'))
+        built_in_fuel = np.where(names == 'Twin-Boar', 6400, 0)
 
+        solid_fuel_cost = Fuels.SolidFuel['Cost']
+        srb_cost = SRB['Cost'] - solid_fuel_cost * SRB['Solid Fuel']
 
-        return engines
+        catalog = EngineCatalog.from_frames(RF_engines, fuel_type, built_in_fuel, RF_engines['Cost'], SRB, srb_cost)
+        return catalog.filter(catalog.mask(allowed=allowedEngines))
 
 class KSP2_Engine(Engine):
     def setupEngines(allowedEngines: dict) -> list:
@@ -119,50 +102,27 @@ class KSP2_Engine(Engine):
         Returns:
             list: A list of Engine objects created from the CSV files.
         """
-        RF_engines = pd.read_csv(os.path.join('data', 'RFEngines_KSP2.csv'))
-        SRB = pd.read_csv(os.path.join('data', 'SRB.csv'))
+        return KSP2_Engine.catalog(allowedEngines).to_engines()
 
-        engines = []
-
-        for idx, eng in RF_engines.iterrows():
-            # Determine if the engine is radial or not
-            if eng['Size'] == 'Radial mounted':
-                isRadial = True
-            else:
-                isRadial = False
-
-            # Determine the fuel type and amount of built-in fuel for the engine
-            if eng['Name'] == 'Nerv' or eng['Name'] == 'SWERV':
-                fuelType = 'Hydrogen'
-            elif eng['Name'] == 'Dawn':
-                fuelType = 'Xenon'
-            else:
-                fuelType = 'LFOX'
-
-            builtInFuel = 0
-            engine_cost = 0
-
-            # Create a new Engine object and add it to the list of engines
-            if eng['Name'] in allowedEngines and allowedEngines[eng['Name']]:
-                engines.append(Engine(eng['Name'], eng['Mass'], eng['Thrust ASL'], eng['Thrust VAC'], eng['ISP ASL'],
-                                      eng['ISP VAC'], engine_cost, isRadial, fuelType, builtInFuel))
-
-        for idx, eng in SRB.iterrows():
-            if eng['Name'] in allowedEngines and allowedEngines[eng['Name']]:
-                solidFuelCost = Fuels.SolidFuel['Cost']
-                emptyCost = engine_cost - solidFuelCost * eng['Solid Fuel']
+    @staticmethod
+    def catalog(allowedEngines: dict) -> 'EngineCatalog':
+        """
+        Reads the KSP2 rocket engine data from CSV files into a columnar EngineCatalog. KSP2 parts have no cost.
+        """
+        import pandas as pd
 
-                if eng['Size'] == 'Radial mounted':
-                    isRadial = True
-                else:
-                    isRadial = False
+        RF_engines = pd.read_csv(os.path.join(DATA_DIR, 'RFEngines_KSP2.csv'))
+        SRB = pd.read_csv(os.path.join(DATA_DIR, 'SRB.csv'))
 
-                engines.append(
-                    SRB_Engine(eng['Name'], eng['Mass Empty'], eng['Thrust ASL'], eng['Thrust VAC'], eng['ISP ASL'],
-                               eng['ISP VAC'], engine_cost, isRadial, 'SolidFuel', eng['Solid Fuel'],
-                               eng['Mass Empty'] / eng['Mass Full']))
+        # Determine the fuel type and amount of built-in fuel for the engine
+        names = RF_engines['Name'].to_numpy()
+        fuel_type = np.where((names == 'Nerv') | (names == 'SWERV'), 'Hydrogen',
+                             np.where(names == 'Dawn', 'Xenon', 'LFOX'))
+        built_in_fuel = np.zeros(len(names))
 
-        return engines
+        catalog = EngineCatalog.from_frames(RF_engines, fuel_type, built_in_fuel, np.zeros(len(names)),
+                                            SRB, np.zeros(len(SRB)))
+        return catalog.filter(catalog.mask(allowed=allowedEngines))
 
 class SRB_Engine(Engine):
 
@@ -170,3 +130,138 @@ class SRB_Engine(Engine):
                  isRadial: bool, fuelType: str, builtInFuel: float, empty_ratio: float):
         super().__init__(name, mass, Tasl, Tv, ISPasl, ISPv, cost, isRadial, fuelType, builtInFuel)
         self.empty_ratio = empty_ratio
+
+
+class EngineCatalog:
+    """
+    Columnar (struct-of-arrays) engine catalog.
+
+    Every attribute is a contiguous NumPy array with one entry per engine, so selecting the engines of a fuel type
+    or an allowed set is a boolean mask instead of a loop over Engine objects.
+
+    Attributes:
+    -----------
+    name: numpy.ndarray
+        The engine names.
+    mass: numpy.ndarray
+        The engine masses in tons. For SRBs this is the empty mass.
+    thrust_asl, thrust_vac: numpy.ndarray
+        The thrust at sea level and in vacuum in kN.
+    isp_asl, isp_vac: numpy.ndarray
+        The specific impulse at sea level and in vacuum in seconds.
+    cost: numpy.ndarray
+        The engine costs in funds. For SRBs this is the cost without fuel.
+    is_radial: numpy.ndarray
+        True for radially mounted engines.
+    fuel_code: numpy.ndarray
+        The index of each engine's fuel type in fuel_types.
+    fuel_types: tuple
+        The fuel type names in order of first appearance.
+    built_in_fuel: numpy.ndarray
+        The fuel units built into the engine, 0 if there is none.
+    empty_ratio: numpy.ndarray
+        Empty mass over full mass of SRBs, NaN for all other engines.
+    """
+    columns = ['name', 'mass', 'thrust_asl', 'thrust_vac', 'isp_asl', 'isp_vac', 'cost', 'is_radial', 'fuel_code',
+               'built_in_fuel', 'empty_ratio']
+
+    def __init__(self, name, mass, thrust_asl, thrust_vac, isp_asl, isp_vac, cost, is_radial, fuel_code, fuel_types,
+                 built_in_fuel, empty_ratio):
+        self.name = np.asarray(name, dtype=str)
+        self.mass = np.asarray(mass, dtype=float)
+        self.thrust_asl = np.asarray(thrust_asl, dtype=float)
+        self.thrust_vac = np.asarray(thrust_vac, dtype=float)
+        self.isp_asl = np.asarray(isp_asl, dtype=float)
+        self.isp_vac = np.asarray(isp_vac, dtype=float)
+        self.cost = np.asarray(cost, dtype=float)
+        self.is_radial = np.asarray(is_radial, dtype=bool)
+        self.fuel_code = np.asarray(fuel_code, dtype=np.int8)
+        self.fuel_types = tuple(fuel_types)
+        self.built_in_fuel = np.asarray(built_in_fuel, dtype=float)
+        self.empty_ratio = np.asarray(empty_ratio, dtype=float)
+
+    def __len__(self):
+        return len(self.name)
+
+    @classmethod
+    def from_frames(cls, RF_engines, fuel_type, built_in_fuel, cost, SRB, srb_cost):
+        """
+        Builds a catalog from the liquid engine and SRB data frames.
+
+        Args:
+            RF_engines (pandas.DataFrame): The liquid engine table.
+            fuel_type (numpy.ndarray): The fuel type of every liquid engine.
+            built_in_fuel (numpy.ndarray): The built-in fuel units of every liquid engine.
+            cost (numpy.ndarray): The cost of every liquid engine.
+            SRB (pandas.DataFrame): The SRB table.
+            srb_cost (numpy.ndarray): The cost of every SRB without its fuel.
+        """
+        fuel_type = np.concatenate((np.asarray(fuel_type, dtype=str), np.full(len(SRB), 'SolidFuel')))
+        unique_types, first, inverse = np.unique(fuel_type, return_index=True, return_inverse=True)
+        order = np.argsort(first)  # Fuel types in order of first appearance
+        fuel_types = tuple(unique_types[order].tolist())
+        fuel_code = np.argsort(order)[inverse]
+
+        return cls(np.concatenate((RF_engines['Name'], SRB['Name'])),
+                   np.concatenate((RF_engines['Mass'], SRB['Mass Empty'])),
+                   np.concatenate((RF_engines['Thrust ASL'], SRB['Thrust ASL'])),
+                   np.concatenate((RF_engines['Thrust VAC'], SRB['Thrust VAC'])),
+                   np.concatenate((RF_engines['ISP ASL'], SRB['ISP ASL'])),
+                   np.concatenate((RF_engines['ISP VAC'], SRB['ISP VAC'])),
+                   np.concatenate((cost, srb_cost)),
+                   np.concatenate((RF_engines['Size'], SRB['Size'])) == 'Radial mounted',
+                   fuel_code,
+                   fuel_types,
+                   np.concatenate((built_in_fuel, SRB['Solid Fuel'])),
+                   np.concatenate((np.full(len(RF_engines), np.nan), SRB['Mass Empty'] / SRB['Mass Full'])))
+
+    @property
+    def fuel_type(self):
+        """
+        The fuel type name of every engine.
+        """
+        return np.array(self.fuel_types, dtype=str)[self.fuel_code]
+
+    def present_fuel_types(self):
+        """
+        Returns the fuel types of the engines in the catalog in order of first appearance.
+        """
+        codes, first = np.unique(self.fuel_code, return_index=True)
+        return [self.fuel_types[code] for code in codes[np.argsort(first)]]
+
+    def mask(self, fuel_type=None, allowed=None):
+        """
+        Returns a boolean mask of the engines that use fuel_type and are enabled in the allowed dict.
+        Either filter is skipped when it is None.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if fuel_type is not None:
+            if fuel_type not in self.fuel_types:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.fuel_code == self.fuel_types.index(fuel_type)
+        if allowed is not None:
+            enabled = [name for name, is_allowed in allowed.items() if is_allowed]
+            mask &= np.isin(self.name, enabled)
+        return mask
+
+    def filter(self, mask):
+        """
+        Returns a new catalog with the engines selected by a boolean mask or an index array.
+        """
+        columns = {column: getattr(self, column)[mask] for column in self.columns}
+        return EngineCatalog(fuel_types=self.fuel_types, **columns)
+
+    def to_engines(self) -> list:
+        """
+        Converts the catalog to a list of Engine and SRB_Engine objects.
+        """
+        engines = []
+        for i in range(len(self)):
+            args = (str(self.name[i]), self.mass[i], self.thrust_asl[i], self.thrust_vac[i], self.isp_asl[i],
+                    self.isp_vac[i], self.cost[i], bool(self.is_radial[i]), self.fuel_types[self.fuel_code[i]],
+                    self.built_in_fuel[i])
+            if self.fuel_types[self.fuel_code[i]] == 'SolidFuel':
+                engines.append(SRB_Engine(*args, self.empty_ratio[i]))
+            else:
+                engines.append(Engine(*args))
+        return engines
@@ -1,9 +1,7 @@
-import pandas as pd
 import os
 from Fuels import Fuels, FuelsKSP2
 import numpy as np
-from utils import pareto
-from matplotlib import pyplot as plt
+from utils import pareto, DATA_DIR
 
 
 class FuelTank:
@@ -32,9 +30,11 @@ class FuelTank:
     fuel_class = Fuels
 
     def __init__(self):
-        rf_tanks_df = pd.read_csv(os.path.join('data', self.RFTank_File), encoding="ISO-8859-1")
-        lf_tanks_df = pd.read_csv(os.path.join('data', self.LFTank_File), encoding="ISO-8859-1")
-        xenon_tanks_df = pd.read_csv(os.path.join('data', self.XenonTank_File), encoding="ISO-8859-1")
+        import pandas as pd
+
+        rf_tanks_df = pd.read_csv(os.path.join(DATA_DIR, self.RFTank_File), encoding="ISO-8859-1")
+        lf_tanks_df = pd.read_csv(os.path.join(DATA_DIR, self.LFTank_File), encoding="ISO-8859-1")
+        xenon_tanks_df = pd.read_csv(os.path.join(DATA_DIR, self.XenonTank_File), encoding="ISO-8859-1")
 
         cost_lfox_fuel = rf_tanks_df['Liquid Fuel'] * self.fuel_class.LF['Cost'] + rf_tanks_df['Oxidizer'] * \
                          self.fuel_class.OX['Cost']
@@ -64,7 +64,7 @@ class FuelTank:
             'cost_per_ton_structure': (cost_per_ton_structure[idx]).to_numpy(),
             'total_fuel_capacity': total_fuel_capacity.iloc[idx]}
 
-        SRB = pd.read_csv(os.path.join('data', 'SRB.csv'))
+        SRB = pd.read_csv(os.path.join(DATA_DIR, 'SRB.csv'))
         self.SolidFuel = {
             'percent_structure': SRB['Mass Empty'] / SRB['Mass Full'],
             'cost_per_ton_structure': [0],
@@ -83,7 +83,7 @@ class FuelTank:
         Returns:
         The indices of the dominant tanks sorted in ascending order by total fuel capacity.
         """
-        x = pd.concat((total_fuel_capacity, cost_per_ton_structure), axis=1).to_numpy()
+        x = np.stack((np.asarray(total_fuel_capacity), np.asarray(cost_per_ton_structure)), axis=1)
         idx = pareto(x, [1, 1])
         idx_sort = np.argsort(total_fuel_capacity[idx])
         return idx[idx_sort]
@@ -105,13 +105,26 @@ class FuelTank:
         fuels_lst = ['LF', 'LFOX', 'Xenon']
         if fuel_type in fuels_lst:
             idx = np.searchsorted(getattr(self, fuel_type)['total_fuel_capacity'], total_fuel_capacity)
-            bounded_idx = np.min((idx, np.full_like(idx, len(getattr(self, fuel_type)['total_fuel_capacity'])-1)))
+            bounded_idx = np.minimum(idx, len(getattr(self, fuel_type)['total_fuel_capacity']) - 1)
             return getattr(self, fuel_type)['cost_per_ton_structure'][bounded_idx]
         if fuel_type == 'SolidFuel':
             return 0
         else:
             raise NotImplementedError('The fuel type you requested does not exist')
 
+    def cost_table(self, fuel_type):
+        """
+        Returns the tank capacities and costs per ton of structure behind best_cost_per_ton_structure, so that it
+        equals costs[min(searchsorted(capacities, total_fuel_capacity), len(costs) - 1)]. Used by compiled kernels
+        that can't call back into this class.
+        """
+        if fuel_type in ['LF', 'LFOX', 'Xenon']:
+            return (np.asarray(getattr(self, fuel_type)['total_fuel_capacity'], dtype=float),
+                    np.asarray(getattr(self, fuel_type)['cost_per_ton_structure'], dtype=float))
+        if fuel_type == 'SolidFuel':
+            return np.array([np.inf]), np.zeros(1)
+        raise NotImplementedError('The fuel type you requested does not exist')
+
 class FuelTankKSP2(FuelTank):
 
     RFTank_File = 'RFTanks_KSP2.csv'
@@ -123,8 +136,9 @@ class FuelTankKSP2(FuelTank):
 
     def __init__(self):
         super().__init__()
+        import pandas as pd
 
-        hydrogen_tanks_df = pd.read_csv(os.path.join('data', self.HydrogenTank_File), encoding="ISO-8859-1")
+        hydrogen_tanks_df = pd.read_csv(os.path.join(DATA_DIR, self.HydrogenTank_File), encoding="ISO-8859-1")
 
         cost_h2_fuel = hydrogen_tanks_df['Hydrogen'] * self.fuel_class.LF['Cost']
         cost_per_ton_structure = (hydrogen_tanks_df['Cost Full'] - cost_h2_fuel) / hydrogen_tanks_df['Mass Empty']
@@ -138,3 +152,6 @@ class FuelTankKSP2(FuelTank):
     def best_cost_per_ton_structure(self, total_fuel_capacity, fuel_type):
         return 0
 
+    def cost_table(self, fuel_type):
+        return np.array([np.inf]), np.zeros(1)
+
@@ -0,0 +1,211 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+
+class MapCache:
+    """
+    Persistent, content-addressed cache of optimized DV-PL maps.
+
+    Every map is stored as an uncompressed .npz file whose name is a hash of everything the map depends on: the stage
+    class, the sweep parameters and the engine catalog, tanks and fuels the class solves with. The key is computed
+    from the built catalogs rather than from allowed_engines or the data/*.csv files, so it always describes the
+    inputs the map is solved from, and a toggled engine or an edited CSV file changes the key as soon as the catalogs
+    have been rebuilt, see RocketStage.reload_catalogs. The least recently used files are evicted once the cache
+    grows beyond max_bytes. The scalar_keys a map carries, like the n_pruned of optimize_map, are stored with it.
+
+    Attributes:
+    -----------
+    directory: str
+        The directory the .npz files are stored in.
+    max_bytes: int
+        The maximum total size of the cache in bytes.
+    """
+    FORMAT_VERSION = 3
+    array_keys = ['pl', 'dv', 'min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']
+    list_keys = ['engines', 'quant_engines']
+    scalar_keys = ['n_pruned', 'n_evaluated']
+
+    def __init__(self, directory='cache', max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, stage_class, **params):
+        """
+        Computes the cache key of a map.
+
+        Args:
+            stage_class (type): The RocketStage subclass the map is computed with.
+            **params: The sweep parameters, e.g. pl_span, dv_span, span, max_eng_quant, asl_or_vac and TWR_req.
+
+        Returns:
+            str: A hex digest identifying the map.
+        """
+        description = {'format': self.FORMAT_VERSION,
+                       'stage_class': stage_class.__module__ + '.' + stage_class.__qualname__,
+                       'catalog': self.hash_catalog(stage_class),
+                       'params': {name: np.asarray(value).tolist() for name, value in params.items()}}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def hash_catalog(cls, stage_class):
+        """
+        Hashes every engine row of the catalog of stage_class and the tank and fuel data of their fuel types.
+        """
+        rows = cls.catalog_rows(stage_class)
+        description = {'engines': rows, 'fuel_data': cls.fuel_data(stage_class, [row['fuel_type'] for row in rows])}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def catalog_rows(stage_class, names=None):
+        """
+        Returns the catalog rows of the engines called names, or of every engine, as dicts of plain values.
+        """
+        catalog = stage_class.catalog
+        indices = range(len(catalog)) if names is None else \
+            [int(np.flatnonzero(catalog.name == name)[0]) for name in names]
+        rows = []
+        for i in indices:
+            row = {column: getattr(catalog, column)[i].item() for column in catalog.columns if column != 'fuel_code'}
+            row['fuel_type'] = catalog.fuel_types[catalog.fuel_code[i]]
+            rows.append(row)
+        return rows
+
+    @classmethod
+    def fuel_data(cls, stage_class, fuel_types):
+        """
+        Returns the tank and fuel data stage_class solves each of fuel_types with.
+        """
+        return {fuel_type: {'tanks': cls.to_lists(getattr(stage_class.tanks, fuel_type, None)),
+                            'fuel': getattr(stage_class.fuels, fuel_type, None)}
+                for fuel_type in fuel_types}
+
+    @staticmethod
+    def to_lists(value):
+        if isinstance(value, dict):
+            return {name: np.asarray(item).tolist() for name, item in value.items()}
+        return value
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        """
+        Loads a map from the cache and marks it as recently used.
+
+        Returns:
+            dict: The map in the format of RocketStage.optimize_map, or None on a cache miss.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                maps = {name: data[name] for name in self.array_keys}
+                maps.update({name: data[name].tolist() for name in self.list_keys})
+                # Only the maps of some methods carry each scalar
+                maps.update({name: data[name].item() for name in self.scalar_keys if name in data.files})
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process after it was read
+            pass
+        return maps
+
+    def save(self, key, maps):
+        """
+        Stores a map in the cache and evicts the least recently used maps if the cache is too large.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # Every writer gets its own temporary file, so processes that save the same key don't write into each other
+        f = tempfile.NamedTemporaryFile(dir=self.directory, prefix=key, suffix='.tmp', delete=False)
+        try:
+            with f:
+                np.savez(f, **{name: maps[name] for name in self.array_keys + self.list_keys +
+                               [name for name in self.scalar_keys if name in maps]})
+            os.replace(f.name, self.path(key))
+        except BaseException:
+            if os.path.exists(f.name):
+                os.remove(f.name)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used maps until the cache fits in max_bytes. Other processes can evict the same
+        files at the same time, files that are already gone are skipped.
+        """
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class SliceCache(MapCache):
+    """
+    Persistent cache of map slices, the minimum mass and cost over the configurations built from one set of catalog
+    engines, see RocketStage.optimize_map_sliced.
+
+    The key of a slice covers the catalog rows of its engines and the tank and fuel data of their fuel types, but not
+    the rest of the catalog. Toggling an engine in allowed_engines or editing one row of an engine CSV file therefore
+    only misses the slices of that engine, once the catalogs have been rebuilt with RocketStage.reload_catalogs.
+
+    Attributes:
+    -----------
+    hits, misses: int
+        The number of slices loaded from the cache and not found in it.
+    """
+    FORMAT_VERSION = 1
+    array_keys = ['min_mtot', 'min_mtot_pos', 'min_costs', 'min_costs_pos']
+    list_keys = []
+    scalar_keys = []
+
+    def __init__(self, directory=os.path.join('cache', 'slices'), max_bytes=2 ** 30):
+        super().__init__(directory, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, stage_class, engines, labels, **params):
+        """
+        Computes the cache key of a slice.
+
+        Args:
+            stage_class (type): The RocketStage subclass the slice is computed with.
+            engines (tuple): The names of the catalog engines of the slice, see RocketStage.column_engines.
+            labels (list): The (engine, count) labels of the configurations of the slice, in column order.
+            **params: The sweep parameters, e.g. pl_span, dv_span, span, max_eng_quant, asl_or_vac and TWR_req.
+
+        Returns:
+            str: A hex digest identifying the slice.
+        """
+        rows = self.catalog_rows(stage_class, engines)
+        description = {'format': self.FORMAT_VERSION,
+                       'stage_class': stage_class.__module__ + '.' + stage_class.__qualname__,
+                       'engines': rows,
+                       'fuel_data': self.fuel_data(stage_class, [row['fuel_type'] for row in rows]),
+                       'labels': labels,
+                       'params': {name: np.asarray(value).tolist() for name, value in params.items()}}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load(self, key):
+        maps = super().load(key)
+        if maps is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return maps
@@ -0,0 +1,178 @@
+import json
+import numpy as np
+
+
+class StageMap:
+    """
+    Compact form of an optimize_map result for archiving and for passing maps between processes.
+
+    The winners are stored as uint16 configuration indices, with NONE where no configuration is feasible, and are
+    resolved through two lookup tables: the engine name index and the engine count of every configuration. The
+    minimum mass and cost planes are optional and stored as float32. A float64 map of span x span points takes 32
+    bytes per point, a StageMap 4 bytes without and 12 bytes with the planes.
+
+    Accuracy: float32 keeps 24 bits of mantissa, so a stored plane is within a relative error of 6e-8 of the map it
+    was built from. Solving the physics itself in float32 (optimize_map(..., precision='float32')) was compared
+    against the float64 path on 120 x 120 to 1000 x 1000 grids of LinearStage and LinearStageKSP2 (asl and vac, 1 and
+    3 engines, TWR_req 1.0 and 1.2): where both pick the same winner, the minimum masses and costs agree within a
+    relative error of 1e-6. At most 2e-6 of the points, which lie within float32 rounding of the TWR requirement,
+    pick a different winner; there the mass can jump to the next feasible configuration, or the point can turn
+    feasible or infeasible. Use accuracy() to compare a map against a float64 reference.
+
+    Attributes:
+    -----------
+    pl, dv: numpy.ndarray
+        The float64 grid axes.
+    mass_winner, cost_winner: numpy.ndarray
+        The uint16 index of the minimum mass and minimum cost configuration of every point, indexed [dv, pl].
+    min_mtot, min_costs: numpy.ndarray
+        The float32 minimum mass and cost of every point, np.inf where infeasible, or None if they were not kept.
+    engine_names: numpy.ndarray
+        The distinct engine names.
+    engine_index: numpy.ndarray
+        The uint16 index into engine_names of every configuration.
+    engine_count: numpy.ndarray
+        The uint16 engine count of every configuration.
+    params: dict
+        The JSON serializable sweep parameters the map was solved with.
+    """
+    NONE = np.iinfo(np.uint16).max
+
+    def __init__(self, pl, dv, mass_winner, cost_winner, engine_names, engine_index, engine_count, min_mtot=None,
+                 min_costs=None, params=None):
+        self.pl = np.asarray(pl, dtype=float)
+        self.dv = np.asarray(dv, dtype=float)
+        self.mass_winner = np.asarray(mass_winner, dtype=np.uint16)
+        self.cost_winner = np.asarray(cost_winner, dtype=np.uint16)
+        self.engine_names = np.asarray(engine_names, dtype=str)
+        self.engine_index = np.asarray(engine_index, dtype=np.uint16)
+        self.engine_count = np.asarray(engine_count, dtype=np.uint16)
+        self.min_mtot = None if min_mtot is None else np.asarray(min_mtot, dtype=np.float32)
+        self.min_costs = None if min_costs is None else np.asarray(min_costs, dtype=np.float32)
+        self.params = params or {}
+
+    @classmethod
+    def from_map(cls, maps, planes=True, params=None):
+        """
+        Builds a StageMap from the result of RocketStage.optimize_map.
+
+        Args:
+            maps (dict): The map, see RocketStage.optimize_map.
+            planes (bool): Keep the minimum mass and cost planes as float32.
+            params (dict): The sweep parameters to store with the map.
+        """
+        if len(maps['engines']) >= cls.NONE:
+            raise ValueError(f'A StageMap holds at most {cls.NONE - 1} configurations, the map has '
+                             f'{len(maps["engines"])}')
+        engine_names, engine_index = np.unique(np.asarray(maps['engines'], dtype=str), return_inverse=True)
+        winners = [np.where(maps[name] < 0, cls.NONE, maps[name]).astype(np.uint16)
+                   for name in ('min_mtot_idx', 'min_costs_idx')]
+        return cls(maps['pl'], maps['dv'], *winners, engine_names, engine_index, maps['quant_engines'],
+                   min_mtot=maps['min_mtot'] if planes else None, min_costs=maps['min_costs'] if planes else None,
+                   params=params)
+
+    def winner(self, min_type='mass'):
+        """
+        Returns the uint16 winner map of min_type, 'mass' or 'cost'.
+        """
+        if min_type not in ('mass', 'cost'):
+            raise ValueError("min_type must be 'mass' or 'cost'")
+        return self.mass_winner if min_type == 'mass' else self.cost_winner
+
+    def lookup(self, min_type='mass'):
+        """
+        Resolves the winners of min_type through the lookup tables.
+
+        Returns:
+            tuple: The engine name of every point, '' where infeasible, and the engine count, 0 where infeasible.
+        """
+        winner = self.winner(min_type)
+        feasible = winner != self.NONE
+        # Every infeasible point looks up configuration 0 and is then blanked
+        configuration = np.where(feasible, winner, 0)
+        names = np.where(feasible, self.engine_names[self.engine_index[configuration]], '')
+        counts = np.where(feasible, self.engine_count[configuration], 0)
+        return names, counts
+
+    def indices(self, min_type='mass'):
+        """
+        Returns the winners of min_type as configuration indices of optimize_map, -1 where infeasible.
+        """
+        winner = self.winner(min_type)
+        return np.where(winner == self.NONE, -1, winner.astype(np.intp))
+
+    def to_map(self):
+        """
+        Expands the StageMap into the format of RocketStage.optimize_map, with float64 planes and -1 for no winner.
+        Without planes the minimum mass and cost are None.
+        """
+        return {'pl': self.pl,
+                'dv': self.dv,
+                'min_mtot': None if self.min_mtot is None else self.min_mtot.astype(float),
+                'min_mtot_idx': self.indices('mass'),
+                'min_costs': None if self.min_costs is None else self.min_costs.astype(float),
+                'min_costs_idx': self.indices('cost'),
+                'engines': self.engine_names[self.engine_index].tolist(),
+                'quant_engines': self.engine_count.tolist()}
+
+    def accuracy(self, reference):
+        """
+        Compares this map against a reference map, e.g. a float32 solve against the float64 one.
+
+        Args:
+            reference (StageMap or dict): The reference, as a StageMap or an optimize_map result. The planes of
+                an optimize_map result are compared at their full precision.
+
+        Returns:
+            dict: For 'mass' and 'cost', the largest relative error of the plane over the points where both pick
+            the same winner ('max_relative_error', None without planes), and the fraction of points that differ in
+            feasibility ('feasibility_mismatch') and in the winning configuration ('winner_mismatch').
+        """
+        if isinstance(reference, StageMap):
+            reference = reference.to_map()
+        result = {}
+        for min_type, plane in [('mass', 'min_mtot'), ('cost', 'min_costs')]:
+            winner, reference_winner = self.indices(min_type), reference[plane + '_idx']
+            feasible, reference_feasible = winner >= 0, reference_winner >= 0
+            max_relative_error = None
+            if getattr(self, plane) is not None and reference[plane] is not None:
+                # A different winner is counted by winner_mismatch, its value can differ by much more
+                both = feasible & (winner == reference_winner)
+                value = getattr(self, plane)[both].astype(float)
+                reference_value = np.asarray(reference[plane], dtype=float)[both]
+                # Zero costs, e.g. of KSP2 parts, only count when they are not matched exactly
+                error = np.abs(value - reference_value)
+                scale = np.where(reference_value == 0, 1, np.abs(reference_value))
+                max_relative_error = float(np.max(error / scale)) if error.size else 0.0
+            result[min_type] = {'max_relative_error': max_relative_error,
+                                'feasibility_mismatch': float(np.mean(feasible != reference_feasible)),
+                                'winner_mismatch': float(np.mean(winner != reference_winner))}
+        return result
+
+    @property
+    def nbytes(self):
+        arrays = [self.pl, self.dv, self.mass_winner, self.cost_winner, self.engine_names, self.engine_index,
+                  self.engine_count, self.min_mtot, self.min_costs]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def save(self, path):
+        """
+        Writes the map to a compressed .npz file.
+        """
+        arrays = {'pl': self.pl, 'dv': self.dv, 'mass_winner': self.mass_winner, 'cost_winner': self.cost_winner,
+                  'engine_names': self.engine_names, 'engine_index': self.engine_index,
+                  'engine_count': self.engine_count, 'params': np.array(json.dumps(self.params))}
+        for name in ('min_mtot', 'min_costs'):
+            if getattr(self, name) is not None:
+                arrays[name] = getattr(self, name)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a map written by save.
+        """
+        with np.load(path) as data:
+            planes = {name: data[name] for name in ('min_mtot', 'min_costs') if name in data}
+            return cls(data['pl'], data['dv'], data['mass_winner'], data['cost_winner'], data['engine_names'],
+                       data['engine_index'], data['engine_count'], params=json.loads(data['params'].item()), **planes)
@@ -1,17 +1,253 @@
 from Stages.RocketStage import RocketStage
 import numpy as np
+from profiling import phase, nbytes
 
 
 class AsparagusStage(RocketStage):
+    """
+    An asparagus staged booster: a core unit surrounded by pairs of identical side units.
+
+    Every unit is one engine on top of one fuel tank of the same size. All engines ignite together and the fuel is
+    crossfed from the outside in, so the outermost pairs drain first and are dropped, tank and engine, once they are
+    empty. Pairs can also be dropped in groups, e.g. three pairs can be dropped one at a time (2, 2, 2, 1), the outer
+    two together (4, 2, 1), the outer one first (2, 4, 1) or all at once (6, 1). The number of engines of each drop
+    group, ending with the core, is stored in num_engines_array.
+
+    max_eng_quant is the maximum number of side pairs. Radial engines and solid fuel boosters are skipped, they can't
+    be the core of an asparagus stack or crossfeed their fuel.
+    """
+    # The relative tolerance of the tank mass found by the root search
+    rtol = 1e-10
+    plot_filename = 'Asparagus_Rocket_Plot.png'
 
     def __init__(self, mass, engine, num_engines_array, cost, dv, fuel):
         super().__init__(mass, engine, np.sum(num_engines_array), cost, 'Asparagus', dv, fuel)
         self.num_engines_array = num_engines_array
 
+    @staticmethod
+    def drop_sequences(num_pairs):
+        """
+        Returns every way to drop num_pairs pairs in groups, as tuples of the number of pairs per group from the
+        outside in. These are the compositions of num_pairs, e.g. (1, 1), (2,) for two pairs.
+        """
+        if num_pairs == 0:
+            return [()]
+        return [(first,) + rest for first in range(1, num_pairs + 1)
+                for rest in AsparagusStage.drop_sequences(num_pairs - first)]
+
+    @classmethod
+    def asparagus_fuel_types(cls):
+        """
+        Returns the fuel types that can be crossfed, in the column order of the optimization.
+        """
+        return [eng_type for eng_type in cls.fuel_types() if eng_type != 'SolidFuel']
+
+    @classmethod
+    def engine_columns(cls, eng_type, max_eng_quant):
+        """
+        engine_columns returns the EngineCatalog of the inline engines of one fuel type and the num_engines_array of
+        every (engine, drop sequence) column. Columns are ordered sequence-major: every engine with the first drop
+        sequence, then every engine with the second one, etc. Sequences are ordered by the number of pairs.
+        """
+        catalog = cls.catalog
+        engines = catalog.filter(catalog.mask(fuel_type=eng_type) & ~catalog.is_radial)
+        sequences = [sequence for num_pairs in range(1, max_eng_quant + 1)
+                     for sequence in cls.drop_sequences(num_pairs)]
+        num_engines_arrays = [[2 * pairs for pairs in sequence] + [1]
+                              for sequence in sequences for _ in range(len(engines))]
+        return engines, num_engines_arrays
+
+    @classmethod
+    def configuration_labels(cls, max_eng_quant):
+        """
+        configuration_labels returns the engine name, including the drop sequence, and the total engine count of
+        every column of an optimization.
+        """
+        all_engines = []
+        all_quant_engines = []
+        for eng_type in cls.asparagus_fuel_types():
+            engines, num_engines_arrays = cls.engine_columns(eng_type, max_eng_quant)
+            names = np.tile(engines.name, len(num_engines_arrays) // max(len(engines), 1))
+            for name, num_engines_array in zip(names, num_engines_arrays):
+                all_engines.append(name + ' (' + '+'.join(str(n) for n in num_engines_array) + ')')
+                all_quant_engines.append(int(np.sum(num_engines_array)))
+        return all_engines, all_quant_engines
+
+    @classmethod
+    def column_engines(cls, max_eng_quant):
+        """
+        column_engines returns the engine of every column, the core and the side units use the same engine.
+        """
+        column_engines = []
+        for eng_type in cls.asparagus_fuel_types():
+            engines, num_engines_arrays = cls.engine_columns(eng_type, max_eng_quant)
+            names = np.tile(engines.name, len(num_engines_arrays) // max(len(engines), 1))
+            column_engines.extend((name,) for name in names)
+        return column_engines
+
+    @classmethod
+    def num_engines_arrays(cls, max_eng_quant):
+        """
+        Returns the num_engines_array of every column of an optimization.
+        """
+        return [num_engines_array for eng_type in cls.asparagus_fuel_types()
+                for num_engines_array in cls.engine_columns(eng_type, max_eng_quant)[1]]
+
+    @classmethod
+    def engine_arrays(cls, eng_type, max_eng_quant, asl_or_vac):
+        """
+        engine_arrays returns the per-unit engine arrays of every column with shape [1, 1, n_columns] and the drop
+        groups with shape [n_groups, 1, 1, n_columns]. groups holds the number of units dropped at each drop from the
+        outside in, padded with 0 for sequences with fewer drops. The core is not part of groups.
+        """
+        engines, num_engines_arrays = cls.engine_columns(eng_type, max_eng_quant)
+        num_columns = len(num_engines_arrays)
+        repeats = num_columns // max(len(engines), 1)
+
+        isp_asl, isp_vac, T_asl, T_vac, eng_mass, eng_cost = \
+            [np.reshape(np.tile(array, repeats), [1, 1, num_columns]) for array in
+             (engines.isp_asl, engines.isp_vac, engines.thrust_asl, engines.thrust_vac, engines.mass, engines.cost)]
+        isp = cls.flight_condition(asl_or_vac, isp_asl, isp_vac)
+        T = cls.flight_condition(asl_or_vac, T_asl, T_vac)
+
+        groups = np.zeros([max_eng_quant, 1, 1, num_columns])
+        for column, num_engines_array in enumerate(num_engines_arrays):
+            groups[:len(num_engines_array) - 1, 0, 0, column] = num_engines_array[:-1]
+        num_units = np.sum(groups, axis=0) + 1
+        return isp, T, eng_mass, eng_cost, groups, num_units
+
+    @classmethod
+    def _configuration_blocks(cls, dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_req, columns=None,
+                              with_twr=False):
+        offset = 0
+        for eng_type in cls.asparagus_fuel_types():
+            n_columns = len(cls.engine_columns(eng_type, max_eng_quant)[1])
+            local_columns = None
+            if columns is not None:
+                local_columns = columns[(columns >= offset) & (columns < offset + n_columns)] - offset
+            offset += n_columns
+            if n_columns == 0 or local_columns is not None and len(local_columns) == 0:
+                continue
+            m_tot, costs, fuel_units, TWR_min = cls.solve_fuel_type(dv_array, pl_array, eng_type, max_eng_quant,
+                                                                    asl_or_vac, TWR_req, columns=local_columns)
+            yield (m_tot, costs, fuel_units, TWR_min) if with_twr else (m_tot, costs, fuel_units)
+
+    @classmethod
+    def stage_dv(cls, m100, pl_array, isp, eng_mass, groups, num_units, empty_fraction):
+        """
+        Computes the delta-v of asparagus stacks with a tank mass of m100 per unit.
+
+        Returns:
+            tuple: The delta-v and the list of (mass, number of units) at the start of every burn phase.
+        """
+        fuel = m100 * (1 - empty_fraction)
+        dry = m100 * empty_fraction + eng_mass
+        mass = pl_array + num_units * (eng_mass + m100)
+        units = num_units
+        log_ratio = 0
+        phases = []
+        for group in groups:
+            phases.append((mass, units))
+            # The group's fuel feeds every engine, then its tanks and engines are dropped
+            log_ratio = log_ratio + np.log(mass / (mass - group * fuel))
+            mass = mass - group * (fuel + dry)
+            units = units - group
+        phases.append((mass, units))
+        log_ratio = log_ratio + np.log(mass / (mass - fuel))
+        return isp * cls.g * log_ratio, phases
+
+    @classmethod
+    def _log_dv_residual(cls, log_m100, empty_fraction, dv, pl, isp, eng_mass, num_units, *groups):
+        return cls.stage_dv(np.exp(log_m100), pl, isp, eng_mass, groups, num_units, empty_fraction)[0] - dv
+
+    @classmethod
+    def solve_fuel_type(cls, dv_array, pl_array, eng_type, max_eng_quant, asl_or_vac, TWR_req, columns=None):
+        """
+        Sizes the unit tanks of every (engine, drop sequence) column of one fuel type.
+
+        The delta-v of a stack grows monotonically with the tank mass per unit, so the tank mass is found by a
+        bracketed root search on its logarithm for every cell and column at once. The bracket comes from two bounds: the stack
+        is at least as good as one linear stage with the same engines and tanks, and at most as good as an ideal
+        stage that only carries the payload and the core engine to burnout. See RocketStage.solve_increasing.
+
+        Args:
+            dv_array (numpy.ndarray): Delta-v values with a trailing axis of length 1.
+            pl_array (numpy.ndarray): Payload values that broadcast against dv_array.
+            columns (numpy.ndarray): Only solve these columns of the fuel type. None solves every column.
+
+        Returns:
+            tuple: m_tot, costs, fuel_units and TWR_min, the lowest thrust to weight ratio of all burn phases. m_tot
+            and costs are np.inf where the configuration is infeasible.
+        """
+        with phase('setup_physics_arrays', fuel_type=eng_type):
+            isp, T, eng_mass, eng_cost, groups, num_units = cls.engine_arrays(eng_type, max_eng_quant, asl_or_vac)
+            if columns is not None:
+                isp, T, eng_mass, eng_cost, groups, num_units = [array[..., columns] for array in
+                                                                 (isp, T, eng_mass, eng_cost, groups, num_units)]
+            empty_fraction = cls.get_best_empty_fraction(eng_type, max_eng_quant, None)
+
+        with phase('rocket_equation', fuel_type=eng_type) as p:
+            exp = np.exp(dv_array / (isp * cls.g))
+            # Linear stage with all units: m100 = (PL + mass_engines) * (exp - 1) / (units * (1 - f * exp))
+            with np.errstate(divide='ignore'):
+                upper = np.where(empty_fraction * exp < 1,
+                                 (pl_array + num_units * eng_mass) * (exp - 1) /
+                                 (num_units * (1 - empty_fraction * exp)), np.inf)
+            upper = np.where(np.isfinite(upper), upper, 1e4 * (pl_array + num_units * eng_mass))
+            # Ideal stage: m0 >= (PL + mass_core_engine) * exp
+            lower = ((pl_array + eng_mass) * exp - pl_array) / num_units - eng_mass
+            lower = np.maximum(lower, upper * 1e-9)
+
+            feasible = cls.stage_dv(upper, pl_array, isp, eng_mass, groups, num_units, empty_fraction)[0] >= dv_array
+            # Infeasible brackets are closed so they are not refined
+            log_upper = np.log(upper)
+            log_lower = np.where(feasible, np.log(lower), log_upper)
+            shape = log_upper.shape
+            args = [np.broadcast_to(array, shape).ravel() for array in
+                    (dv_array, pl_array, isp, eng_mass, num_units) + tuple(groups)]
+            # The upper end of the bracket always reaches the requested delta-v
+            log_m100 = cls.solve_increasing(cls._log_dv_residual, log_lower.ravel(), log_upper.ravel(),
+                                            (empty_fraction,) + tuple(args), rtol=cls.rtol)
+            m100 = np.reshape(np.exp(log_m100), shape)
+            p.update(cells=int(m100.size), nbytes=nbytes(exp, upper, lower, m100))
+
+        with phase('tank_cost', fuel_type=eng_type):
+            ms = m100 * empty_fraction
+            mf = m100 - ms
+            unit_fuel_units = mf / cls.fuels.get_fuel_data(eng_type, 'Density')
+            fuel_units = num_units * unit_fuel_units
+            costs = num_units * (ms * cls.tanks.best_cost_per_ton_structure(unit_fuel_units, eng_type) + eng_cost +
+                                 mf * cls.fuels.get_fuel_data(eng_type, 'Cost'))
+
+        with phase('feasibility', fuel_type=eng_type):
+            m_tot = pl_array + num_units * (eng_mass + m100)
+            phases = cls.stage_dv(m100, pl_array, isp, eng_mass, groups, num_units, empty_fraction)[1]
+            TWR_min = np.min([units * T / (mass * 9.8) for mass, units in phases], axis=0)
+
+            infeasible = ~feasible | (TWR_min < TWR_req)
+            m_tot[infeasible] = np.inf
+            costs[infeasible] = np.inf
+
+        return m_tot, costs, fuel_units, TWR_min
+
     @classmethod
-    def optimize_point(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type):
-        pass
+    def optimize_points(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type='mass', chunk_size=4096,
+                        columns=None):
+        """
+        See RocketStage.optimize_points. The points also hold 'num_engines_arrays', the num_engines_array of each
+        configuration index.
+        """
+        points = super().optimize_points(pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type=min_type,
+                                         chunk_size=chunk_size, columns=columns)
+        points['num_engines_arrays'] = cls.num_engines_arrays(max_eng_quant)
+        return points
 
     @classmethod
-    def optimize_plot(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req):
-        pass
+    def point_to_stage(cls, points, i, j):
+        """
+        Builds the AsparagusStage of entry j of the optimize_points arrays, see RocketStage.point_to_stage.
+        """
+        # The labels include the drop sequence, the stages keep the plain engine name
+        idx = points['engine_idx'][j]
+        return cls(points['mass'][j], points['engines'][idx].rsplit(' (', 1)[0], points['num_engines_arrays'][idx],
+                   points['cost'][j], points['dv'][i], points['fuel'][j])
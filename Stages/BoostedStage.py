@@ -0,0 +1,310 @@
+from Stages.RocketStage import RocketStage
+from Stages.LinearStage import LinearStage
+import numpy as np
+from profiling import phase
+
+
+class BoostedStage(LinearStage):
+    """
+    A liquid core stage with radial solid rocket boosters.
+
+    The search covers every LinearStage configuration plus every combination of a liquid core (engine and count, as
+    in LinearStage) with N boosters of one SRB type, for N in booster_counts. The boosters are used full and burn
+    together with the core until they are empty. They are then dropped and the core burns the rest of its fuel:
+
+    - Phase 1 lasts the booster burn time. The thrust is the sum of the core and booster thrust, and the specific
+      impulse is the thrust weighted specific impulse of both.
+    - Phase 2 is the core alone.
+
+    The core tank has to hold at least the fuel the core burns in phase 1. The TWR requirement is checked at the
+    start of both phases.
+
+    Most combinations can't win anywhere, so they are pruned per grid cell before their tank is sized: a lower bound
+    on the total mass follows from the rocket equation with the best specific impulse of the combination and from its
+    fixed masses, and a lower bound on the cost from the fixed costs and the cheapest possible core tank of that mass. A
+    combination is skipped where the mass bound already breaks the TWR requirement, or where both bounds exceed the
+    best configuration of the cell found so far, starting with the LinearStage configurations. The number of pruned and
+    evaluated candidates is recorded on the 'booster_search' phase of an active profiling.Profiler.
+    """
+    booster_counts = (2, 3, 4, 6, 8)
+    # The relative tolerance of the core tank mass found by the root search
+    rtol = 1e-10
+    # The root search can't reach rtol in single precision, and there is no fused kernel for the boosted columns
+    precisions = ('float64',)
+    backends = ('numpy',)
+
+    def __init__(self, mass, engine, num_engines, cost, dv, fuel, booster=None, num_boosters=0):
+        super().__init__(mass, engine, num_engines, cost, dv, fuel)
+        self.type = 'Boosted'
+        self.booster = booster
+        self.num_boosters = num_boosters
+
+    def toString(self, print_header=True):
+        """
+        toString Prints out the stage to a string, with the boosters after the core engine
+        """
+        label = RocketStage(self.mass, self.engine + ' + ' + str(self.num_boosters) + ' X ' + str(self.booster),
+                            self.num_engines, self.cost, self.type, self.dv, self.fuel)
+        label.toString(print_header)
+
+    @classmethod
+    def core_fuel_types(cls):
+        return [eng_type for eng_type in cls.fuel_types() if eng_type != 'SolidFuel']
+
+    @classmethod
+    def booster_blocks(cls, max_eng_quant):
+        """
+        Returns (eng_type, booster_index, num_boosters, n_columns) for every block of boosted columns, in column
+        order. booster_index indexes the SolidFuel engines of the catalog.
+        """
+        num_srbs = np.count_nonzero(cls.catalog.mask(fuel_type='SolidFuel'))
+        blocks = []
+        for eng_type in cls.core_fuel_types():
+            n_columns = len(cls.engine_columns(eng_type, max_eng_quant)[1])
+            for booster in range(num_srbs):
+                for num_boosters in cls.booster_counts:
+                    blocks.append((eng_type, booster, num_boosters, n_columns))
+        return blocks
+
+    @classmethod
+    def configuration_labels(cls, max_eng_quant):
+        """
+        configuration_labels returns the LinearStage labels followed by the labels of every boosted column, where
+        the engine name includes the boosters, e.g. 'Mainsail + 4 X Kickback'.
+        """
+        all_engines, all_quant_engines = super().configuration_labels(max_eng_quant)
+        srbs = cls.catalog.filter(cls.catalog.mask(fuel_type='SolidFuel'))
+        for eng_type, booster, num_boosters, n_columns in cls.booster_blocks(max_eng_quant):
+            engines, num_engines = cls.engine_columns(eng_type, max_eng_quant)
+            suffix = ' + ' + str(num_boosters) + ' X ' + srbs.name[booster]
+            all_engines.extend(name + suffix for name in np.tile(engines.name, max_eng_quant))
+            all_quant_engines.extend(num_engines)
+        return all_engines, all_quant_engines
+
+    @classmethod
+    def prune_columns(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req):
+        """
+        Solves every configuration. The LinearStage dominance does not cover the boosted columns, and the bounds of
+        the booster search already prune them per grid cell.
+        """
+        return None
+
+    @classmethod
+    def column_engines(cls, max_eng_quant):
+        """
+        column_engines returns the core engine of every LinearStage column and the core engine and booster of every
+        boosted column.
+        """
+        column_engines = [(name,) for name in super().configuration_labels(max_eng_quant)[0]]
+        srbs = cls.catalog.filter(cls.catalog.mask(fuel_type='SolidFuel'))
+        for eng_type, booster, num_boosters, n_columns in cls.booster_blocks(max_eng_quant):
+            engines = cls.engine_columns(eng_type, max_eng_quant)[0]
+            column_engines.extend((name, srbs.name[booster]) for name in np.tile(engines.name, max_eng_quant))
+        return column_engines
+
+    @classmethod
+    def booster_arrays(cls, booster, num_boosters, asl_or_vac):
+        """
+        Returns the total thrust, specific impulse, full mass, empty mass, fuel mass, fuel units, full cost and burn
+        time of num_boosters boosters of the booster_index booster.
+        """
+        srbs = cls.catalog.filter(cls.catalog.mask(fuel_type='SolidFuel'))
+        # Shaped like the engine arrays, so an array of pressures adds the same leading axis
+        isp, T = [cls.flight_condition(asl_or_vac, np.reshape(asl[booster], [1, 1, 1]),
+                                       np.reshape(vac[booster], [1, 1, 1]))
+                  for asl, vac in [(srbs.isp_asl, srbs.isp_vac), (srbs.thrust_asl, srbs.thrust_vac)]]
+        fuel_units = srbs.built_in_fuel[booster]
+        fuel_mass = fuel_units * cls.fuels.get_fuel_data('SolidFuel', 'Density')
+        cost = srbs.cost[booster] + fuel_units * cls.fuels.get_fuel_data('SolidFuel', 'Cost')
+        burn_time = fuel_mass * isp * cls.g / T
+        return (num_boosters * T, isp, num_boosters * (srbs.mass[booster] + fuel_mass),
+                num_boosters * srbs.mass[booster], num_boosters * fuel_mass, num_boosters * fuel_units,
+                num_boosters * cost, burn_time)
+
+    @classmethod
+    def _configuration_blocks(cls, dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_req, columns=None,
+                              with_twr=False):
+        shape = np.broadcast_shapes(dv_array.shape, pl_array.shape)[:-1] + (1,)
+        # The best LinearStage mass and cost of every cell, only known when every LinearStage column is solved
+        incumbent_mtot = np.full(shape, np.inf)
+        incumbent_costs = np.full(shape, np.inf)
+        n_linear = len(super().configuration_labels(max_eng_quant)[0])
+        linear_columns = None
+        if columns is not None:
+            linear_columns = columns[columns < n_linear]
+            incumbent_mtot = incumbent_costs = None
+        if linear_columns is None or len(linear_columns):
+            for block in super()._configuration_blocks(dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_req,
+                                                       columns=linear_columns, with_twr=with_twr):
+                if incumbent_mtot is not None:
+                    incumbent_mtot = np.minimum(incumbent_mtot, np.min(block[0], axis=-1, keepdims=True))
+                    incumbent_costs = np.minimum(incumbent_costs, np.min(block[1], axis=-1, keepdims=True))
+                yield block
+
+        offset = n_linear
+        for eng_type, booster, num_boosters, n_columns in cls.booster_blocks(max_eng_quant):
+            local_columns = None
+            if columns is not None:
+                local_columns = columns[(columns >= offset) & (columns < offset + n_columns)] - offset
+            offset += n_columns
+            if n_columns == 0 or local_columns is not None and len(local_columns) == 0:
+                continue
+            m_tot, costs, fuel_units, TWR_min = cls.solve_boosted(dv_array, pl_array, eng_type, booster, num_boosters,
+                                                                  max_eng_quant, asl_or_vac, TWR_req,
+                                                                  incumbent_mtot, incumbent_costs,
+                                                                  columns=local_columns)
+            if incumbent_mtot is not None:
+                incumbent_mtot = np.minimum(incumbent_mtot, np.min(m_tot, axis=-1, keepdims=True))
+                incumbent_costs = np.minimum(incumbent_costs, np.min(costs, axis=-1, keepdims=True))
+            yield (m_tot, costs, fuel_units, TWR_min) if with_twr else (m_tot, costs, fuel_units)
+
+    @classmethod
+    def solve_boosted(cls, dv_array, pl_array, eng_type, booster, num_boosters, max_eng_quant, asl_or_vac, TWR_req,
+                      incumbent_mtot=None, incumbent_costs=None, columns=None):
+        """
+        Sizes the core tank of every core column of one fuel type combined with num_boosters boosters.
+
+        Args:
+            dv_array (numpy.ndarray): Delta-v values with a trailing axis of length 1.
+            pl_array (numpy.ndarray): Payload values that broadcast against dv_array.
+            incumbent_mtot (numpy.ndarray): The best mass of every cell found so far, used for pruning. None
+                disables the pruning against the incumbent.
+            incumbent_costs (numpy.ndarray): The best cost of every cell found so far.
+            columns (numpy.ndarray): Only solve these core columns of the fuel type. None solves every column.
+
+        Returns:
+            tuple: m_tot, costs, fuel_units and TWR_min arrays with the broadcast shape of dv_array and pl_array and
+            n_columns along the last axis. fuel_units only counts the core fuel. m_tot and costs are np.inf where
+            the combination is infeasible or pruned.
+        """
+        isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
+            cls.engine_arrays(eng_type, max_eng_quant, asl_or_vac)
+        if columns is not None:
+            isp, T, eng_mass, eng_cost = [array[..., columns] for array in (isp, T, eng_mass, eng_cost)]
+        empty_fraction = cls.get_best_empty_fraction(eng_type, max_eng_quant, num_engines)
+        T_b, isp_b, mass_full_b, mass_empty_b, fuel_mass_b, fuel_units_b, cost_b, burn_time = \
+            cls.booster_arrays(booster, num_boosters, asl_or_vac)
+
+        # The core has to hold the fuel it burns next to the boosters
+        core_fuel_1 = burn_time * T / (isp * cls.g)
+        m100_min = core_fuel_1 / (1 - empty_fraction)
+        fixed_mass = eng_mass + mass_full_b
+
+        shape = np.broadcast_shapes(dv_array.shape, pl_array.shape, isp.shape)
+        m_tot = np.full(shape, np.inf)
+        costs = np.full(shape, np.inf)
+        fuel_units = np.full(shape, np.inf)
+        TWR_min = np.zeros(shape)
+        with phase('booster_search', fuel_type=eng_type, num_boosters=num_boosters) as p:
+            # Lower bounds of the total mass: the rocket equation with the best specific impulse down to the payload
+            # and the core engines, and the fixed masses with the smallest possible core tank
+            isp_max = np.maximum(isp, isp_b)
+            lower_mtot = np.maximum((pl_array + eng_mass) * np.exp(dv_array / (isp_max * cls.g)),
+                                    pl_array + fixed_mass + m100_min)
+            candidate = (T + T_b) / (lower_mtot * 9.8) >= TWR_req
+            if incumbent_mtot is not None:
+                # Every ton of core tank costs at least its fuel and the cheapest tank structure that
+                # best_cost_per_ton_structure prices it with below, see FuelTank.cost_table
+                cost_per_ton = (1 - empty_fraction) * cls.fuels.get_fuel_data(eng_type, 'Cost') + \
+                    empty_fraction * np.min(cls.tanks.cost_table(eng_type)[1])
+                lower_costs = eng_cost + cost_b + (lower_mtot - pl_array - fixed_mass) * cost_per_ton
+                candidate &= (lower_mtot <= incumbent_mtot) | (lower_costs <= incumbent_costs)
+            candidate = np.broadcast_to(candidate, shape)
+            p.update(pruned=int(candidate.size - np.count_nonzero(candidate)),
+                     evaluated=int(np.count_nonzero(candidate)))
+            if not candidate.any():
+                return m_tot, costs, fuel_units, TWR_min
+
+            # The booster thrust and specific impulse vary along the pressure axis of a pressure sweep
+            dv, pl, isp_c, T_c, mass_c, cost_c, m100_lower, core_fuel, T_b, isp_b = \
+                [np.broadcast_to(array, shape)[candidate] for array in
+                 (dv_array, pl_array, isp, T, eng_mass, eng_cost, m100_min, core_fuel_1, T_b, isp_b)]
+            TWR = np.broadcast_to(TWR_req, shape)[candidate]
+            terms = (pl, isp_c, T_c, mass_c, T_b, isp_b, mass_full_b, mass_empty_b, fuel_mass_b, core_fuel,
+                     empty_fraction)
+
+            m100_upper = 1e4 * (pl + mass_c + mass_full_b)
+            log_lower = np.log(m100_lower)
+            log_upper = np.log(m100_upper)
+            feasible = cls.boosted_dv(m100_upper, *terms)[0] >= dv
+            # The smallest core tank can already be enough
+            done = cls.boosted_dv(m100_lower, *terms)[0] >= dv
+            feasible |= done
+            # Closed brackets are not refined: the smallest tank is enough, or no tank is
+            log_upper = np.where(done | ~feasible, log_lower, log_upper)
+            m100 = np.exp(cls.solve_increasing(cls._log_dv_residual, log_lower, log_upper, (dv,) + terms,
+                                               rtol=cls.rtol))
+
+            TWR_start = cls.boosted_dv(m100, *terms)[1]
+            ms = m100 * empty_fraction
+            mf = m100 - ms
+            core_fuel_units = mf / cls.fuels.get_fuel_data(eng_type, 'Density')
+            candidate_costs = ms * cls.tanks.best_cost_per_ton_structure(core_fuel_units, eng_type) + cost_c + \
+                mf * cls.fuels.get_fuel_data(eng_type, 'Cost') + cost_b
+            candidate_mtot = pl + mass_c + mass_full_b + m100
+            feasible &= TWR_start >= TWR
+
+            m_tot[candidate] = np.where(feasible, candidate_mtot, np.inf)
+            costs[candidate] = np.where(feasible, candidate_costs, np.inf)
+            fuel_units[candidate] = core_fuel_units
+            TWR_min[candidate] = TWR_start
+        return m_tot, costs, fuel_units, TWR_min
+
+    @classmethod
+    def _log_dv_residual(cls, log_m100, dv, *terms):
+        return cls.boosted_dv(np.exp(log_m100), *terms)[0] - dv
+
+    @classmethod
+    def boosted_dv(cls, m100, pl, isp_c, T_c, mass_c, T_b, isp_b, mass_full_b, mass_empty_b, fuel_mass_b, core_fuel,
+                   empty_fraction):
+        """
+        Computes the delta-v of a boosted stage with a core tank of mass m100, and the lower of the thrust to weight
+        ratios at the start of the two phases.
+        """
+        m0 = pl + mass_c + m100 + mass_full_b
+        # Phase 1: the core and the boosters burn together for the booster burn time
+        isp_1 = (T_c + T_b) / (T_c / isp_c + T_b / isp_b)
+        m1 = m0 - fuel_mass_b - core_fuel
+        # Phase 2: the empty boosters are dropped and the core burns the rest of its fuel
+        m2 = m1 - mass_empty_b
+        m3 = m2 - (m100 * (1 - empty_fraction) - core_fuel)
+        dv = isp_1 * cls.g * np.log(m0 / m1) + isp_c * cls.g * np.log(m2 / m3)
+        TWR = np.minimum((T_c + T_b) / (m0 * 9.8), T_c / (m2 * 9.8))
+        return dv, TWR
+
+    @classmethod
+    def optimize_points(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type='mass', chunk_size=4096,
+                        columns=None):
+        """
+        See RocketStage.optimize_points. The points also hold 'boosters' and 'num_boosters', the booster name and
+        count of each configuration index, with None and 0 for the LinearStage configurations.
+
+        The pruning against the incumbent only keeps the minimum mass and the minimum cost, a booster configuration
+        that is heavier and more expensive than these can still be part of a Pareto set. min_type='cost' therefore
+        solves every configuration.
+        """
+        if min_type == 'cost' and columns is None:
+            columns = np.arange(len(cls.configuration_labels(max_eng_quant)[0]))
+        points = super().optimize_points(pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type=min_type,
+                                         chunk_size=chunk_size, columns=columns)
+        srbs = cls.catalog.filter(cls.catalog.mask(fuel_type='SolidFuel'))
+        points['boosters'] = [None] * len(super().configuration_labels(max_eng_quant)[0])
+        points['num_boosters'] = [0] * len(points['boosters'])
+        for eng_type, booster, num_boosters, n_columns in cls.booster_blocks(max_eng_quant):
+            points['boosters'].extend([str(srbs.name[booster])] * n_columns)
+            points['num_boosters'].extend([num_boosters] * n_columns)
+        return points
+
+    @classmethod
+    def point_to_stage(cls, points, i, j):
+        """
+        Builds the stage of entry j of the optimize_points arrays. LinearStage configurations become LinearStage
+        objects and combinations with boosters BoostedStage objects.
+        """
+        idx = points['engine_idx'][j]
+        if points['boosters'][idx] is None:
+            return LinearStage(points['mass'][j], points['engines'][idx], points['num_engines'][j], points['cost'][j],
+                               points['dv'][i], points['fuel'][j])
+        return cls(points['mass'][j], points['engines'][idx].split(' + ')[0], points['num_engines'][j],
+                   points['cost'][j], points['dv'][i], points['fuel'][j], points['boosters'][idx],
+                   points['num_boosters'][idx])
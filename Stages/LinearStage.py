@@ -1,76 +1,83 @@
 from Stages.RocketStage import RocketStage
 import numpy as np
 from Fuels import FuelsKSP2
-from utils import pareto
+from profiling import phase, nbytes
 from Engine import KSP2_Engine
-from utils import get_allow_engines_KSP2
+from utils import get_allow_engines_KSP2, LazyCatalog
 from FuelTank import FuelTankKSP2
 
 
 class LinearStage(RocketStage):
+    # The rocket equation is solved in closed form, so it can run in single precision and in a fused kernel
+    precisions = ('float64', 'float32')
+    backends = ('numpy', 'numba')
 
     def __init__(self, mass, engine, num_engines, cost, dv, fuel):
         super().__init__(mass, engine, num_engines, cost, 'Linear', dv, fuel)
 
     @classmethod
-    def optimize_point(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type):
-        stages = cls.optimize_plot([pl, pl], [dv, dv], 1, max_eng_quant, asl_or_vac, TWR_req,
-                                   plot=False, min_type=min_type)
-        return stages
+    def _configuration_blocks(cls, dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_req, columns=None,
+                              with_twr=False):
+        offset = 0
+        for eng_type in cls.fuel_types():
+            n_columns = len(cls.engine_columns(eng_type, max_eng_quant)[1])
+            local_columns = None
+            if columns is not None:
+                local_columns = columns[(columns >= offset) & (columns < offset + n_columns)] - offset
+            offset += n_columns
+            if local_columns is not None and len(local_columns) == 0:
+                continue
+            m_tot, costs, fuel_units, TWR0 = cls.solve_fuel_type(dv_array, pl_array, eng_type, max_eng_quant,
+                                                                 asl_or_vac, TWR_req, columns=local_columns)
+            yield (m_tot, costs, fuel_units, TWR0) if with_twr else (m_tot, costs, fuel_units)
 
     @classmethod
-    def get_best_empty_fraction(cls, eng_type, max_eng_quant, num_engines):
-        if eng_type == 'SolidFuel':
-            best_empty_fraction = [eng.empty_ratio for eng in cls.engines if eng.fuel_type == eng_type]
-            best_empty_fraction = np.tile(best_empty_fraction, max_eng_quant)
-            best_empty_fraction = np.reshape(best_empty_fraction, [1, 1, len(num_engines)])
-        else:
-            best_empty_fraction = cls.tanks.__getattribute__(eng_type)['percent_structure']
-        return best_empty_fraction
-
-    @classmethod
-    def optimize_plot(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, plot=True, min_type='mass',
-                      filename='Optimal_Rocket_Plot.png'):
-        """
-        Optimizes a rocket stage for a given sweep of points
-
-        Plots:
-            Plot of Engine indicies that are labeled for each engine type
+    def solve_fuel_type(cls, dv_array, pl_array, eng_type, max_eng_quant, asl_or_vac, TWR_req, columns=None):
         """
-        pl = np.logspace(np.log10(pl_span[0]), np.log10(pl_span[1]), span)
-        dv = np.linspace(dv_span[0], dv_span[1], span)
+        Solves the rocket equation for every (engine, count) column of one fuel type.
 
-        # Group engines by fuel type
-        unique_eng_types = set([eng.fuel_type for eng in cls.engines])
+        Args:
+            dv_array (numpy.ndarray): Delta-v values with a trailing axis of length 1, e.g. shape (n_dv, 1, 1) for a
+                grid or (n_points, 1, 1) for scattered points.
+            pl_array (numpy.ndarray): Payload values that broadcast against dv_array, e.g. shape (1, n_pl, 1).
+            columns (numpy.ndarray): Only solve these columns of the fuel type. None solves every column.
 
-        all_engines = []
-        all_quant_engines = []
-        all_mfs = np.empty([span, span, 0])
-
-        all_mtot = np.empty([span, span, 0])
-        all_costs = np.empty([span, span, 0])
-
-        for eng_type in unique_eng_types:
-            dv_array, pl_array, isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
-                cls.setup_physics_arrays(dv, pl, eng_type, max_eng_quant, asl_or_vac)
+        Returns:
+            tuple: m_tot, costs, fuel_units and TWR0 arrays with the broadcast shape of dv_array and pl_array and
+            n_columns along the last axis. m_tot and costs are np.inf where the configuration is infeasible.
+        """
+        with phase('setup_physics_arrays', fuel_type=eng_type):
+            isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
+                cls.engine_arrays(eng_type, max_eng_quant, asl_or_vac)
 
             best_empty_fraction = cls.get_best_empty_fraction(eng_type, max_eng_quant, num_engines)
-
-            # Solve the rocket equation for the total mass of fuel tanks m100
-            # Δv = ISP * g * ln(m0 / m1)
-            # Given:
-            # m100 = mass_structure + mass_fuel
-            # ms = mass_structure = m100 * empty_fraction
-            # m0  = mass_PL + mass_engines + mass_structure + mass_fuel = mass_PL + mass_engines + m100
-            # m1 = mass_PL + mass_engines + ms = mass_PL + mass_engines + m100 * empty_fraction
-            #                 Δv
-            # exp =  e ^ _____________
-            #              (isp * g)
-            #
-            #          (PL + mass_engine) * (1 - exp)
-            # m100 = _________________________________
-            #             empty_fraction * exp - 1
-
+            if columns is not None:
+                isp, T, eng_mass, eng_cost, built_in_fuel = [array[..., columns] for array in
+                                                             (isp, T, eng_mass, eng_cost, built_in_fuel)]
+                if np.ndim(best_empty_fraction):
+                    best_empty_fraction = best_empty_fraction[..., columns]
+            # The physics runs in the precision of the grid, float32 grids are not promoted by the float64 catalogs
+            dtype = np.result_type(dv_array, pl_array)
+            isp, T, eng_mass, eng_cost, built_in_fuel, best_empty_fraction = \
+                [np.asarray(array, dtype=dtype) for array in (isp, T, eng_mass, eng_cost, built_in_fuel,
+                                                              best_empty_fraction)]
+
+        # Solve the rocket equation for the total mass of fuel tanks m100
+        # Δv = ISP * g * ln(m0 / m1)
+        # Given:
+        # m100 = mass_structure + mass_fuel
+        # ms = mass_structure = m100 * empty_fraction
+        # m0  = mass_PL + mass_engines + mass_structure + mass_fuel = mass_PL + mass_engines + m100
+        # m1 = mass_PL + mass_engines + ms = mass_PL + mass_engines + m100 * empty_fraction
+        #                 Δv
+        # exp =  e ^ _____________
+        #              (isp * g)
+        #
+        #          (PL + mass_engine) * (1 - exp)
+        # m100 = _________________________________
+        #             empty_fraction * exp - 1
+
+        with phase('rocket_equation', fuel_type=eng_type) as p:
             exp = np.exp(dv_array / (isp * cls.g))
             # Calculate M100 which is the Structure + fuel
             m100 = (pl_array + eng_mass) * (1 - exp) / (best_empty_fraction * exp - 1)
@@ -80,62 +87,176 @@ class LinearStage(RocketStage):
             # Calculate Mf which is the mass of fuel
             mf = m100 - ms
             fuel_units = mf / cls.fuels.get_fuel_data(eng_type, 'Density')
-            costs = ms * cls.tanks.best_cost_per_ton_structure(fuel_units, eng_type) + eng_cost + \
-                    mf * cls.fuels.get_fuel_data(eng_type, 'Cost')
+            p.update(cells=int(m100.size), nbytes=nbytes(exp, m100, ms, mf, fuel_units))
+
+        with phase('tank_cost', fuel_type=eng_type):
+            cost_per_ton_structure = np.asarray(cls.tanks.best_cost_per_ton_structure(fuel_units, eng_type),
+                                                dtype=dtype)
+            costs = ms * cost_per_ton_structure + eng_cost + mf * cls.fuels.get_fuel_data(eng_type, 'Cost')
+
+        with phase('feasibility', fuel_type=eng_type):
             # Calculate m_tot which is the Structure + fuel + PL + engine masses
             m_tot = m100 + pl_array + eng_mass
             TWR0 = T / (m_tot * 9.8)
 
-            all_engines.extend(eng_name)
-            all_quant_engines.extend(num_engines)
+            infeasible = (m100 <= 0) | (TWR0 < TWR_req)
+            if eng_type == 'SolidFuel':
+                infeasible |= built_in_fuel < fuel_units
+            m_tot[infeasible] = np.inf
+            costs[infeasible] = np.inf
 
-            m_tot[m100 <= 0] = np.inf
-            costs[m100 <= 0] = np.inf
+        return m_tot, costs, fuel_units, TWR0
 
-            m_tot[TWR0 < TWR_req] = np.inf
-            costs[TWR0 < TWR_req] = np.inf
+    @classmethod
+    def fused_columns(cls, max_eng_quant, asl_or_vac):
+        """
+        Returns the per-configuration arguments of kernels.reduce_linear, from isp to tank_cost, for every column in
+        the order of configuration_labels.
+        """
+        names = ['isp', 'T', 'eng_mass', 'eng_cost', 'built_in_fuel', 'check_built_in_fuel', 'empty_fraction',
+                 'density', 'fuel_cost', 'table_start', 'table_stop']
+        parts = {name: [] for name in names}
+        tank_capacity, tank_cost = [], []
+        table_size = 0
+        for eng_type in cls.fuel_types():
+            isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
+                cls.engine_arrays(eng_type, max_eng_quant, asl_or_vac)
+            capacity, cost = cls.tanks.cost_table(eng_type)
+            values = [isp, T, eng_mass, eng_cost, built_in_fuel, eng_type == 'SolidFuel',
+                      cls.get_best_empty_fraction(eng_type, max_eng_quant, num_engines),
+                      cls.fuels.get_fuel_data(eng_type, 'Density'), cls.fuels.get_fuel_data(eng_type, 'Cost'),
+                      table_size, table_size + len(capacity)]
+            for name, value in zip(names, values):
+                parts[name].append(np.broadcast_to(np.reshape(value, -1), len(num_engines)))
+            tank_capacity.append(capacity)
+            tank_cost.append(cost)
+            table_size += len(capacity)
+
+        dtypes = {'check_built_in_fuel': bool, 'table_start': np.intp, 'table_stop': np.intp}
+        columns = [np.concatenate(parts[name]).astype(dtypes.get(name, float)) for name in names]
+        return (*columns, np.concatenate(tank_capacity), np.concatenate(tank_cost))
 
-            if eng_type == 'SolidFuel':
-                m_tot[built_in_fuel < fuel_units] = np.inf
-                costs[built_in_fuel < fuel_units] = np.inf
-
-            all_mtot = np.concatenate((all_mtot, m_tot), axis=2)
-            all_costs = np.concatenate((all_costs, costs), axis=2)
-            all_mfs = np.concatenate((all_mfs, fuel_units), axis=2)
-
-        if plot:
-            min_mtot = np.min(all_mtot, axis=2)
-            min_costs = np.min(all_costs, axis=2)
-
-            min_mtot_idx = np.argmin(all_mtot, axis=2)
-            min_costs_idx = np.argmin(all_costs, axis=2)
-
-            min_mtot_idx[min_mtot == np.inf] = -1
-            min_costs_idx[min_costs_idx == np.inf] = -1
-
-            if min_type == 'mass':
-                cls.plotDVPLDiagram(min_mtot_idx, all_engines, all_quant_engines, pl, dv, filename, asl_or_vac, TWR_req)
-            else:
-                cls.plotDVPLDiagram(min_costs_idx, all_engines, all_quant_engines, pl, dv, filename, asl_or_vac, TWR_req)
-
-        elif span == 1:
-            if min_type == 'mass':
-                idx = [np.argmin(all_mtot)]
-            elif min_type == 'cost':
-                idx = pareto(np.concatenate((all_costs[0, :, :], all_mtot[0, :, :]), axis=0).T, [-1, -1])
-            else:
-                raise NotImplementedError("Optimization is only implemented for mass or cost")
-            stages = [None] * len(idx)
-            for i in range(len(idx)):
-                stages[i] = cls(all_mtot[0, 0, idx[i]], all_engines[idx[i]], all_quant_engines[idx[i]],
-                                all_costs[0, 0, idx[i]], dv[0], all_mfs[0, 0, idx[i]])
-            return stages
-        else:
-            raise NotImplementedError("Multi-span pareto optimization is currently not supported")
+    @classmethod
+    def _reduce_tile_fused(cls, dv, pl, max_eng_quant, asl_or_vac, TWR_req, columns=None):
+        import kernels
+        shape = (len(dv), len(pl))
+        min_mtot = np.full(shape, np.inf)
+        min_costs = np.full(shape, np.inf)
+        min_mtot_idx = np.zeros(shape, dtype=np.intp)
+        min_costs_idx = np.zeros(shape, dtype=np.intp)
+        *per_column, tank_capacity, tank_cost = cls.fused_columns(max_eng_quant, asl_or_vac)
+        if columns is not None:
+            per_column = [array[columns] for array in per_column]
+        with phase('tile_fused', cells=len(dv) * len(pl)):
+            kernels.reduce_linear(np.asarray(dv, dtype=float), np.asarray(pl, dtype=float), float(TWR_req),
+                                  float(cls.g), *per_column, tank_capacity, tank_cost, min_mtot, min_mtot_idx,
+                                  min_costs, min_costs_idx)
+        if columns is not None and len(columns):
+            min_mtot_idx = columns[min_mtot_idx]
+            min_costs_idx = columns[min_costs_idx]
+        return min_mtot, min_mtot_idx, min_costs, min_costs_idx
+
+    @classmethod
+    def prune_columns(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, margin=1e-9):
+        """
+        Finds the configurations that can win somewhere in a grid, from the engine catalog and the grid bounds.
+
+        A configuration is dropped when it is infeasible even at the lowest delta-v and payload of the grid, where the
+        TWR and the fuel an SRB has to hold are the most favourable. It is also dropped when another configuration of
+        the same fuel type A has at least its specific impulse and thrust, at most its engine mass and cost, the same
+        empty fraction and, for SRBs, at least its built-in fuel. Then A needs less tank mass at every grid point,
+        so it is at least as light and as cheap wherever the dropped configuration is feasible. To keep the winner of
+        every point, including its index on ties, A must come first in column order or be lighter and cheaper by a
+        relative margin, and the tank mass of both must either be computed from equal inputs or differ by a margin,
+        so rounding can't reverse their order. Fuel types whose tank cost per ton falls with the fuel amount only
+        get the infeasibility test.
+
+        Args:
+            pl (numpy.ndarray): The payload axis of the grid.
+            dv (numpy.ndarray): The delta-v axis of the grid.
+            margin (float): The relative difference that rounding can't cancel.
+
+        Returns:
+            numpy.ndarray: The sorted indices of the configurations to solve.
+        """
+        pl_min, pl_max, dv_min = float(np.min(pl)), float(np.max(pl)), float(np.min(dv))
+        keep = []
+        offset = 0
+        with phase('prune_columns') as p:
+            for eng_type in cls.fuel_types():
+                isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
+                    cls.engine_arrays(eng_type, max_eng_quant, asl_or_vac)
+                n = len(num_engines)
+                isp, T, eng_mass, eng_cost, built_in_fuel = [np.reshape(array, -1).astype(float) for array in
+                                                             (isp, T, eng_mass, eng_cost, built_in_fuel)]
+                best_empty_fraction = np.broadcast_to(
+                    np.reshape(cls.get_best_empty_fraction(eng_type, max_eng_quant, num_engines), -1), n)
+                density = cls.fuels.get_fuel_data(eng_type, 'Density')
+                is_solid = eng_type == 'SolidFuel'
+
+                # The most favourable grid point for TWR, tank mass and SRB fuel is (dv_min, pl_min)
+                exp = np.exp(dv_min / (isp * cls.g))
+                with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                    m100 = (pl_min + eng_mass) * (1 - exp) / (best_empty_fraction * exp - 1)
+                    TWR0 = T / ((m100 + pl_min + eng_mass) * 9.8)
+                    fuel_units = (m100 - m100 * best_empty_fraction) / density
+                solvable = best_empty_fraction * exp < 1 - margin
+                hopeless = (best_empty_fraction * exp >= 1 + margin) | \
+                           (solvable & (TWR0 < TWR_req * (1 - margin))) | \
+                           (solvable & is_solid & (fuel_units > built_in_fuel * (1 + margin)))
+
+                # dominated[a, b] is True where configuration a beats b everywhere, including ties
+                column = np.arange(n)
+                weak = (isp[:, None] >= isp) & (T[:, None] >= T) & (eng_mass[:, None] <= eng_mass) & \
+                       (eng_cost[:, None] <= eng_cost) & (best_empty_fraction[:, None] == best_empty_fraction)
+                if is_solid:
+                    weak &= built_in_fuel[:, None] >= built_in_fuel
+                equal_tank = (isp[:, None] == isp) & (eng_mass[:, None] == eng_mass)
+                lighter = eng_mass - eng_mass[:, None] >= margin * (pl_max + eng_mass)
+                # exp - 1 loses relative precision at small delta-v, so the ISP gap has to cover it too
+                with np.errstate(divide='ignore'):
+                    isp_gap = margin + 1e-14 * isp * cls.g / dv_min
+                separate_tank = (isp[:, None] >= isp * (1 + isp_gap)) | lighter
+                cheaper = (eng_cost - eng_cost[:, None] >= margin * eng_cost) & (eng_cost > 0)
+                dominated = weak & (((column[:, None] < column) & (equal_tank | separate_tank)) | (lighter & cheaper))
+                np.fill_diagonal(dominated, False)
+                if np.any(np.diff(cls.tanks.cost_table(eng_type)[1]) < 0):
+                    dominated[:] = False
+
+                keep.append(offset + np.flatnonzero(~hopeless & ~np.any(dominated, axis=0)))
+                offset += n
+            keep = np.concatenate(keep) if keep else np.zeros(0, dtype=np.intp)
+            p.update(columns=offset, pruned=offset - len(keep))
+        return keep
 
     @classmethod
     def _forward_data_generator(cls, eng, flight_cond, pl_array, m100_array, n_eng_max):
+        isp, m0, m1, best_empty_fraction, pl_array, m100_array = \
+            cls._forward_terms(eng, flight_cond, pl_array, m100_array, n_eng_max)
+        dv_array = isp * 9.8 * np.log(m0 / m1)
+
+        return dv_array, pl_array, m100_array
+
+    @classmethod
+    def _forward_derivative(cls, eng, flight_cond, pl_array, m100_array, n_eng_max):
+        # d(Δv)/d(m100) = ISP * g * (1 / m0 - empty_fraction / m1)
+        isp, m0, m1, best_empty_fraction, pl_array, m100_array = \
+            cls._forward_terms(eng, flight_cond, pl_array, m100_array, n_eng_max)
+        return isp * 9.8 * (1 / m0 - best_empty_fraction / m1)
+
+    @classmethod
+    def _forward_dv_limit(cls, eng, flight_cond, n_eng_max):
+        # Δv approaches ISP * g * ln(1 / empty_fraction) as m100 grows without bound
+        isp, m0, m1, best_empty_fraction, pl_array, m100_array = \
+            cls._forward_terms(eng, flight_cond, np.ones([1, 1]), np.ones([1, 1]), n_eng_max)
+        return isp * 9.8 * np.log(1 / best_empty_fraction) * np.ones([1, 1, n_eng_max])
 
+    @classmethod
+    def _forward_terms(cls, eng, flight_cond, pl_array, m100_array, n_eng_max):
+        """
+        _forward_terms returns the ISP, m0, m1 and empty fraction of the forward rocket equation, along with the pl
+        and m100 arrays expanded to one column per engine count.
+        """
         num_eng = np.arange(1, n_eng_max + 1)
 
         if m100_array.ndim < 3:
@@ -154,16 +275,14 @@ class LinearStage(RocketStage):
         m0 = pl_array + num_eng_in * eng.mass + m100_array
         if flight_cond == 'asl':
             isp = eng.isp_asl
-            T = eng.thrust_asl
         else:
             isp = eng.isp_vac
-            T = eng.thrust_vac
-        dv_array = isp * 9.8 * np.log(m0 / m1)
-
-        return dv_array, pl_array, m100_array
+        return isp, m0, m1, best_empty_fraction, pl_array, m100_array
 
 
 class LinearStageKSP2(LinearStage):
-    tanks = FuelTankKSP2()
-    engines = KSP2_Engine.setupEngines(get_allow_engines_KSP2())
+    tanks = LazyCatalog(lambda cls: FuelTankKSP2())
+    allowed_engines = get_allow_engines_KSP2()
+    catalog = LazyCatalog(lambda cls: KSP2_Engine.catalog(cls.allowed_engines))
+    engines = LazyCatalog(lambda cls: cls.catalog.to_engines())
     fuels = FuelsKSP2
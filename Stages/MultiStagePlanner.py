@@ -0,0 +1,128 @@
+from Stages.LinearStage import LinearStage
+import numpy as np
+from utils import pareto
+
+
+class RocketPlan:
+    """
+    A partial or complete rocket built up from the payload downwards.
+
+    Attributes:
+        stages (list): The optimized RocketStage objects, top (payload side) stage first.
+        mass (float): The total mass of the rocket including the payload in tons.
+        cost (float): The total cost of all stages in funds.
+    """
+
+    def __init__(self, stages, mass, cost):
+        self.stages = stages
+        self.mass = mass
+        self.cost = cost
+
+    def toString(self):
+        """
+        toString Prints out every stage of the plan followed by its totals
+        """
+        for i, stage in enumerate(self.stages):
+            stage.toString(print_header=i == 0)
+        print('Total Mass: {} Total Cost: {}'.format(np.round(self.mass, 3), np.round(self.cost)))
+
+
+class MultiStagePlanner:
+    """
+    Plans a multi-stage rocket by carrying a Pareto frontier of partial rockets from one stage to the next.
+
+    Every stage is optimized with the stage class' optimize_points in cost mode, which returns the (cost, mass)
+    frontier for the payload of every partial rocket in one batch. The total mass of each partial rocket becomes the
+    payload of the next stage. After every stage the candidates are reduced to their (mass, cost) Pareto frontier and
+    then thinned with epsilon-dominance, so the number of partial rockets stays small instead of growing
+    exponentially with the number of stages.
+
+    Example:
+        >>> planner = MultiStagePlanner(pl=5, epsilon=0.02)
+        >>> planner.add_stage(1500, 'vac', 0.5).add_stage(3400, 'asl', 1.5, max_eng_quant=3)
+        >>> plans = planner.optimize()
+    """
+
+    def __init__(self, pl, epsilon=0.01):
+        """
+        Args:
+            pl (float): The mass of the payload in tons.
+            epsilon (float): Relative tolerance for epsilon-dominance pruning. A partial rocket is dropped when another
+                one is no heavier and at most (1 + epsilon) times as expensive. Set to 0 to keep the exact frontier.
+        """
+        self.pl = pl
+        self.epsilon = epsilon
+        self.stages = []
+
+    def add_stage(self, dv, asl_or_vac, TWR_req, max_eng_quant=1, stage_class=LinearStage):
+        """
+        Adds a stage below the stages that have already been added. Stages are added from the payload downwards.
+
+        Args:
+            dv (float): The delta-v the stage has to provide in m/s.
+            asl_or_vac (str or float): 'asl' or 'vac', or the ambient pressure in atmospheres, the flight condition
+                the stage fires in. See RocketStage.flight_condition.
+            TWR_req (float): The minimum thrust to weight ratio at ignition of the stage.
+            max_eng_quant (int): The maximum number of engines the stage may use.
+            stage_class (type): The RocketStage subclass used to optimize the stage. It has to implement
+                optimize_points and points_to_stages.
+
+        Returns:
+            MultiStagePlanner: The planner itself so calls can be chained.
+        """
+        self.stages.append({'dv': dv,
+                            'asl_or_vac': asl_or_vac,
+                            'TWR_req': TWR_req,
+                            'max_eng_quant': max_eng_quant,
+                            'stage_class': stage_class})
+        return self
+
+    def optimize(self):
+        """
+        Optimizes all stages and returns the frontier of complete rockets.
+
+        Returns:
+            list: RocketPlan objects on the (mass, cost) frontier sorted by ascending mass. The list is empty if no
+            feasible rocket exists.
+        """
+        frontier = [RocketPlan([], self.pl, 0)]
+        for stage in self.stages:
+            # Solve the stage for the masses of every partial rocket on the frontier in one batch
+            stage_class = stage['stage_class']
+            masses = np.array([plan.mass for plan in frontier])
+            points = stage_class.optimize_points(masses, np.full(len(masses), stage['dv']), stage['max_eng_quant'],
+                                                 stage['asl_or_vac'], stage['TWR_req'], min_type='cost')
+            candidates = []
+            for i, plan in enumerate(frontier):
+                for option in stage_class.points_to_stages(points, i):
+                    candidates.append(RocketPlan(plan.stages + [option], option.mass, plan.cost + option.cost))
+            frontier = self.prune(candidates, self.epsilon)
+            if not frontier:
+                break
+        return frontier
+
+    @staticmethod
+    def prune(plans, epsilon):
+        """
+        Removes dominated and epsilon-dominated partial rockets.
+
+        Args:
+            plans (list): The candidate RocketPlan objects.
+            epsilon (float): Relative tolerance for epsilon-dominance.
+
+        Returns:
+            list: The surviving RocketPlan objects sorted by ascending mass.
+        """
+        if not plans:
+            return []
+        x = np.array([[plan.mass, plan.cost] for plan in plans])
+        idx = pareto(x, [-1, -1])
+        idx = idx[np.lexsort((x[idx, 1], x[idx, 0]))]
+
+        # Along the frontier the cost decreases as the mass increases, so the last plan kept is the lightest
+        # plan that can epsilon-dominate the next one.
+        kept = [idx[0]]
+        for i in idx[1:]:
+            if x[kept[-1], 1] > (1 + epsilon) * x[i, 1]:
+                kept.append(i)
+        return [plans[i] for i in kept]
@@ -1,19 +1,25 @@
+import inspect
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from FuelTank import FuelTank
 from Fuels import Fuels
 from Engine import Engine, KSP2_Engine
-from utils import get_allow_engines, rand_cmap, get_allow_engines_KSP2
-from sklearn.neighbors import NearestNeighbors
-from matplotlib import pyplot as plt
-from matplotlib.colors import ListedColormap
+from utils import get_allow_engines, rand_cmap, get_allow_engines_KSP2, LazyCatalog, region_label_points
+from frontier import pareto_mask_batched
+from profiling import phase
 
 
 class RocketStage:
     """
     RocketStage KSP Rocket Stage
     """
-    tanks = FuelTank()
-    engines = Engine.setupEngines(get_allow_engines())
+    # The catalogs are parsed from the data directory on first use, see utils.LazyCatalog
+    tanks = LazyCatalog(lambda cls: FuelTank())
+    allowed_engines = get_allow_engines()
+    catalog = LazyCatalog(lambda cls: Engine.catalog(cls.allowed_engines))
+    engines = LazyCatalog(lambda cls: cls.catalog.to_engines())
     fuels = Fuels
 
     '''
@@ -22,6 +28,14 @@ class RocketStage:
     engines_KSP2 = KSP2_Engine.setupEngines(get_allow_engines_KSP2())
     '''
     g = 9.8
+    # The number of grid points times pressures per tile of optimize_pressure_sweep
+    pressure_tile_cells = 2 ** 13
+    # The precisions optimize_map can solve the physics in, float32 needs a solver without a float64 root search
+    precisions = ('float64',)
+    # The backends optimize_map can solve the tiles with, see resolve_backend
+    backends = ('numpy',)
+    # The default file of optimize_plot
+    plot_filename = 'Optimal_Rocket_Plot.png'
 
     def __init__(self, mass, engine, num_engines, cost, stage_type, dv, fuel):
         self.mass = mass
@@ -46,13 +60,67 @@ class RocketStage:
         print(str2)
 
     @classmethod
-    def setup_physics_arrays(cls, dv, pl, eng_type, max_eng_quant, asl_or_vac):
+    def load_catalogs(cls):
         """
-        setup_physics_arrays sets up a multi-dimensional array to be used in the mathematical modeling of the engines.
+        load_catalogs builds the tank and engine catalogs of the class if they have not been built yet.
+        """
+        return cls.tanks, cls.catalog
+
+    @classmethod
+    def reload_catalogs(cls):
+        """
+        Drops the tank and engine catalogs of the class and its subclasses, so they are rebuilt from allowed_engines
+        and the data directory on next use. Call it after toggling an engine in allowed_engines or editing a CSV file.
+        """
+        classes = [cls]
+        for klass in classes:
+            classes.extend(klass.__subclasses__())
+        for klass in classes:
+            for name in ('tanks', 'catalog', 'engines'):
+                catalog = inspect.getattr_static(klass, name)
+                if isinstance(catalog, LazyCatalog):
+                    catalog.reload(klass)
+
+    @classmethod
+    def fuel_types(cls):
+        """
+        Returns the fuel types of the available engines in the order they first appear in the engine list.
+        This order fixes the column order of every optimization, so it must not depend on set ordering.
         """
-        engines = [eng for eng in cls.engines if eng.fuel_type == eng_type]
+        return cls.catalog.present_fuel_types()
+
+    @classmethod
+    def engine_columns(cls, eng_type, max_eng_quant):
+        """
+        engine_columns returns the EngineCatalog of one fuel type and the engine count of every (engine, count)
+        column. Columns are ordered count-major: every engine with one engine, then every engine with two engines, etc.
+        """
+        engines = cls.catalog.filter(cls.catalog.mask(fuel_type=eng_type))
         num_engines = cls.count_rep(max_eng_quant, len(engines))
 
+        is_radial = np.tile(engines.is_radial, max_eng_quant)
+
+        num_engines[np.where(is_radial & num_engines == 1)] = 2
+        return engines, num_engines
+
+    @classmethod
+    def configuration_labels(cls, max_eng_quant):
+        """
+        configuration_labels returns the engine name and engine count of every column of an optimization.
+        """
+        all_engines = []
+        all_quant_engines = []
+        for eng_type in cls.fuel_types():
+            engines, num_engines = cls.engine_columns(eng_type, max_eng_quant)
+            all_engines.extend(np.tile(engines.name, max_eng_quant))
+            all_quant_engines.extend(num_engines)
+        return all_engines, all_quant_engines
+
+    @classmethod
+    def setup_physics_arrays(cls, dv, pl, eng_type, max_eng_quant, asl_or_vac):
+        """
+        setup_physics_arrays sets up a multi-dimensional array to be used in the mathematical modeling of the engines.
+        """
         dv_array, pl_array = np.meshgrid(dv, pl, indexing='ij')
         dv_array = np.expand_dims(dv_array, 2)
         #dv_array = np.tile(dv_array, (1, 1, len(num_engines)))
@@ -60,41 +128,67 @@ class RocketStage:
         pl_array = np.expand_dims(pl_array, 2)
         #pl_array = np.tile(pl_array, (1, 1, len(num_engines)))
 
-        is_radial = [eng.is_radial for eng in engines]
-        is_radial = np.tile(is_radial, max_eng_quant)
+        isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
+            cls.engine_arrays(eng_type, max_eng_quant, asl_or_vac)
+        return dv_array, pl_array, isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel
 
-        num_engines[np.where(is_radial & num_engines == 1)] = 2
+    @classmethod
+    def engine_arrays(cls, eng_type, max_eng_quant, asl_or_vac):
+        """
+        engine_arrays returns the per-column engine arrays of setup_physics_arrays with shape [1, 1, n_columns], so
+        they broadcast against any dv/pl arrays that have a trailing axis of length 1. With an array of pressures as
+        asl_or_vac, isp and T get a leading pressure axis, see flight_condition.
+        """
+        engines, num_engines = cls.engine_columns(eng_type, max_eng_quant)
 
-        if asl_or_vac == 'asl':
-            isp = np.array([eng.isp_asl for eng in engines])
-            T = np.array([eng.thrust_asl for eng in engines])
-        elif asl_or_vac == 'vac':
-            isp = np.array([eng.isp_vac for eng in engines])
-            T = np.array([eng.thrust_vac for eng in engines])
-        else:
-            raise NotImplementedError('Other values for asl_or_vac have not been implemented')
-        isp = np.tile(isp, max_eng_quant)
-        isp = np.reshape(isp, [1, 1, len(num_engines)])
+        isp_asl, isp_vac = [np.reshape(np.tile(isp, max_eng_quant), [1, 1, len(num_engines)])
+                            for isp in (engines.isp_asl, engines.isp_vac)]
+        isp = cls.flight_condition(asl_or_vac, isp_asl, isp_vac)
 
-        T = np.tile(T, max_eng_quant) * num_engines
-        T = np.reshape(T, [1, 1, len(num_engines)])
+        T_asl, T_vac = [np.reshape(np.tile(T, max_eng_quant) * num_engines, [1, 1, len(num_engines)])
+                        for T in (engines.thrust_asl, engines.thrust_vac)]
+        T = cls.flight_condition(asl_or_vac, T_asl, T_vac)
 
-        eng_mass = [eng.mass for eng in engines]
-        eng_mass = np.tile(eng_mass, max_eng_quant) * num_engines
+        eng_mass = np.tile(engines.mass, max_eng_quant) * num_engines
         eng_mass = np.reshape(eng_mass, [1, 1, len(num_engines)])
 
-        eng_cost = [eng.cost for eng in engines]
-        eng_cost = np.tile(eng_cost, max_eng_quant) * num_engines
+        eng_cost = np.tile(engines.cost, max_eng_quant) * num_engines
         eng_cost = np.reshape(eng_cost, [1, 1, len(num_engines)])
 
-        eng_name = [eng.name for eng in engines]
-        eng_name = np.tile(eng_name, max_eng_quant)
+        eng_name = np.tile(engines.name, max_eng_quant)
 
-        built_in_fuel = [eng.built_in_fuel for eng in engines]
-        built_in_fuel = np.tile(built_in_fuel, max_eng_quant) * num_engines
+        built_in_fuel = np.tile(engines.built_in_fuel, max_eng_quant) * num_engines
         built_in_fuel = np.reshape(built_in_fuel, [1, 1, len(num_engines)])
 
-        return dv_array, pl_array, isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel
+        return isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel
+
+    @staticmethod
+    def flight_condition(asl_or_vac, asl, vac):
+        """
+        Selects or interpolates an engine property for a flight condition.
+
+        Args:
+            asl_or_vac (str, float or array_like): 'asl' or 'vac', or the ambient pressure in atmospheres, 0 in vacuum
+                and 1 at Kerbin sea level. Properties are interpolated linearly in the pressure, like the ISP and
+                thrust of most engines are between these two points. Higher pressures are not modelled.
+            asl (numpy.ndarray): The property at sea level.
+            vac (numpy.ndarray): The property in vacuum.
+
+        Returns:
+            numpy.ndarray: The property at the flight condition. An array of pressures adds its shape as leading axes,
+            e.g. [n_pressures, 1, 1, n_columns] for [1, 1, n_columns] properties.
+        """
+        if isinstance(asl_or_vac, str):
+            if asl_or_vac == 'asl':
+                return asl
+            if asl_or_vac == 'vac':
+                return vac
+            raise NotImplementedError('Other values for asl_or_vac have not been implemented')
+        pressure = np.asarray(asl_or_vac, dtype=float)
+        if np.any((pressure < 0) | (pressure > 1)):
+            raise ValueError('The pressure must be between 0 (vacuum) and 1 (sea level) atmospheres')
+        pressure = np.reshape(pressure, pressure.shape + (1,) * np.ndim(vac))
+        return vac + pressure * (np.asarray(asl) - vac)
 
     @classmethod
     def optimize_point(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type):
@@ -102,19 +196,953 @@ class RocketStage:
         Optimizes a rocket stage for a given point
 
         Returns:
-            RocketStage: An optimized rocket stage.
+            list: The optimized rocket stages, see points_to_stages.
+        """
+        points = cls.optimize_points([pl], [dv], max_eng_quant, asl_or_vac, TWR_req, min_type=min_type)
+        return cls.points_to_stages(points, 0)
+
+    @classmethod
+    def optimize_points(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type='mass', chunk_size=4096,
+                        columns=None):
+        """
+        Optimizes a rocket stage for many independent (payload, delta-v) points in one broadcasted pass.
+
+        The configuration blocks of _configuration_blocks are built once and broadcast against all points, instead of
+        rebuilding them for every point like repeated optimize_point calls would.
+
+        Args:
+            pl (array_like): The payload of every point in tons.
+            dv (array_like): The delta-v of every point in m/s. pl and dv have the same length, or one of them is a
+                scalar or has length 1 and is shared by every point.
+            max_eng_quant (int): The maximum number of engines per stage.
+            asl_or_vac (str): 'asl' or 'vac'.
+            TWR_req (float or array_like): The minimum thrust to weight ratio, either shared or one per point.
+            min_type (str): 'mass' for the minimum mass configuration of every point, 'cost' for the (cost, mass)
+                Pareto set of every point.
+            chunk_size (int): The number of points solved at a time, which bounds the peak memory.
+            columns (array_like): Only consider these configuration indices. engine_idx still refers to the full list
+                of configuration_labels.
+
+        Returns:
+            dict: 'pl' and 'dv' hold the points, 'engines' and 'quant_engines' the labels of each configuration
+            index. For min_type='mass' the arrays 'engine_idx', 'num_engines', 'mass', 'cost' and 'fuel' have one
+            entry per point, with engine_idx -1 and np.inf mass and cost where no configuration is feasible. For
+            min_type='cost' the same arrays hold the Pareto sets of all points back to back, and the set of point i
+            is [offsets[i]:offsets[i + 1]]. Infeasible configurations are never part of a Pareto set.
+        """
+        if min_type not in ('mass', 'cost'):
+            raise NotImplementedError("Optimization is only implemented for mass or cost")
+        pl = np.atleast_1d(np.asarray(pl, dtype=float))
+        dv = np.atleast_1d(np.asarray(dv, dtype=float))
+        if pl.ndim > 1 or dv.ndim > 1 or len(pl) != len(dv) and 1 not in (len(pl), len(dv)):
+            raise ValueError(f'pl and dv must be 1-D with the same length, got the shapes {pl.shape} and {dv.shape}')
+        # Every point needs its own pl and dv, points_to_stages reads both per point
+        pl, dv = [np.ascontiguousarray(array) for array in np.broadcast_arrays(pl, dv)]
+        TWR_req = np.broadcast_to(np.asarray(TWR_req, dtype=float), pl.shape)
+        all_engines, all_quant_engines = cls.configuration_labels(max_eng_quant)
+        quant_engines = np.asarray(all_quant_engines)
+        if columns is not None:
+            columns = np.unique(np.asarray(columns, dtype=np.intp))
+
+        chunks = []
+        for start in range(0, len(pl), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            dv_array = dv[chunk, np.newaxis, np.newaxis]
+            pl_array = pl[chunk, np.newaxis, np.newaxis]
+            TWR_array = TWR_req[chunk, np.newaxis, np.newaxis]
+            blocks = list(cls._configuration_blocks(dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_array,
+                                                    columns=columns))
+            all_mtot = np.concatenate([block[0] for block in blocks], axis=2)[:, 0, :]
+            all_costs = np.concatenate([block[1] for block in blocks], axis=2)[:, 0, :]
+            all_mfs = np.concatenate([block[2] for block in blocks], axis=2)[:, 0, :]
+
+            if min_type == 'mass':
+                idx = np.argmin(all_mtot, axis=1)
+                rows = np.arange(len(idx))
+                mass = all_mtot[rows, idx]
+                chunks.append((np.where(mass == np.inf, -1, idx), mass, all_costs[rows, idx], all_mfs[rows, idx]))
+            else:
+                with phase('pareto', cells=len(all_mtot)):
+                    mask = pareto_mask_batched(np.stack((all_costs, all_mtot), axis=2), [-1, -1])
+                mask &= np.isfinite(all_mtot) & np.isfinite(all_costs)
+                rows, idx = np.nonzero(mask)
+                chunks.append((idx, all_mtot[rows, idx], all_costs[rows, idx], all_mfs[rows, idx],
+                               np.count_nonzero(mask, axis=1)))
+
+        points = {'pl': pl,
+                  'dv': dv,
+                  'engines': all_engines,
+                  'quant_engines': all_quant_engines}
+        for i, name in enumerate(['engine_idx', 'mass', 'cost', 'fuel']):
+            points[name] = np.concatenate([chunk[i] for chunk in chunks]) if chunks else np.zeros(0)
+        points['engine_idx'] = points['engine_idx'].astype(np.intp)
+        if columns is not None:
+            points['engine_idx'] = np.where(points['engine_idx'] >= 0, columns[points['engine_idx']], -1)
+        points['num_engines'] = np.where(points['engine_idx'] >= 0, quant_engines[points['engine_idx']], 0)
+        if min_type == 'cost':
+            counts = np.concatenate([chunk[4] for chunk in chunks]) if chunks else np.zeros(0, dtype=np.intp)
+            points['offsets'] = np.concatenate(([0], np.cumsum(counts)))
+        return points
+
+    @classmethod
+    def points_to_stages(cls, points, i):
+        """
+        Converts the result of point i of optimize_points into a list of stages, see point_to_stage. The list is
+        empty if the point has no feasible configuration.
+        """
+        if 'offsets' in points:
+            selection = range(points['offsets'][i], points['offsets'][i + 1])
+        elif points['engine_idx'][i] >= 0:
+            selection = [i]
+        else:
+            selection = []
+        return [cls.point_to_stage(points, i, j) for j in selection]
+
+    @classmethod
+    def point_to_stage(cls, points, i, j):
+        """
+        Builds the stage of entry j of the optimize_points arrays, a configuration of point i. Subclasses whose
+        labels or stages carry more than the engine name and count override this.
         """
-        raise NotImplementedError(f"""optimize_point() function is not implemented for {cls.__class__}""")
+        return cls(points['mass'][j], points['engines'][points['engine_idx'][j]], points['num_engines'][j],
+                   points['cost'][j], points['dv'][i], points['fuel'][j])
 
     @classmethod
-    def optimize_plot(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req):
+    def get_best_empty_fraction(cls, eng_type, max_eng_quant, num_engines):
+        if eng_type == 'SolidFuel':
+            best_empty_fraction = cls.catalog.empty_ratio[cls.catalog.mask(fuel_type=eng_type)]
+            best_empty_fraction = np.tile(best_empty_fraction, max_eng_quant)
+            best_empty_fraction = np.reshape(best_empty_fraction, [1, 1, len(num_engines)])
+        else:
+            best_empty_fraction = cls.tanks.__getattribute__(eng_type)['percent_structure']
+        return best_empty_fraction
+
+    @classmethod
+    def optimize_plot(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, plot=True, min_type='mass',
+                      filename=None, tile_size=None, workers=None, cache=None, min_label_cells=1, adaptive=False,
+                      coarse_step=16, precision='float64', backend='numpy'):
         """
         Optimizes a rocket stage for a given sweep of points
 
+        Args:
+            filename (str): The file the plot is saved to, plot_filename of the class by default.
+            tile_size (int): Solve the grid in tiles of tile_size x tile_size points to bound the peak memory.
+                See RocketStage.optimize_map.
+            workers (int): Spread the tiles over this many worker processes. See RocketStage.optimize_map.
+            cache (MapCache): Reuse a previously computed map from this cache. See RocketStage.optimize_map.
+            min_label_cells (int): Skip the labels of regions that cover fewer grid points than this.
+            adaptive (bool): Only solve every configuration near the region boundaries, see
+                RocketStage.optimize_map_adaptive. Much faster for large spans.
+            coarse_step (int): The initial lattice step of the adaptive map.
+            precision (str): The precision of the physics, one of the precisions of the class. See
+                RocketStage.optimize_map.
+            backend (str): 'numpy', 'numba' or 'auto'. See RocketStage.optimize_map.
+
+        Returns:
+            None with plot=True. With plot=False and span == 1 the optimized stages of the point, see
+            RocketStage.optimize_point. With plot=False and span > 1 the Pareto sets (min_type='cost') or minimum mass
+            configurations of every grid point, see RocketStage.optimize_pareto_map.
+
         Plots:
-            Plot of Engine indicies that are labeled for each engine type
+            Plot of Engine indicies that are labeled for each configuration label
         """
-        raise NotImplementedError(f"""optimize_plot() function is not implemented for {cls.__class__}""")
+        if plot:
+            if filename is None:
+                filename = cls.plot_filename
+            if adaptive:
+                if precision != 'float64':
+                    raise ValueError('The adaptive map is only solved in float64')
+                maps = cls.optimize_map_adaptive(pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req,
+                                                 coarse_step=coarse_step, cache=cache)
+            else:
+                maps = cls.optimize_map(pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req,
+                                        tile_size=tile_size, workers=workers, cache=cache, precision=precision,
+                                        backend=backend)
+
+            min_idx = maps['min_mtot_idx'] if min_type == 'mass' else maps['min_costs_idx']
+            cls.plotDVPLDiagram(min_idx, maps['engines'], maps['quant_engines'], maps['pl'], maps['dv'], filename,
+                                asl_or_vac, TWR_req, min_label_cells=min_label_cells)
+
+        elif span == 1:
+            pl, dv = cls.make_grid(pl_span, dv_span, span)
+            points = cls.optimize_points(pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type=min_type)
+            return cls.points_to_stages(points, 0)
+        else:
+            return cls.optimize_pareto_map(pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req,
+                                           min_type=min_type)
+
+    @classmethod
+    def optimize_map(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, tile_size=None, workers=None,
+                     cache=None, precision='float64', backend='numpy', prune=True):
+        """
+        Finds the minimum mass and the minimum cost configuration for every point of a dv/pl grid.
+
+        The grid is processed in tiles of tile_size x tile_size points. Each tile only keeps running min/argmin
+        accumulators over the configuration blocks of _configuration_blocks, so the peak memory depends on the tile
+        size and not on the grid size. With workers > 1 the tiles are spread over a process pool (see map_tasks) and
+        merged back in tile order. Every grid point goes through the same arithmetic whichever tile or process it
+        lands in, so the result is bit-identical to the serial path.
+
+        Args:
+            pl_span (list): The minimum and maximum payload in tons. Payloads are log spaced.
+            dv_span (list): The minimum and maximum delta-v in m/s. Delta-v values are linearly spaced.
+            span (int): The number of points along each axis of the grid.
+            max_eng_quant (int): The maximum number of engines per stage.
+            asl_or_vac (str): 'asl' or 'vac'.
+            TWR_req (float): The minimum thrust to weight ratio.
+            tile_size (int): The number of grid points per tile along each axis. None solves the grid in one tile,
+                or in workers x workers tiles when workers > 1.
+            workers (int): The number of worker processes. None or 1 solves the tiles in this process.
+            cache (MapCache): Load the map from this cache if it has been computed before, and store it otherwise.
+            precision (str): 'float64', or 'float32' to solve the physics in single precision, which halves the
+                memory traffic of the configuration blocks. Only the classes that list it in precisions support
+                float32, see StageMap for its accuracy.
+            backend (str): 'numpy' solves every configuration block with NumPy arrays. 'numba' runs the fused
+                kernels of the kernels module, which need numba and only exist for the classes that list 'numba' in
+                backends. Its maps agree with 'numpy' to rounding, not bit for bit, see kernels.reduce_linear.
+                'auto' picks 'numba' where it is available and 'numpy' otherwise.
+            prune (bool): Skip the configurations that prune_columns proves can't win anywhere in the grid before
+                the tiles are solved. The map is the same with and without pruning.
+
+        Returns:
+            dict: 'pl' and 'dv' hold the grid axes. 'min_mtot' and 'min_costs' hold the minimum mass and cost of
+            every point with shape (span, span) indexed [dv, pl], in the dtype of precision. 'min_mtot_idx' and
+            'min_costs_idx' hold the index of the winning configuration, or -1 where no configuration is feasible.
+            'engines' and 'quant_engines' hold the engine name and engine count of each configuration index.
+            'n_pruned' holds the number of configurations that were skipped.
+        """
+        if precision not in cls.precisions:
+            raise ValueError(f'{cls.__name__} supports the precisions {cls.precisions}, not {precision!r}')
+        backend = cls.resolve_backend(backend, precision)
+        if cache is not None:
+            # float64 NumPy maps keep the keys they had before the precision and backend options existed
+            options = {name: value for name, value, default in [('precision', precision, 'float64'),
+                                                                 ('backend', backend, 'numpy')] if value != default}
+            key = cache.key(cls, pl_span=pl_span, dv_span=dv_span, span=span, max_eng_quant=max_eng_quant,
+                            asl_or_vac=asl_or_vac, TWR_req=TWR_req, **options)
+            maps = cache.load(key)
+            if maps is not None:
+                return maps
+
+        pl, dv = cls.make_grid(pl_span, dv_span, span)
+        all_engines, all_quant_engines = cls.configuration_labels(max_eng_quant)
+
+        min_mtot = np.full([span, span], np.inf, dtype=precision)
+        min_costs = np.full([span, span], np.inf, dtype=precision)
+        min_mtot_idx = np.zeros([span, span], dtype=np.intp)
+        min_costs_idx = np.zeros([span, span], dtype=np.intp)
+
+        if tile_size is None and workers is not None and workers > 1:
+            tile_size = -(-span // workers)
+        if workers is not None and workers > 1:
+            # Build the catalogs before the pool forks so the workers inherit them
+            cls.load_catalogs()
+        tiles = list(cls.tiles(span, tile_size))
+        columns = cls.prune_columns(pl, dv, max_eng_quant, asl_or_vac, TWR_req) if prune else None
+        # The physics runs in the dtype of the grid, see LinearStage.solve_fuel_type
+        tasks = [(dv[dv_slice].astype(precision), pl[pl_slice].astype(precision), max_eng_quant, asl_or_vac, TWR_req,
+                  backend, columns) for dv_slice, pl_slice in tiles]
+
+        with phase('optimize_map', span=span, tiles=len(tiles), workers=workers or 1):
+            for (dv_slice, pl_slice), tile in zip(tiles, cls.map_tasks(cls._reduce_tile, tasks, workers)):
+                min_mtot[dv_slice, pl_slice], min_mtot_idx[dv_slice, pl_slice], \
+                    min_costs[dv_slice, pl_slice], min_costs_idx[dv_slice, pl_slice] = tile
+
+        min_mtot_idx[min_mtot == np.inf] = -1
+        min_costs_idx[min_costs == np.inf] = -1
+
+        maps = {'pl': pl,
+                'dv': dv,
+                'min_mtot': min_mtot,
+                'min_mtot_idx': min_mtot_idx,
+                'min_costs': min_costs,
+                'min_costs_idx': min_costs_idx,
+                'engines': all_engines,
+                'quant_engines': all_quant_engines,
+                'n_pruned': 0 if columns is None else len(all_engines) - len(columns)}
+        if cache is not None:
+            cache.save(key, maps)
+        return maps
+
+    @classmethod
+    def resolve_backend(cls, backend, precision='float64'):
+        """
+        Checks a backend option of optimize_map and resolves 'auto'.
+
+        Returns:
+            str: 'numpy' or 'numba'.
+        """
+        import kernels
+        if backend == 'auto':
+            backend = 'numba' if 'numba' in cls.backends and kernels.available() and precision == 'float64' \
+                else 'numpy'
+        if backend not in cls.backends:
+            raise ValueError(f'{cls.__name__} supports the backends {cls.backends}, not {backend!r}')
+        if backend == 'numba':
+            if not kernels.available():
+                raise ImportError("backend='numba' requires numba, install it with \"pip install numba\" or use "
+                                  "backend='numpy'")
+            if precision != 'float64':
+                raise ValueError('The numba backend solves in float64')
+        return backend
+
+    @classmethod
+    def _reduce_tile_fused(cls, dv, pl, max_eng_quant, asl_or_vac, TWR_req, columns=None):
+        """
+        Reduces a tile like _reduce_tile with one fused kernel, for the classes that list 'numba' in backends.
+        """
+        raise NotImplementedError(f"""_reduce_tile_fused() function is not implemented for {cls.__class__}""")
+
+    @classmethod
+    def optimize_map_sliced(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, cache, workers=None):
+        """
+        Finds the map of optimize_map from per-engine slices that are kept in a SliceCache.
+
+        A slice holds the minimum mass and cost over the configurations built from one set of catalog engines (see
+        column_engines), e.g. every count of one engine, and the position of the winner in the slice. The slices do
+        not depend on the other engines of the catalog, so after toggling an engine in allowed_engines or editing
+        one engine row of a CSV file only the slices of that engine are solved again. The catalogs are built once per
+        process, so call reload_catalogs after such a change for this run to see it. The slices are then re-reduced
+        with the global column indices of the current catalog, and ties go to the lower index like in
+        running_argmin, so the map is bit-identical to optimize_map. Every slice is solved on its own, without the
+        pruning against other configurations of BoostedStage, so a run that misses every slice can be slower than
+        optimize_map.
+
+        Args:
+            cache (SliceCache): Loads the unchanged slices and stores the solved ones.
+            workers (int): Solve the missing slices in this many worker processes, see map_tasks.
+
+        Returns:
+            dict: The map in the format of optimize_map.
+        """
+        pl, dv = cls.make_grid(pl_span, dv_span, span)
+        all_engines, all_quant_engines = cls.configuration_labels(max_eng_quant)
+        params = dict(pl_span=pl_span, dv_span=dv_span, span=span, max_eng_quant=max_eng_quant,
+                      asl_or_vac=asl_or_vac, TWR_req=TWR_req)
+
+        slices = {}
+        for column, engines in enumerate(cls.column_engines(max_eng_quant)):
+            slices.setdefault(engines, []).append(column)
+
+        min_mtot = np.full([span, span], np.inf)
+        min_costs = np.full([span, span], np.inf)
+        min_mtot_idx = np.full([span, span], np.iinfo(np.intp).max, dtype=np.intp)
+        min_costs_idx = np.full([span, span], np.iinfo(np.intp).max, dtype=np.intp)
+
+        def merge(columns, solved):
+            cls.merge_argmin(min_mtot, min_mtot_idx, solved['min_mtot'], columns[solved['min_mtot_pos']])
+            cls.merge_argmin(min_costs, min_costs_idx, solved['min_costs'], columns[solved['min_costs_pos']])
+
+        missing = []
+        with phase('optimize_map_sliced', span=span, slices=len(slices)):
+            for engines, columns in slices.items():
+                columns = np.array(columns)
+                key = cache.key(cls, engines, [[all_engines[i], int(all_quant_engines[i])] for i in columns],
+                                **params)
+                solved = cache.load(key)
+                if solved is None:
+                    missing.append((key, columns))
+                else:
+                    merge(columns, solved)
+
+            if workers is not None and workers > 1:
+                cls.load_catalogs()
+            tasks = [(dv, pl, max_eng_quant, asl_or_vac, TWR_req, columns) for key, columns in missing]
+            for (key, columns), solved in zip(missing, cls.map_tasks(cls._solve_slice, tasks, workers)):
+                cache.save(key, solved)
+                merge(columns, solved)
+
+        min_mtot_idx[min_mtot == np.inf] = -1
+        min_costs_idx[min_costs == np.inf] = -1
+        return {'pl': pl,
+                'dv': dv,
+                'min_mtot': min_mtot,
+                'min_mtot_idx': min_mtot_idx,
+                'min_costs': min_costs,
+                'min_costs_idx': min_costs_idx,
+                'engines': all_engines,
+                'quant_engines': all_quant_engines}
+
+    @classmethod
+    def _solve_slice(cls, dv, pl, max_eng_quant, asl_or_vac, TWR_req, columns):
+        """
+        Reduces the configurations of one slice over a grid, see optimize_map_sliced. The winners are stored as
+        positions in columns, which stay valid when the global column indices change.
+        """
+        with phase('slice', cells=len(dv) * len(pl), columns=len(columns)):
+            min_mtot, min_mtot_idx, min_costs, min_costs_idx = \
+                cls._reduce_arrays(dv[:, np.newaxis, np.newaxis], pl[np.newaxis, :, np.newaxis], max_eng_quant,
+                                   asl_or_vac, TWR_req, columns=columns)
+        return {'min_mtot': min_mtot,
+                'min_mtot_pos': np.searchsorted(columns, min_mtot_idx).astype(np.int16),
+                'min_costs': min_costs,
+                'min_costs_pos': np.searchsorted(columns, min_costs_idx).astype(np.int16)}
+
+    @classmethod
+    def prune_columns(cls, pl, dv, max_eng_quant, asl_or_vac, TWR_req):
+        """
+        Finds the configurations that can win somewhere in a grid, see LinearStage.prune_columns.
+
+        Returns:
+            numpy.ndarray: The sorted indices of the configurations to solve, or None to solve every configuration.
+        """
+        return None
+
+    @classmethod
+    def column_engines(cls, max_eng_quant):
+        """
+        Returns the names of the catalog engines every configuration column is built from, as a tuple per column in
+        the order of configuration_labels.
+        """
+        return [(name,) for name in cls.configuration_labels(max_eng_quant)[0]]
+
+    @classmethod
+    def optimize_pareto_map(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, min_type='cost',
+                            chunk_size=4096):
+        """
+        Finds the (cost, mass) Pareto set of every point of a dv/pl grid.
+
+        The grid points are solved with optimize_points, chunk_size points at a time, so every chunk reduces its
+        configurations to per-point frontiers with one batched sort-and-sweep instead of one frontier per point.
+
+        Args:
+            min_type (str): 'cost' for the Pareto sets, 'mass' for only the minimum mass configuration of every point.
+            chunk_size (int): The number of grid points solved at a time, which bounds the peak memory.
+
+        Returns:
+            dict: The points of optimize_points for the span * span grid points in [dv, pl] order, so grid point (i, j)
+            is point i * span + j and its stages are points_to_stages(pareto_map, i * span + j). For min_type='cost'
+            the sets are stored back to back: 'offsets' has span * span + 1 entries and the set of point k is
+            'engine_idx', 'mass', 'cost' and 'fuel'[offsets[k]:offsets[k + 1]]. 'pl_axis' and 'dv_axis' hold the
+            grid axes and 'shape' the grid shape.
+        """
+        pl, dv = cls.make_grid(pl_span, dv_span, span)
+        with phase('optimize_pareto_map', span=span):
+            pareto_map = cls.optimize_points(np.tile(pl, span), np.repeat(dv, span), max_eng_quant, asl_or_vac,
+                                             TWR_req, min_type=min_type, chunk_size=chunk_size)
+        pareto_map['pl_axis'] = pl
+        pareto_map['dv_axis'] = dv
+        pareto_map['shape'] = (span, span)
+        return pareto_map
+
+    @classmethod
+    def optimize_twr_sweep(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_reqs, tile_size=None,
+                           workers=None):
+        """
+        Finds the minimum mass and the minimum cost configuration of every point of a dv/pl grid for several TWR
+        requirements in one pass.
+
+        The tank sizes do not depend on the TWR requirement, it only decides which configurations are feasible. Every
+        configuration is therefore solved once without a requirement and masked with each requirement afterwards.
+        Each threshold gives the same winners as optimize_map with that TWR_req.
+
+        Args:
+            TWR_reqs (array_like): The minimum thrust to weight ratios.
+            tile_size (int): See optimize_map.
+            workers (int): See optimize_map.
+
+        Returns:
+            dict: 'pl', 'dv', 'engines' and 'quant_engines' as in optimize_map and 'TWR_reqs'. 'min_mtot',
+            'min_mtot_idx', 'min_costs' and 'min_costs_idx' have shape (len(TWR_reqs), span, span), one optimize_map
+            result per requirement. 'mtot_twr_limit' and 'costs_twr_limit' have the same shape and hold the highest
+            TWR requirement at which each winner stays feasible and optimal, which is its own thrust to weight ratio,
+            or np.nan where no configuration is feasible. 'max_twr' has shape (span, span) and holds the highest TWR
+            requirement any configuration can meet, np.nan where none is feasible at all.
+        """
+        TWR_reqs = np.atleast_1d(np.asarray(TWR_reqs, dtype=float))
+        pl, dv = cls.make_grid(pl_span, dv_span, span)
+        all_engines, all_quant_engines = cls.configuration_labels(max_eng_quant)
+        shape = (len(TWR_reqs), span, span)
+        maps = {'pl': pl,
+                'dv': dv,
+                'TWR_reqs': TWR_reqs,
+                'min_mtot': np.empty(shape),
+                'min_mtot_idx': np.empty(shape, dtype=np.intp),
+                'min_costs': np.empty(shape),
+                'min_costs_idx': np.empty(shape, dtype=np.intp),
+                'mtot_twr_limit': np.empty(shape),
+                'costs_twr_limit': np.empty(shape),
+                'max_twr': np.empty((span, span)),
+                'engines': all_engines,
+                'quant_engines': all_quant_engines}
+
+        if tile_size is None and workers is not None and workers > 1:
+            tile_size = -(-span // workers)
+        if workers is not None and workers > 1:
+            cls.load_catalogs()
+        tiles = list(cls.tiles(span, tile_size))
+        tasks = [(dv[dv_slice], pl[pl_slice], max_eng_quant, asl_or_vac, TWR_reqs) for dv_slice, pl_slice in tiles]
+        names = ['min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx', 'mtot_twr_limit', 'costs_twr_limit']
+
+        with phase('optimize_twr_sweep', span=span, tiles=len(tiles), thresholds=len(TWR_reqs)):
+            for (dv_slice, pl_slice), tile in zip(tiles, cls.map_tasks(cls._reduce_twr_tile, tasks, workers)):
+                for name, result in zip(names, tile[:-1]):
+                    maps[name][:, dv_slice, pl_slice] = result
+                maps['max_twr'][dv_slice, pl_slice] = tile[-1]
+        return maps
+
+    @classmethod
+    def optimize_pressure_sweep(cls, pl_span, dv_span, span, max_eng_quant, pressures, TWR_req, tile_size=None,
+                                workers=None):
+        """
+        Finds the minimum mass and the minimum cost configuration of every point of a dv/pl grid for several ambient
+        pressures in one broadcasted pass.
+
+        The ISP and thrust of every engine are interpolated between their sea level and vacuum values, see
+        flight_condition, and the pressures become a leading axis of every physics array. Each pressure gives the
+        same winners as optimize_map with that pressure as asl_or_vac.
+
+        Args:
+            pressures (array_like): The ambient pressures in atmospheres, from 0 in vacuum to 1 at Kerbin sea level.
+            tile_size (int): See optimize_map. None uses tiles of about pressure_tile_cells grid points times
+                pressures.
+            workers (int): See optimize_map.
+
+        Returns:
+            dict: 'pl', 'dv', 'engines' and 'quant_engines' as in optimize_map and 'pressures'. 'min_mtot',
+            'min_mtot_idx', 'min_costs' and 'min_costs_idx' have shape (len(pressures), span, span), one optimize_map
+            result per pressure.
+        """
+        pressures = np.atleast_1d(np.asarray(pressures, dtype=float))
+        pl, dv = cls.make_grid(pl_span, dv_span, span)
+        all_engines, all_quant_engines = cls.configuration_labels(max_eng_quant)
+        shape = (len(pressures), span, span)
+        maps = {'pl': pl,
+                'dv': dv,
+                'pressures': pressures,
+                'min_mtot': np.empty(shape),
+                'min_mtot_idx': np.empty(shape, dtype=np.intp),
+                'min_costs': np.empty(shape),
+                'min_costs_idx': np.empty(shape, dtype=np.intp),
+                'engines': all_engines,
+                'quant_engines': all_quant_engines}
+
+        if tile_size is None:
+            # The pressure axis multiplies the size of every physics array, small tiles keep them in the CPU cache
+            tile_size = max(1, int(np.sqrt(cls.pressure_tile_cells / len(pressures))))
+        if workers is not None and workers > 1:
+            tile_size = min(tile_size, -(-span // workers))
+            cls.load_catalogs()
+        tiles = list(cls.tiles(span, tile_size))
+        tasks = [(dv[dv_slice], pl[pl_slice], max_eng_quant, pressures, TWR_req) for dv_slice, pl_slice in tiles]
+        names = ['min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']
+
+        with phase('optimize_pressure_sweep', span=span, tiles=len(tiles), pressures=len(pressures)):
+            for (dv_slice, pl_slice), tile in zip(tiles, cls.map_tasks(cls._reduce_pressure_tile, tasks, workers)):
+                for name, result in zip(names, tile):
+                    maps[name][:, dv_slice, pl_slice] = result
+
+        maps['min_mtot_idx'][maps['min_mtot'] == np.inf] = -1
+        maps['min_costs_idx'][maps['min_costs'] == np.inf] = -1
+        return maps
+
+    @classmethod
+    def optimize_map_adaptive(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, coarse_step=16,
+                              cache=None):
+        """
+        Approximates the maps of optimize_map, but only solves every configuration near the boundaries between
+        winning configurations.
+
+        The grid points on a lattice of every coarse_step-th point are solved first. Every lattice block whose four
+        corners disagree on the minimum mass or minimum cost configuration (including feasibility) is split into
+        four, and the new corner points are solved, until the blocks are one grid step wide. The remaining points lie
+        in blocks whose corners agree, so they take the winners of their corners and only those configurations are
+        solved to get their mass and cost. A region of a configuration that fits inside a coarse block without
+        touching any of its corners is missed, so coarse_step should stay well below the size of the smallest region.
+
+        The maps are therefore an approximation of optimize_map. The corners are solved exactly and every other
+        point takes the minimum over a subset of the configurations, so a point is never lighter or cheaper than in
+        optimize_map, only heavier or more expensive where a winner was missed. The minimum mass regions are large and
+        smooth and usually come out identical. The minimum cost winner changes along the steps of the tank cost
+        tables, which form thin bands that can lie between the corners of a block, e.g. AsparagusStage maps differ
+        from optimize_map in a few cost points. Use optimize_map where the cost map has to be exact.
+
+        Args:
+            pl_span (list): The minimum and maximum payload in tons. Payloads are log spaced.
+            dv_span (list): The minimum and maximum delta-v in m/s. Delta-v values are linearly spaced.
+            span (int): The number of points along each axis of the grid.
+            max_eng_quant (int): The maximum number of engines per stage.
+            asl_or_vac (str): 'asl' or 'vac'.
+            TWR_req (float): The minimum thrust to weight ratio.
+            coarse_step (int): The number of grid steps between the points of the initial lattice.
+            cache (MapCache): Load the map from this cache if it has been computed before, and store it otherwise.
+
+        Returns:
+            dict: The maps of optimize_map plus 'n_evaluated', the number of grid points for which every
+            configuration was solved.
+        """
+        if cache is not None:
+            key = cache.key(cls, pl_span=pl_span, dv_span=dv_span, span=span, max_eng_quant=max_eng_quant,
+                            asl_or_vac=asl_or_vac, TWR_req=TWR_req, adaptive=True, coarse_step=coarse_step)
+            maps = cache.load(key)
+            if maps is not None:
+                return maps
+
+        pl, dv = cls.make_grid(pl_span, dv_span, span)
+        all_engines, all_quant_engines = cls.configuration_labels(max_eng_quant)
+        maps = {'pl': pl,
+                'dv': dv,
+                'min_mtot': np.full([span, span], np.inf),
+                'min_mtot_idx': np.full([span, span], -1, dtype=np.intp),
+                'min_costs': np.full([span, span], np.inf),
+                'min_costs_idx': np.full([span, span], -1, dtype=np.intp),
+                'engines': all_engines,
+                'quant_engines': all_quant_engines}
+        evaluated = np.zeros([span, span], dtype=bool)
+
+        lattice = np.unique(np.r_[np.arange(0, span, coarse_step), span - 1])
+        rows, cols = np.meshgrid(lattice, lattice, indexing='ij')
+        cls._evaluate_cells(maps, evaluated, rows.ravel(), cols.ravel(), max_eng_quant, asl_or_vac, TWR_req)
+
+        # Blocks are rows of [i0, i1, j0, j1], the inclusive grid indices of their corners
+        i0, j0 = np.meshgrid(lattice[:-1], lattice[:-1], indexing='ij')
+        i1, j1 = np.meshgrid(lattice[1:], lattice[1:], indexing='ij')
+        blocks = np.stack([i0.ravel(), i1.ravel(), j0.ravel(), j1.ravel()], axis=1)
+        uniform_blocks = []
+        while len(blocks):
+            i0, i1, j0, j1 = blocks.T
+            uniform = np.ones(len(blocks), dtype=bool)
+            for name in ['min_mtot_idx', 'min_costs_idx']:
+                corners = maps[name][[i0, i0, i1, i1], [j0, j1, j0, j1]]
+                uniform &= np.all(corners == corners[0], axis=0)
+            # Blocks that are one step wide in both directions only consist of solved corners
+            leaf = (i1 - i0 <= 1) & (j1 - j0 <= 1)
+            uniform_blocks.append(blocks[uniform & ~leaf])
+
+            i0, i1, j0, j1 = blocks[~uniform & ~leaf].T
+            im = (i0 + i1) // 2
+            jm = (j0 + j1) // 2
+            cls._evaluate_cells(maps, evaluated, np.concatenate([im, im, i0, i1, im]),
+                                np.concatenate([j0, j1, jm, jm, jm]), max_eng_quant, asl_or_vac, TWR_req)
+            blocks = np.concatenate([np.stack(child, axis=1) for child in
+                                     [(i0, im, j0, jm), (i0, im, jm, j1), (im, i1, j0, jm), (im, i1, jm, j1)]])
+            # Splitting a block that is one step wide in one direction leaves an empty child in that direction
+            blocks = blocks[(blocks[:, 1] > blocks[:, 0]) & (blocks[:, 3] > blocks[:, 2])]
+
+        # Every point that was not solved lies in a uniform block and takes the winner of its corners
+        predicted_mtot_idx = np.full([span, span], -1, dtype=np.intp)
+        predicted_costs_idx = np.full([span, span], -1, dtype=np.intp)
+        # A grid of a single point has no blocks
+        for i0, i1, j0, j1 in np.concatenate(uniform_blocks).tolist() if uniform_blocks else []:
+            predicted_mtot_idx[i0:i1 + 1, j0:j1 + 1] = maps['min_mtot_idx'][i0, j0]
+            predicted_costs_idx[i0:i1 + 1, j0:j1 + 1] = maps['min_costs_idx'][i0, j0]
+
+        # Group the remaining points by their predicted (mass, cost) configurations and only solve those
+        cells = np.flatnonzero(~evaluated)
+        n_columns = len(all_engines)
+        pairs = (predicted_mtot_idx.ravel()[cells] + 1) * (n_columns + 1) + predicted_costs_idx.ravel()[cells] + 1
+        order = np.argsort(pairs, kind='stable')
+        pairs, starts = np.unique(pairs[order], return_index=True)
+        for pair, group in zip(pairs, np.split(cells[order], starts[1:])):
+            columns = [column - 1 for column in np.divmod(pair, n_columns + 1) if column > 0]
+            if not columns:
+                continue
+            rows, cols = np.divmod(group, span)
+            with phase('fill_cells', cells=len(rows), columns=len(columns)):
+                min_mtot, min_mtot_idx, min_costs, min_costs_idx = \
+                    cls._reduce_cells(dv[rows], pl[cols], max_eng_quant, asl_or_vac, TWR_req, columns=columns,
+                                      chunk_size=2 ** 20)
+            maps['min_mtot'][rows, cols] = min_mtot
+            maps['min_mtot_idx'][rows, cols] = np.where(min_mtot == np.inf, -1, min_mtot_idx)
+            maps['min_costs'][rows, cols] = min_costs
+            maps['min_costs_idx'][rows, cols] = np.where(min_costs == np.inf, -1, min_costs_idx)
+
+        maps['n_evaluated'] = int(np.count_nonzero(evaluated))
+        if cache is not None:
+            cache.save(key, maps)
+        return maps
+
+    @classmethod
+    def _evaluate_cells(cls, maps, evaluated, rows, cols, max_eng_quant, asl_or_vac, TWR_req):
+        """
+        Solves every configuration for the grid points (rows, cols) of an optimize_map_adaptive map that have not
+        been solved yet and writes the minima into maps.
+        """
+        span = len(maps['pl'])
+        cells = np.unique(np.asarray(rows) * span + np.asarray(cols))
+        rows, cols = np.divmod(cells, span)
+        todo = ~evaluated[rows, cols]
+        rows, cols = rows[todo], cols[todo]
+        if len(rows) == 0:
+            return
+        with phase('evaluate_cells', cells=len(rows)):
+            min_mtot, min_mtot_idx, min_costs, min_costs_idx = \
+                cls._reduce_cells(maps['dv'][rows], maps['pl'][cols], max_eng_quant, asl_or_vac, TWR_req)
+        maps['min_mtot'][rows, cols] = min_mtot
+        maps['min_mtot_idx'][rows, cols] = np.where(min_mtot == np.inf, -1, min_mtot_idx)
+        maps['min_costs'][rows, cols] = min_costs
+        maps['min_costs_idx'][rows, cols] = np.where(min_costs == np.inf, -1, min_costs_idx)
+        evaluated[rows, cols] = True
+
+    @classmethod
+    def _reduce_tile(cls, dv, pl, max_eng_quant, asl_or_vac, TWR_req, backend='numpy', columns=None):
+        """
+        Reduces every configuration block of a tile, or only the given columns, into the minimum mass and cost and
+        their column indices.
+        """
+        if backend == 'numba':
+            return cls._reduce_tile_fused(dv, pl, max_eng_quant, asl_or_vac, TWR_req, columns=columns)
+        with phase('tile', cells=len(dv) * len(pl)):
+            return cls._reduce_arrays(dv[:, np.newaxis, np.newaxis], pl[np.newaxis, :, np.newaxis], max_eng_quant,
+                                      asl_or_vac, TWR_req, columns=columns)
+
+    @classmethod
+    def _reduce_twr_tile(cls, dv, pl, max_eng_quant, asl_or_vac, TWR_reqs):
+        """
+        Reduces every configuration block of a tile into the winners of every TWR requirement, see
+        optimize_twr_sweep.
+        """
+        shape = (len(TWR_reqs), len(dv), len(pl))
+        min_mtot = np.full(shape, np.inf)
+        min_costs = np.full(shape, np.inf)
+        min_mtot_idx = np.zeros(shape, dtype=np.intp)
+        min_costs_idx = np.zeros(shape, dtype=np.intp)
+        mtot_twr = np.full(shape, np.nan)
+        costs_twr = np.full(shape, np.nan)
+        max_twr = np.full(shape[1:], -np.inf)
+
+        # Solving every column explicitly disables pruning against the best configuration found so far, which is only
+        # valid for a single requirement
+        columns = np.arange(len(cls.configuration_labels(max_eng_quant)[0]))
+        offset = 0
+        with phase('tile', cells=len(dv) * len(pl)):
+            for m_tot, costs, fuel_units, TWR in cls._configuration_blocks(dv[:, np.newaxis, np.newaxis],
+                                                                           pl[np.newaxis, :, np.newaxis],
+                                                                           max_eng_quant, asl_or_vac, 0,
+                                                                           columns=columns, with_twr=True):
+                with phase('argmin', cells=int(m_tot.size) * len(TWR_reqs)):
+                    TWR = np.broadcast_to(TWR, m_tot.shape)
+                    max_twr = np.maximum(max_twr, np.max(np.where(np.isfinite(m_tot), TWR, -np.inf), axis=-1))
+                    for k, TWR_req in enumerate(TWR_reqs):
+                        infeasible = TWR < TWR_req
+                        for acc, acc_idx, acc_twr, block in [(min_mtot, min_mtot_idx, mtot_twr, m_tot),
+                                                             (min_costs, min_costs_idx, costs_twr, costs)]:
+                            idx, better = cls.running_argmin(acc[k], acc_idx[k], np.where(infeasible, np.inf, block),
+                                                             offset)
+                            winner_twr = np.take_along_axis(TWR, np.expand_dims(idx, -1), axis=-1)[..., 0]
+                            acc_twr[k][better] = winner_twr[better]
+                offset += m_tot.shape[-1]
+
+        min_mtot_idx[min_mtot == np.inf] = -1
+        min_costs_idx[min_costs == np.inf] = -1
+        max_twr[max_twr == -np.inf] = np.nan
+        return min_mtot, min_mtot_idx, min_costs, min_costs_idx, mtot_twr, costs_twr, max_twr
+
+    @classmethod
+    def _reduce_pressure_tile(cls, dv, pl, max_eng_quant, pressures, TWR_req):
+        """
+        Reduces every configuration block of a tile for every pressure, see optimize_pressure_sweep.
+        """
+        # The delta-v array carries the pressure axis, so the accumulators of _reduce_arrays get it too
+        dv_array = np.broadcast_to(dv[np.newaxis, :, np.newaxis, np.newaxis], (len(pressures), len(dv), 1, 1))
+        with phase('tile', cells=len(dv) * len(pl) * len(pressures)):
+            return cls._reduce_arrays(dv_array, pl[np.newaxis, np.newaxis, :, np.newaxis], max_eng_quant, pressures,
+                                      TWR_req)
+
+    @classmethod
+    def _reduce_cells(cls, dv, pl, max_eng_quant, asl_or_vac, TWR_req, columns=None, chunk_size=2 ** 16):
+        """
+        Reduces the configurations of scattered (dv, pl) points, chunk_size points at a time.
+
+        Returns:
+            tuple: min_mtot, min_mtot_idx, min_costs and min_costs_idx arrays with one entry per point.
+        """
+        results = (np.empty(len(dv)), np.empty(len(dv), dtype=np.intp), np.empty(len(dv)),
+                   np.empty(len(dv), dtype=np.intp))
+        for start in range(0, len(dv), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            reduced = cls._reduce_arrays(dv[chunk, np.newaxis, np.newaxis], pl[chunk, np.newaxis, np.newaxis],
+                                         max_eng_quant, asl_or_vac, TWR_req, columns=columns)
+            for result, new in zip(results, reduced):
+                result[chunk] = new[:, 0]
+        return results
+
+    @classmethod
+    def _reduce_arrays(cls, dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_req, columns=None):
+        """
+        Reduces the configuration blocks of broadcastable dv/pl arrays with a trailing axis of length 1.
+
+        Args:
+            columns (array_like): Only consider these configuration indices. The returned indices still refer to
+                the full list of configuration_labels.
+
+        Returns:
+            tuple: min_mtot, min_mtot_idx, min_costs and min_costs_idx with the broadcast shape of the inputs
+            without the trailing axis.
+        """
+        if columns is not None:
+            columns = np.unique(columns)
+        shape = np.broadcast_shapes(dv_array.shape, pl_array.shape)[:-1]
+        dtype = np.result_type(dv_array, pl_array)
+        min_mtot = np.full(shape, np.inf, dtype=dtype)
+        min_costs = np.full(shape, np.inf, dtype=dtype)
+        min_mtot_idx = np.zeros(shape, dtype=np.intp)
+        min_costs_idx = np.zeros(shape, dtype=np.intp)
+
+        offset = 0
+        for m_tot, costs, fuel_units in cls._configuration_blocks(dv_array, pl_array, max_eng_quant, asl_or_vac,
+                                                                  TWR_req, columns=columns):
+            with phase('argmin', cells=int(m_tot.size)):
+                cls.running_argmin(min_mtot, min_mtot_idx, m_tot, offset)
+                cls.running_argmin(min_costs, min_costs_idx, costs, offset)
+            offset += m_tot.shape[-1]
+
+        if columns is not None and len(columns):
+            min_mtot_idx = columns[min_mtot_idx]
+            min_costs_idx = columns[min_costs_idx]
+        return min_mtot, min_mtot_idx, min_costs, min_costs_idx
+
+    @classmethod
+    def _configuration_blocks(cls, dv_array, pl_array, max_eng_quant, asl_or_vac, TWR_req, columns=None,
+                              with_twr=False):
+        """
+        Yields (m_tot, costs, fuel_units) arrays for consecutive blocks of configuration columns, in the order of
+        configuration_labels. dv_array and pl_array broadcast against each other and have a trailing axis of length
+        1, which becomes the column axis. Infeasible configurations are np.inf.
+
+        Args:
+            columns (numpy.ndarray): Sorted configuration indices to evaluate. None evaluates every configuration.
+            with_twr (bool): Also yield the thrust to weight ratio of every configuration as a fourth array. A
+                configuration is feasible for a TWR requirement up to this ratio.
+        """
+        raise NotImplementedError(f"""_configuration_blocks() function is not implemented for {cls.__class__}""")
+
+    @staticmethod
+    def running_argmin(acc, acc_idx, block, offset):
+        """
+        Folds a block of columns into running min/argmin accumulators in place.
+
+        Ties keep the earlier column, so folding the blocks in order gives the same result as np.argmin over the
+        concatenated columns.
+
+        Args:
+            acc (numpy.ndarray): The running minimum.
+            acc_idx (numpy.ndarray): The column index of the running minimum.
+            block (numpy.ndarray): The new columns along the last axis.
+            offset (int): The column index of the first column of the block.
+
+        Returns:
+            tuple: The argmin of the block and the mask of the accumulator entries it replaced, to carry other
+            per-column values along.
+        """
+        idx = np.argmin(block, axis=-1)
+        val = np.take_along_axis(block, np.expand_dims(idx, -1), axis=-1)[..., 0]
+        better = val < acc
+        acc[better] = val[better]
+        acc_idx[better] = idx[better] + offset
+        return idx, better
+
+    @staticmethod
+    def merge_argmin(acc, acc_idx, values, idx):
+        """
+        Merges candidates with arbitrary column indices into min/argmin accumulators in place. Ties keep the lower
+        column index, so merging in any order gives the result of running_argmin over the columns in order.
+
+        Args:
+            acc (numpy.ndarray): The running minimum.
+            acc_idx (numpy.ndarray): The column index of the running minimum.
+            values (numpy.ndarray): The candidate values, shaped like acc.
+            idx (numpy.ndarray): The column index of every candidate.
+        """
+        better = (values < acc) | ((values == acc) & (idx < acc_idx))
+        acc[better] = values[better]
+        acc_idx[better] = idx[better]
+
+    @staticmethod
+    def solve_increasing(residual, lower, upper, args=(), rtol=1e-10, max_iter=100):
+        """
+        Finds where increasing residual functions cross zero, for many independent brackets at once.
+
+        Uses the Illinois variant of regula falsi, which falls back to bisection for steps that would leave the
+        bracket. The brackets keep residual(lower) < 0 <= residual(upper), so the returned upper ends always satisfy
+        residual >= 0. Each bracket is refined until it is narrower than rtol and then dropped from the batch, so
+        the result of a bracket does not depend on the other brackets it is solved with.
+
+        Args:
+            residual (callable): residual(x, *args) maps 1D arrays of points and arguments to residuals.
+            lower (numpy.ndarray): The 1D array of lower ends. Closed brackets with lower == upper are left alone.
+            upper (numpy.ndarray): The 1D array of upper ends.
+            args (tuple): Extra arguments of residual, 1D arrays aligned with lower or scalars.
+            rtol (float): The bracket width at which a bracket counts as converged.
+            max_iter (int): The maximum number of steps per bracket.
+
+        Returns:
+            numpy.ndarray: The upper ends of the brackets.
+        """
+        result = np.array(upper, dtype=float)
+        active = np.flatnonzero(upper - lower > rtol)
+        args = [arg[active] if np.ndim(arg) else arg for arg in args]
+        lower, upper = lower[active], upper[active]
+        f_lower, f_upper = residual(lower, *args), residual(upper, *args)
+        side = np.zeros(len(active), dtype=np.int8)
+        for _ in range(max_iter):
+            if len(active) == 0:
+                break
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = upper - f_upper * (upper - lower) / (f_upper - f_lower)
+            x = np.where((x > lower) & (x < upper), x, (lower + upper) / 2)
+            f_x = residual(x, *args)
+            enough = f_x >= 0
+            # Halve the residual of an end that stayed put twice in a row so it moves next time
+            f_lower = np.where(enough & (side == 1), f_lower / 2, f_lower)
+            f_upper = np.where(~enough & (side == -1), f_upper / 2, f_upper)
+            upper, f_upper = np.where(enough, x, upper), np.where(enough, f_x, f_upper)
+            lower, f_lower = np.where(enough, lower, x), np.where(enough, f_lower, f_x)
+            side = np.where(enough, 1, -1).astype(np.int8)
+
+            result[active] = upper
+            keep = upper - lower > rtol
+            if not keep.all():
+                active, lower, upper, f_lower, f_upper, side = \
+                    [array[keep] for array in (active, lower, upper, f_lower, f_upper, side)]
+                args = [arg[keep] if np.ndim(arg) else arg for arg in args]
+        return result
+
+    @staticmethod
+    def map_tasks(func, tasks, workers=None):
+        """
+        Yields func(*args) for every args tuple of tasks, in order.
+
+        With workers > 1 the calls run in a concurrent.futures process pool. The 'fork' start method is used where
+        the platform offers it, so the workers inherit the engine and tank catalogs that are already loaded in this
+        process as shared read-only memory instead of parsing the CSV files again. Elsewhere the workers import the
+        Stages modules themselves, so the calling script needs an if __name__ == "__main__" guard.
+
+        Args:
+            func (callable): A picklable function, e.g. a classmethod of a RocketStage subclass.
+            tasks (list): The argument tuples.
+            workers (int): The number of worker processes. None or 1 runs the calls in this process.
+        """
+        if workers is None or workers <= 1:
+            for args in tasks:
+                yield func(*args)
+            return
+
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(func, *args) for args in tasks]
+            for future in futures:
+                yield future.result()
+
+    @staticmethod
+    def make_grid(pl_span, dv_span, span):
+        """
+        make_grid returns the log spaced payload axis and the linearly spaced delta-v axis of a sweep.
+        """
+        pl = np.logspace(np.log10(pl_span[0]), np.log10(pl_span[1]), span)
+        dv = np.linspace(dv_span[0], dv_span[1], span)
+        return pl, dv
+
+    @staticmethod
+    def tiles(span, tile_size=None):
+        """
+        Yields (dv_slice, pl_slice) pairs covering a span x span grid in tiles of tile_size x tile_size points.
+        """
+        if tile_size is None:
+            tile_size = span
+        for i in range(0, span, tile_size):
+            for j in range(0, span, tile_size):
+                yield slice(i, min(i + tile_size, span)), slice(j, min(j + tile_size, span))
 
     @staticmethod
     def count_rep(reps, max_count):
@@ -150,9 +1178,30 @@ class RocketStage:
     def _forward_data_generator(cls, eng, flight_cond, pl_array, m100_array, n_eng_max):
         raise NotImplementedError(f"""forward_data_generator function is not implemented for {cls.__class__}""")
 
+    @classmethod
+    def _forward_derivative(cls, eng, flight_cond, pl_array, m100_array, n_eng_max):
+        raise NotImplementedError(f"""_forward_derivative function is not implemented for {cls.__class__}""")
+
+    @classmethod
+    def _forward_dv_limit(cls, eng, flight_cond, n_eng_max):
+        raise NotImplementedError(f"""_forward_dv_limit function is not implemented for {cls.__class__}""")
+
     @classmethod
     def iterative_forward_optimizer(cls, eng, flight_cond, pl_bounds, dv_bounds, span, n_eng_max, max_iter=10,
-                                    min_error=1e-1):
+                                    min_error=1e-1, method='finite_difference', return_info=False):
+        """
+        Inverts _forward_data_generator: finds the tank mass m100 that gives each delta-v of a pl/dv grid.
+
+        Args:
+            method (str): 'finite_difference' runs the original solver, which steps every cell with a finite
+                difference derivative until the mean squared error drops below min_error. 'newton' runs
+                _newton_forward_optimizer, which uses the closed-form derivative and only updates unconverged cells.
+            return_info (bool): Also return a dict with the per-cell 'iterations', 'residual' (m/s), 'converged' and
+                'feasible' arrays. Only supported by the 'newton' method.
+
+        Returns:
+            tuple: dv_array and m100_array of shape (span, span, n_eng_max) and pl_array of shape (span, span).
+        """
         pl = np.logspace(np.log10(pl_bounds[0]), np.log10(pl_bounds[1]), span)
         dv = np.linspace(dv_bounds[0], dv_bounds[1], span)
 
@@ -162,6 +1211,17 @@ class RocketStage:
         dv_array = np.expand_dims(dv_array, 2)
         dv_array = np.tile(dv_array, (1, 1, n_eng_max))
 
+        if method == 'newton':
+            m100_array, info = cls._newton_forward_optimizer(eng, flight_cond, pl_array, dv_array, n_eng_max,
+                                                             max_iter, min_error)
+            if return_info:
+                return dv_array, pl_array, m100_array, info
+            return dv_array, pl_array, m100_array
+        elif method != 'finite_difference':
+            raise NotImplementedError(f"Unknown iterative solver method {method}")
+        elif return_info:
+            raise NotImplementedError("return_info is only supported by the 'newton' method")
+
         m100_array = np.expand_dims(m100_array, 2)
         m100_array = np.tile(m100_array, (1, 1, n_eng_max))
 
@@ -187,36 +1247,85 @@ class RocketStage:
         return dv_array, pl_array, m100_array
 
     @classmethod
-    def plotDVPLDiagram(cls, min_tot_idx, all_engines, all_quant_engines, pl, dv, filename, condition, twr_req):
-        max_eng_num = np.max(min_tot_idx)
-        cmap = rand_cmap(max_eng_num, type='bright', first_color_black=False, last_color_black=False, verbose=False)
-        plt.figure(figsize=(10, 10))
-        DVDV, PLPL = np.meshgrid(dv, pl)
-        plt.pcolormesh(DVDV, PLPL, min_tot_idx.transpose(), cmap=cmap)
-        plt.yscale("log")
-        def location_converter(point, dv, pl):
-            transposed = [point[0, 0, 0], point[0, 0, 1]]
-            transposed[0] = dv[transposed[0]]
-            transposed[1] = pl[transposed[1]]
-            return transposed
-
-        for unique_id in np.unique(min_tot_idx):
-            if unique_id == -1:
-                continue
-            #Find Centroid of the set of datapoints
-            points = np.argwhere(min_tot_idx == unique_id)
-            center = np.mean(points, axis=0)
-            nbrs = NearestNeighbors(n_neighbors=1, algorithm='ball_tree').fit(points)
-            nearest_idx = nbrs.kneighbors([center])
-            nearest = location_converter(points[nearest_idx[1], :], dv, pl)
-            plt.scatter(nearest[0], nearest[1], 20, color=cmap(unique_id / max_eng_num), edgecolors='k')
-            plt.text(nearest[0], nearest[1], u"\u2190 " + str(all_quant_engines[unique_id]) + " " + all_engines[unique_id],
-                     rotation=30, rotation_mode='anchor')
-        plt.grid(which='both')
-        plt.xlabel('Delta-V (m/s)')
-        plt.ylabel('Payload (Metric Tons)')
-        plt.title(condition + ' @ TWR: ' + str(twr_req))
-        plt.savefig("plots/" + filename)
+    def _newton_forward_optimizer(cls, eng, flight_cond, pl_array, dv_array, n_eng_max, max_iter, min_error):
+        """
+        Newton solver for dv(m100) = dv_array using the closed-form derivative from _forward_derivative.
+
+        Δv is increasing and concave in m100 and Δv(0) = 0, so Newton steps started at m100 = 0 increase
+        monotonically towards the root without overshooting. Targets at or above the asymptotic limit
+        _forward_dv_limit have no solution; they are marked infeasible and left as NaN. Every iteration evaluates
+        only the (pl, dv) cells that still have an unconverged engine count, and a cell stops updating once its
+        squared error is below min_error.
+
+        Returns:
+            tuple: m100_array of shape (span, span, n_eng_max) and a dict with the per-cell 'iterations' (number of
+            Newton updates), 'residual' (final Δv error in m/s), 'converged' and 'feasible' arrays.
+        """
+        m100_array = np.zeros_like(dv_array)
+        iterations = np.zeros(dv_array.shape, dtype=int)
+        residual = -dv_array.copy()
+
+        feasible = dv_array < cls._forward_dv_limit(eng, flight_cond, n_eng_max)
+        m100_array[~feasible] = np.nan
+        residual[~feasible] = np.nan
+        active = feasible & (residual ** 2 >= min_error)
+
+        for i in range(max_iter + 1):
+            rows, cols = np.nonzero(np.any(active, axis=2))
+            if len(rows) == 0:
+                break
+            pl_sub = pl_array[rows, cols][:, np.newaxis]
+            m100_sub = m100_array[rows, cols][:, np.newaxis, :]
 
+            dv_sub, temp1, temp2 = cls._forward_data_generator(eng, flight_cond, pl_sub, m100_sub, n_eng_max)
+            error = dv_sub[:, 0, :] - dv_array[rows, cols]
+            sub_active = active[rows, cols]
+            residual[rows, cols] = np.where(sub_active, error, residual[rows, cols])
+            sub_active &= error ** 2 >= min_error
+            active[rows, cols] = sub_active
+            if i == max_iter:
+                break
+
+            slope = cls._forward_derivative(eng, flight_cond, pl_sub, m100_sub, n_eng_max)[:, 0, :]
+            m100_array[rows, cols] = np.where(sub_active, m100_sub[:, 0, :] - error / slope, m100_sub[:, 0, :])
+            iterations[rows, cols] += sub_active
+
+        info = {'iterations': iterations,
+                'residual': residual,
+                'converged': feasible & ~active,
+                'feasible': feasible}
+        return m100_array, info
+
+    @classmethod
+    def plotDVPLDiagram(cls, min_tot_idx, all_engines, all_quant_engines, pl, dv, filename, condition, twr_req,
+                        min_label_cells=1, directory='plots'):
+        """
+        Plots the winning configuration index of every grid point and labels every region once.
+
+        Args:
+            min_label_cells (int): Regions covering fewer grid points than this are drawn but not labeled.
+            directory (str): The directory the plot is saved to as filename.
+        """
+        with phase('plot', cells=int(np.size(min_tot_idx))):
+            from matplotlib import pyplot as plt
 
+            max_eng_num = np.max(min_tot_idx)
+            cmap = rand_cmap(max_eng_num, type='bright', first_color_black=False, last_color_black=False, verbose=False)
+            plt.figure(figsize=(10, 10))
+            DVDV, PLPL = np.meshgrid(dv, pl)
+            plt.pcolormesh(DVDV, PLPL, min_tot_idx.transpose(), cmap=cmap)
+            plt.yscale("log")
 
+            # Label each region at its cell closest to the region centroid
+            labels, points, sizes = region_label_points(min_tot_idx, ignore=-1, min_size=min_label_cells)
+            for unique_id, (dv_idx, pl_idx) in zip(labels, points):
+                plt.scatter(dv[dv_idx], pl[pl_idx], 20, color=cmap(unique_id / max_eng_num), edgecolors='k')
+                plt.text(dv[dv_idx], pl[pl_idx], u"\u2190 " + str(all_quant_engines[unique_id]) + " " +
+                         all_engines[unique_id], rotation=30, rotation_mode='anchor')
+            plt.grid(which='both')
+            plt.xlabel('Delta-V (m/s)')
+            plt.ylabel('Payload (Metric Tons)')
+            if not isinstance(condition, str):
+                condition = f'{condition:g} atm'
+            plt.title(condition + ' @ TWR: ' + str(twr_req))
+            plt.savefig(os.path.join(directory, filename))
@@ -0,0 +1,327 @@
+import numpy as np
+from MapCache import MapCache
+from profiling import phase
+
+
+class SurrogateTable:
+    """
+    Precomputed lookup table that answers optimize_point queries of a stage class without solving every
+    configuration.
+
+    The table solves every configuration once on the vertices of a log-payload x delta-v grid. For every grid cell it
+    keeps the configurations that can win somewhere inside the cell, together with their values at the four corners.
+    A query locates its cell and re-solves candidates exactly with the stage class, so every returned stage has its
+    exact mass and cost. This takes a fraction of a millisecond per query, only lookup, which solves nothing and is not
+    exact, answers in microseconds.
+
+    Minimum mass queries are exact. They rank the candidates by bilinear interpolation and re-solve the top_k, the
+    remaining candidates are only solved if their lower bound does not rule them out. The bounds use that the mass of
+    every configuration grows with the payload and the delta-v, and that a configuration that is infeasible at a point
+    is infeasible for every larger payload and delta-v.
+
+    Minimum cost queries solve every candidate of the cell, and top_k does not apply. The cost does not always grow:
+    it drops where a larger fuel tank is cheaper per ton of structure, so the corners don't bound it. With the default
+    cost_slack=1 every feasible configuration stays a cost candidate and cost queries are exact, but they save little
+    over stage_class.optimize_point. cost_slack=None lowers the cost bounds by twice the largest drop seen between
+    neighbouring vertices of the table instead. This is a heuristic, not a bound: it prunes most candidates, but a
+    member of the Pareto set whose cost drops further inside a cell can be missed.
+
+    Example:
+        >>> table = SurrogateTable.for_stage(LinearStage, [0.1, 300], [100, 20000], 3, 'asl', 1.5)
+        >>> stages = table.optimize_point(5, 3400, 'mass')
+
+    Attributes:
+    -----------
+    pl: numpy.ndarray
+        The payload of the grid vertices, log spaced.
+    dv: numpy.ndarray
+        The delta-v of the grid vertices, linearly spaced.
+    candidates: dict
+        'mass' and 'cost' hold the candidates of every cell in CSR form: the candidates of cell (i, j) are
+        [offsets[k]:offsets[k + 1]] with k = i * (len(pl) - 1) + j, 'columns' holds their configuration indices,
+        'corners' their values at the corners (i, j), (i + 1, j), (i, j + 1), (i + 1, j + 1) and 'lower' their lower
+        bound on the cell. The 'cost' candidates are the possible members of the (cost, mass) Pareto set.
+    cost_slack: float
+        The relative margin of the lower cost bounds, a heuristic unless it is 1.
+    """
+    _tables = {}
+
+    def __init__(self, stage_class, pl_span, dv_span, max_eng_quant, asl_or_vac, TWR_req, pl_points=257,
+                 dv_points=257, top_k=3, cost_slack=1, band_size=8):
+        """
+        Args:
+            stage_class (type): The RocketStage subclass whose optimize_point the table answers.
+            pl_span (list): The payload range of the table in tons.
+            dv_span (list): The delta-v range of the table in m/s.
+            pl_points (int): The number of payload vertices.
+            dv_points (int): The number of delta-v vertices.
+            top_k (int): The number of minimum mass candidates that are re-solved before the lower bounds are
+                checked.
+            cost_slack (float): The relative margin of the lower cost bounds. 1 makes minimum cost queries exact.
+                None opts into the heuristic margin of twice the largest relative cost drop between neighbouring
+                vertices of the table, see the class docstring.
+            band_size (int): The number of delta-v rows solved at a time, which bounds the peak memory.
+        """
+        self.stage_class = stage_class
+        self.max_eng_quant = max_eng_quant
+        self.asl_or_vac = asl_or_vac
+        self.TWR_req = TWR_req
+        self.top_k = top_k
+        self.pl = np.logspace(np.log10(pl_span[0]), np.log10(pl_span[1]), pl_points)
+        self.dv = np.linspace(dv_span[0], dv_span[1], dv_points)
+        self._log_pl = np.log(self.pl)
+        with phase('surrogate_build', cells=(pl_points - 1) * (dv_points - 1)):
+            self.cost_slack, self.candidates = self.build(cost_slack, band_size)
+
+    @classmethod
+    def for_stage(cls, stage_class, pl_span, dv_span, max_eng_quant, asl_or_vac, TWR_req, **kwargs):
+        """
+        Returns the table of these parameters, building it on first use. Tables are kept for the life of the process,
+        so repeated calls with the same parameters only hash the catalog. A table is rebuilt once the catalogs it was
+        solved from have changed, e.g. after an engine was toggled and RocketStage.reload_catalogs was called.
+        """
+        key = (stage_class, tuple(pl_span), tuple(dv_span), max_eng_quant, asl_or_vac, TWR_req,
+               tuple(sorted(kwargs.items())))
+        catalog = MapCache.hash_catalog(stage_class)
+        if key not in cls._tables or cls._tables[key][0] != catalog:
+            cls._tables[key] = catalog, cls(stage_class, pl_span, dv_span, max_eng_quant, asl_or_vac, TWR_req,
+                                            **kwargs)
+        return cls._tables[key][1]
+
+    def solve_vertices(self, dv):
+        """
+        Solves every configuration on the vertices of some delta-v rows.
+
+        Returns:
+            tuple: m_tot and costs arrays of shape (len(dv), len(self.pl), n_columns), np.inf where infeasible.
+        """
+        n_columns = len(self.stage_class.configuration_labels(self.max_eng_quant)[0])
+        # Passing every column explicitly also disables the incumbent pruning of BoostedStage, whose pruned columns
+        # would otherwise be np.inf instead of their true values
+        blocks = list(self.stage_class._configuration_blocks(dv[:, np.newaxis, np.newaxis],
+                                                             self.pl[np.newaxis, :, np.newaxis], self.max_eng_quant,
+                                                             self.asl_or_vac, self.TWR_req,
+                                                             columns=np.arange(n_columns)))
+        m_tot = np.concatenate([block[0] for block in blocks], axis=2)
+        costs = np.concatenate([block[1] for block in blocks], axis=2)
+        return m_tot, costs
+
+    def build(self, cost_slack, band_size):
+        """
+        Solves the vertices band by band and collects the candidates of every cell.
+
+        Returns:
+            tuple: The cost slack and the candidates dict, see the class attributes.
+        """
+        bands = []
+        previous = None
+        largest_drop = 0.0
+        for start in range(0, len(self.dv), band_size):
+            m_tot, costs = self.solve_vertices(self.dv[start:start + band_size])
+            if previous is not None:
+                # Neighbouring bands share one row of vertices
+                m_tot = np.concatenate((previous[0][-1:], m_tot))
+                costs = np.concatenate((previous[1][-1:], costs))
+            largest_drop = max(largest_drop, self.largest_relative_drop(costs))
+            if len(m_tot) > 1:
+                bands.append((self.corners(m_tot), self.corners(costs)))
+            previous = m_tot, costs
+
+        if cost_slack is None:
+            cost_slack = min(2 * largest_drop, 1.0)
+
+        candidates = {'mass': [], 'cost': []}
+        for mass_corners, cost_corners in bands:
+            mass_lower = np.min(mass_corners, axis=-1)
+            mass_upper = np.max(mass_corners, axis=-1)
+            cost_lower = np.min(cost_corners, axis=-1)
+            # Infeasible configurations keep np.inf, also for cost_slack=1
+            np.multiply(cost_lower, 1 - cost_slack, out=cost_lower, where=np.isfinite(cost_lower))
+            cost_upper = np.max(cost_corners, axis=-1)
+            # A configuration can only have the minimum mass if its lower bound is below every upper bound
+            is_mass_candidate = np.isfinite(mass_lower) & \
+                (mass_lower <= np.min(mass_upper, axis=-1, keepdims=True))
+            is_cost_candidate = np.isfinite(mass_lower) & \
+                ~self.surely_dominated(mass_lower, cost_lower, mass_upper, cost_upper)
+            candidates['mass'].append(self.sparse(is_mass_candidate, mass_corners, mass_lower))
+            candidates['cost'].append(self.sparse(is_cost_candidate, cost_corners, cost_lower))
+
+        for min_type, parts in candidates.items():
+            counts = np.concatenate([part[0] for part in parts])
+            candidates[min_type] = {'offsets': np.concatenate(([0], np.cumsum(counts))),
+                                    'columns': np.concatenate([part[1] for part in parts]),
+                                    'corners': np.concatenate([part[2] for part in parts]),
+                                    'lower': np.concatenate([part[3] for part in parts])}
+        return cost_slack, candidates
+
+    @staticmethod
+    def corners(values):
+        """
+        Stacks the values at the four corners of every cell of a band of vertices along a new last axis.
+        """
+        return np.stack((values[:-1, :-1], values[1:, :-1], values[:-1, 1:], values[1:, 1:]), axis=-1)
+
+    @staticmethod
+    def largest_relative_drop(costs):
+        """
+        Returns the largest relative decrease of a cost from a vertex to its neighbour with the next larger payload
+        or delta-v. Zero costs, e.g. of the free KSP2 tanks and fuels, can't decrease and are skipped.
+        """
+        largest = 0.0
+        for lower, upper in [(costs[:-1], costs[1:]), (costs[:, :-1], costs[:, 1:])]:
+            finite = np.isfinite(lower) & np.isfinite(upper) & (lower > 0)
+            if np.any(finite):
+                largest = max(largest, float(np.max(1 - upper[finite] / lower[finite])))
+        return largest
+
+    @staticmethod
+    def surely_dominated(mass_lower, cost_lower, mass_upper, cost_upper):
+        """
+        Marks the configurations of every cell that some other configuration dominates everywhere in the cell,
+        because its upper bounds are strictly below their lower bounds. These can never be part of a Pareto set.
+
+        Args:
+            mass_lower (numpy.ndarray): The bounds with the configurations along the last axis.
+
+        Returns:
+            numpy.ndarray: A boolean array with the shape of the bounds.
+        """
+        shape = mass_lower.shape
+        n_columns = shape[-1]
+        mass_lower, cost_lower, mass_upper, cost_upper = [np.reshape(bound, (-1, n_columns)) for bound in
+                                                          (mass_lower, cost_lower, mass_upper, cost_upper)]
+        # The lowest upper cost bound among the configurations with the k smallest upper mass bounds
+        order = np.argsort(mass_upper, axis=1, kind='stable')
+        sorted_mass_upper = np.take_along_axis(mass_upper, order, axis=1)
+        prefix_cost_upper = np.minimum.accumulate(np.take_along_axis(cost_upper, order, axis=1), axis=1)
+
+        # The number of upper mass bounds strictly below every lower mass bound, a searchsorted per row
+        merged = np.concatenate((mass_lower, sorted_mass_upper), axis=1)
+        merged_order = np.argsort(merged, axis=1, kind='stable')
+        is_upper = merged_order >= n_columns
+        below = np.cumsum(is_upper, axis=1) - is_upper
+        count = np.empty_like(mass_lower, dtype=np.intp)
+        rows = np.broadcast_to(np.arange(len(merged))[:, np.newaxis], merged.shape)
+        lower_entries = ~is_upper
+        count[rows[lower_entries], merged_order[lower_entries]] = below[lower_entries]
+
+        best_cost = np.concatenate((np.full((len(count), 1), np.inf), prefix_cost_upper), axis=1)
+        dominated = np.take_along_axis(best_cost, count, axis=1) < cost_lower
+        return np.reshape(dominated, shape)
+
+    @staticmethod
+    def sparse(mask, corners, lower):
+        """
+        Returns the candidate counts of every cell and the columns, corner values and lower bounds of the candidates.
+        """
+        counts = np.count_nonzero(mask, axis=-1).ravel()
+        index = np.nonzero(mask)
+        return counts, index[-1].astype(np.int32), corners[index], lower[index]
+
+    def locate(self, pl, dv):
+        """
+        Returns the cell indices and the fractional positions of points inside their cells. Points outside the table
+        get the cell index -1.
+        """
+        pl = np.asarray(pl, dtype=float)
+        dv = np.asarray(dv, dtype=float)
+        log_pl = np.log(pl)
+        i = np.clip(np.searchsorted(self.dv, dv, side='right') - 1, 0, len(self.dv) - 2)
+        j = np.clip(np.searchsorted(self._log_pl, log_pl, side='right') - 1, 0, len(self.pl) - 2)
+        s = (dv - self.dv[i]) / (self.dv[i + 1] - self.dv[i])
+        t = (log_pl - self._log_pl[j]) / (self._log_pl[j + 1] - self._log_pl[j])
+        inside = (dv >= self.dv[0]) & (dv <= self.dv[-1]) & (pl >= self.pl[0]) & (pl <= self.pl[-1])
+        cell = np.where(inside, i * (len(self.pl) - 1) + j, -1)
+        return cell, s, t
+
+    @staticmethod
+    def interpolate(corners, s, t):
+        """
+        Interpolates the corner values bilinearly. Infeasible corners count as the largest feasible corner, so
+        configurations that turn infeasible inside a cell are ranked optimistically.
+        """
+        finite = np.isfinite(corners)
+        largest = np.max(np.where(finite, corners, -np.inf), axis=-1, keepdims=True)
+        corners = np.where(finite, corners, largest)
+        weights = np.stack(((1 - s) * (1 - t), s * (1 - t), (1 - s) * t, s * t), axis=-1)
+        return np.sum(corners * weights, axis=-1)
+
+    def lookup(self, pl, dv, min_type='mass'):
+        """
+        Predicts the minimum mass or minimum cost configuration of many points from the table alone, without solving
+        anything.
+
+        Returns:
+            tuple: The predicted configuration index of every point, -1 where no configuration is feasible or the point
+            is outside the table, and a boolean array that is True where the prediction is certainly exact because the
+            cell has a single candidate that is feasible in the whole cell, or none at all. Minimum cost predictions
+            are never marked exact.
+        """
+        table = self.candidates[min_type]
+        cell, s, t = self.locate(np.atleast_1d(pl), np.atleast_1d(dv))
+        safe_cell = np.maximum(cell, 0)
+        starts = table['offsets'][safe_cell]
+        counts = np.where(cell >= 0, table['offsets'][safe_cell + 1] - starts, 0)
+        winners = np.full(len(cell), -1, dtype=np.intp)
+        has_candidates = counts > 0
+        # Interpolate every candidate of every point, then reduce per point
+        owner = np.repeat(np.arange(len(cell)), counts)
+        entries = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        predicted = self.interpolate(table['corners'][entries], s[owner], t[owner])
+        order = np.lexsort((predicted, owner))
+        first = np.cumsum(counts[has_candidates]) - counts[has_candidates]
+        winners[has_candidates] = table['columns'][entries[order[first]]]
+        # A single candidate is certainly the winner if it is feasible in the whole cell, i.e. at its upper corner
+        exact = np.zeros(len(cell), dtype=bool)
+        if min_type == 'mass' and len(table['columns']):
+            exact = (counts == 1) & np.isfinite(table['corners'][np.minimum(starts, len(table['columns']) - 1), 3])
+        return winners, exact | (cell >= 0) & (counts == 0)
+
+    def optimize_point(self, pl, dv, min_type='mass'):
+        """
+        Optimizes a rocket stage for a given point, with the same result as stage_class.optimize_point. With
+        cost_slack=None, min_type='cost' can miss Pareto members, see the class docstring.
+        Points outside the table are solved directly by the stage class.
+
+        Returns:
+            list: The optimized rocket stages, see RocketStage.points_to_stages.
+        """
+        if min_type not in ('mass', 'cost'):
+            raise NotImplementedError("Optimization is only implemented for mass or cost")
+        cell, s, t = self.locate(pl, dv)
+        cell = int(cell)
+        if cell < 0:
+            return self.stage_class.optimize_point(pl, dv, self.max_eng_quant, self.asl_or_vac, self.TWR_req,
+                                                   min_type)
+        table = self.candidates[min_type]
+        entries = slice(table['offsets'][cell], table['offsets'][cell + 1])
+        columns = table['columns'][entries]
+        if len(columns) == 0:
+            return []
+        if min_type == 'cost':
+            # If the cost bounds hold, every member of the Pareto set is among the candidates, and every other
+            # configuration is dominated by a member, so the Pareto set of the candidates is the full Pareto set
+            return self.solve(pl, dv, min_type, columns)
+
+        lower = table['lower'][entries]
+        order = np.argsort(self.interpolate(table['corners'][entries], s, t), kind='stable')
+        verified = order[:self.top_k]
+        points = self.solve_points(pl, dv, min_type, columns[verified])
+        if points['engine_idx'][0] >= 0:
+            best, best_column = points['mass'][0], points['engine_idx'][0]
+            # Ties keep the lower configuration index, so an unverified candidate can still win on a tie
+            rest = order[self.top_k:]
+            rest = rest[(lower[rest] < best) | (lower[rest] == best) & (columns[rest] < best_column)]
+        else:
+            rest = order[self.top_k:]
+        if len(rest):
+            points = self.solve_points(pl, dv, min_type, columns[np.concatenate((verified, rest))])
+        return self.stage_class.points_to_stages(points, 0)
+
+    def solve(self, pl, dv, min_type, columns):
+        return self.stage_class.points_to_stages(self.solve_points(pl, dv, min_type, columns), 0)
+
+    def solve_points(self, pl, dv, min_type, columns):
+        with phase('surrogate_verify', columns=len(columns)):
+            return self.stage_class.optimize_points([pl], [dv], self.max_eng_quant, self.asl_or_vac, self.TWR_req,
+                                                    min_type=min_type, columns=columns)
@@ -0,0 +1,278 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+FORMATS = ('npz', 'npy', 'parquet')
+FIELDS = {'mass': ['min_mtot', 'min_mtot_idx'],
+          'cost': ['min_costs', 'min_costs_idx'],
+          'both': ['min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']}
+DEFAULTS = {'dataset': 'KSP1', 'pl_span': [0.1, 300], 'dv_span': [100, 20000], 'span': 500, 'max_eng_quant': 1,
+            'asl_or_vac': 'vac', 'TWR_req': 1.0, 'min_type': 'both', 'adaptive': False, 'coarse_step': 16}
+
+
+def stage_class(dataset):
+    """
+    Returns the stage class that solves the sweeps of a dataset, KSP1 or KSP2.
+    """
+    from Stages.LinearStage import LinearStage, LinearStageKSP2
+    datasets = {'KSP1': LinearStage, 'KSP2': LinearStageKSP2}
+    if dataset not in datasets:
+        raise ValueError(f'Unknown dataset {dataset!r}, expected one of {sorted(datasets)}')
+    return datasets[dataset]
+
+
+def warm_catalogs():
+    for dataset in ('KSP1', 'KSP2'):
+        stage_class(dataset).load_catalogs()
+
+
+def load_jobs(path):
+    """
+    Reads a job file.
+
+    The job file is JSON, either a list of sweeps or {"defaults": {...}, "sweeps": [...]}. Every sweep is a dict of
+    name, dataset ('KSP1' or 'KSP2'), pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req, min_type ('mass',
+    'cost' or 'both', the maps that are written), adaptive and coarse_step. Missing keys are taken from the file's
+    defaults and then from DEFAULTS, a missing name is generated from the position of the sweep.
+
+    Example:
+        {"defaults": {"span": 1000, "max_eng_quant": 3},
+         "sweeps": [{"name": "ksp1_vac", "asl_or_vac": "vac", "TWR_req": 1.5},
+                    {"name": "ksp2_asl", "dataset": "KSP2", "asl_or_vac": "asl", "min_type": "cost"}]}
+
+    Returns:
+        list: The sweeps with every key filled in.
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'sweeps': spec}
+    defaults = {**DEFAULTS, **spec.get('defaults', {})}
+
+    jobs = []
+    for i, sweep in enumerate(spec['sweeps']):
+        job = {'name': f'sweep_{i:04d}', **defaults, **sweep}
+        unknown = set(job) - set(DEFAULTS) - {'name'}
+        if unknown:
+            raise ValueError(f'Unknown keys {sorted(unknown)} in sweep {job["name"]!r}')
+        if job['min_type'] not in FIELDS:
+            raise ValueError(f'min_type of sweep {job["name"]!r} must be one of {sorted(FIELDS)}')
+        stage_class(job['dataset'])
+        jobs.append(job)
+
+    names = [job['name'] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError('The sweep names must be unique, they name the output files')
+    return jobs
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError('Parquet output requires pyarrow, install it with "pip install pyarrow" or use '
+                          '--format npz or npy') from e
+    return pyarrow
+
+
+def output_path(out_dir, job, fmt):
+    # npy writes one file per array, so its output is a directory
+    return os.path.join(out_dir, job['name'] + ('' if fmt == 'npy' else '.' + fmt))
+
+
+def solve_job(job, cache_dir=None):
+    """
+    Solves the map of one sweep, see RocketStage.optimize_map and optimize_map_adaptive.
+    """
+    from MapCache import MapCache
+    cls = stage_class(job['dataset'])
+    args = (job['pl_span'], job['dv_span'], job['span'], job['max_eng_quant'], job['asl_or_vac'], job['TWR_req'])
+    cache = MapCache(cache_dir) if cache_dir is not None else None
+    if job['adaptive']:
+        return cls.optimize_map_adaptive(*args, coarse_step=job['coarse_step'], cache=cache)
+    return cls.optimize_map(*args, cache=cache)
+
+
+def write_npz(path, maps, fields):
+    np.savez(path, pl=maps['pl'], dv=maps['dv'], engines=maps['engines'], quant_engines=maps['quant_engines'],
+             **{name: maps[name] for name in fields})
+    return [path]
+
+
+def write_npy(path, maps, fields):
+    """
+    Writes every array to its own .npy file, which np.load(..., mmap_mode='r') opens without reading it into memory.
+    """
+    os.makedirs(path, exist_ok=True)
+    files = []
+    for name in ['pl', 'dv', 'engines', 'quant_engines'] + fields:
+        files.append(os.path.join(path, name + '.npy'))
+        np.save(files[-1], np.asarray(maps[name]))
+    return files
+
+
+def write_parquet(path, maps, fields):
+    """
+    Writes the map as a table with one row per grid point, in the [dv, pl] order of the arrays. The configuration
+    labels are stored in the schema metadata under b'engines' and b'quant_engines'.
+    """
+    pa = require_pyarrow()
+    dv, pl = np.meshgrid(maps['dv'], maps['pl'], indexing='ij')
+    columns = {'dv': dv.ravel(), 'pl': pl.ravel(), **{name: maps[name].ravel() for name in fields}}
+    metadata = {name: json.dumps(np.asarray(maps[name]).tolist()) for name in ('engines', 'quant_engines')}
+    table = pa.table(columns).replace_schema_metadata(metadata)
+    pa.parquet.write_table(table, path)
+    return [path]
+
+
+WRITERS = {'npz': write_npz, 'npy': write_npy, 'parquet': write_parquet}
+
+
+def write_atomically(path, writer, maps, fields):
+    """
+    Writes the output of a sweep next to path and moves it into place once it is complete, so an interrupted write
+    never leaves a partial output at path that a resumed batch would skip. Every call writes into its own temporary
+    directory, so sweeps with the same output don't write into each other.
+
+    Returns:
+        list: The written files, as the writer returns them for path.
+    """
+    directory, name = os.path.split(path)
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix='.' + name + '.', suffix='.tmp')
+    try:
+        tmp_path = os.path.join(tmp_dir, name)
+        files = writer(tmp_path, maps, fields)
+        if os.path.isdir(path):
+            # npy output is a directory, which os.replace can't replace
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return [path + file[len(tmp_path):] for file in files]
+
+
+def run_job(job, out_dir, fmt, cache_dir=None):
+    """
+    Solves one sweep and writes its maps to out_dir, so the worker never sends the grid back.
+
+    Returns:
+        dict: The manifest entry of the sweep.
+    """
+    t0 = time.perf_counter()
+    maps = solve_job(job, cache_dir)
+    solve_time = time.perf_counter() - t0
+    fields = FIELDS[job['min_type']]
+    files = write_atomically(output_path(out_dir, job, fmt), WRITERS[fmt], maps, fields)
+    return {'job': job,
+            'status': 'done',
+            'format': fmt,
+            'files': [os.path.relpath(file, out_dir) for file in files],
+            'fields': fields,
+            'shape': list(maps[fields[0]].shape),
+            'solve_time': solve_time,
+            'write_time': time.perf_counter() - t0 - solve_time}
+
+
+def write_manifest(out_dir, entries):
+    path = os.path.join(out_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'sweeps': entries}, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def run_batch(jobs, out_dir, fmt='npz', workers=None, cache_dir=None, overwrite=False):
+    """
+    Solves every sweep in a process pool and writes each map as soon as it is finished.
+
+    The workers write their own output files and only return a small manifest entry, so at most one map per worker
+    is in memory. The manifest, out_dir/manifest.json, lists every sweep in job order with its parameters, files,
+    array shape and timings and is rewritten after every finished sweep, so an interrupted batch records what it
+    has written. Every output is moved into place once it is complete, and sweeps whose output already exists are
+    skipped unless overwrite is set, which resumes such a batch.
+
+    Args:
+        jobs (list): The sweeps, see load_jobs.
+        out_dir (str): The directory the maps and the manifest are written to.
+        fmt (str): 'npz' for one .npz file per sweep, 'npy' for a directory of memory mappable .npy files per sweep
+            or 'parquet' for one Parquet table per sweep, which requires pyarrow.
+        workers (int): The number of worker processes. None or 1 solves the sweeps in this process.
+        cache_dir (str): Load and store the maps in a MapCache in this directory.
+        overwrite (bool): Solve sweeps whose output already exists again.
+
+    Returns:
+        list: The manifest entries, failed sweeps have status 'failed' and the error message.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {list(WRITERS)}')
+    if fmt == 'parquet':
+        # Fail before solving anything rather than at the first write
+        require_pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+
+    entries = [None] * len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        if not overwrite and os.path.exists(output_path(out_dir, job, fmt)):
+            entries[i] = {'job': job, 'status': 'skipped', 'format': fmt}
+        else:
+            pending.append(i)
+
+    def finish(i, entry):
+        entries[i] = entry
+        print('{:>4}/{} {:<32} {}'.format(sum(e is not None for e in entries), len(jobs), jobs[i]['name'],
+                                          entry['status'] if entry['status'] != 'done' else
+                                          '{:.2f} s'.format(entry['solve_time'] + entry['write_time'])))
+        write_manifest(out_dir, [e for e in entries if e is not None])
+
+    def failed(job, error):
+        return {'job': job, 'status': 'failed', 'format': fmt, 'error': f'{type(error).__name__}: {error}'}
+
+    if workers is None or workers <= 1:
+        for i in pending:
+            try:
+                finish(i, run_job(jobs[i], out_dir, fmt, cache_dir))
+            except Exception as e:
+                finish(i, failed(jobs[i], e))
+    else:
+        # A catalog that can't be built fails here instead of breaking the pool, and forked workers inherit it
+        warm_catalogs()
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=warm_catalogs) as executor:
+            futures = {executor.submit(run_job, jobs[i], out_dir, fmt, cache_dir): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    finish(i, future.result())
+                except Exception as e:
+                    finish(i, failed(jobs[i], e))
+    write_manifest(out_dir, entries)
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solves the sweeps of a job file and writes every map to disk, see '
+                                                 'load_jobs for the job file and run_batch for the output.')
+    parser.add_argument('jobs', help='The JSON job file.')
+    parser.add_argument('--out', default='results', help='The directory the maps and manifest.json are written to.')
+    parser.add_argument('--format', choices=FORMATS, default='npz', help='The file format of the maps.')
+    parser.add_argument('--workers', type=int, help='The number of worker processes, one per CPU by default.')
+    parser.add_argument('--cache', help='Reuse and store the maps in a MapCache in this directory.')
+    parser.add_argument('--overwrite', action='store_true', help='Solve sweeps whose output already exists again.')
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.jobs)
+    entries = run_batch(jobs, args.out, args.format, workers=args.workers or os.cpu_count(), cache_dir=args.cache,
+                        overwrite=args.overwrite)
+    return 1 if any(entry['status'] == 'failed' for entry in entries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
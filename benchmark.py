@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+
+def _stage_classes():
+    from Stages.LinearStage import LinearStage, LinearStageKSP2
+    return LinearStage, LinearStageKSP2
+
+
+def optimize_plot_case(span, max_eng_quant, asl_or_vac='vac', TWR_req=1.0, precision='float64', backend='numpy'):
+    """
+    The solver behind LinearStage.optimize_plot(plot=True). The plot itself is left out so the benchmark
+    does not depend on the matplotlib backend or on a plots directory.
+    """
+    LinearStage, _ = _stage_classes()
+    LinearStage.load_catalogs()
+    return lambda: LinearStage.optimize_map([0.1, 300], [100, 20000], span, max_eng_quant, asl_or_vac, TWR_req,
+                                            precision=precision, backend=backend)
+
+
+def optimize_twr_sweep_case(span, max_eng_quant, n_thresholds):
+    LinearStage, _ = _stage_classes()
+    LinearStage.load_catalogs()
+    TWR_reqs = np.linspace(0, 2, n_thresholds)
+    return lambda: LinearStage.optimize_twr_sweep([0.1, 300], [100, 20000], span, max_eng_quant, 'asl', TWR_reqs)
+
+
+def optimize_pressure_sweep_case(span, max_eng_quant, n_pressures):
+    LinearStage, _ = _stage_classes()
+    LinearStage.load_catalogs()
+    pressures = np.linspace(0, 1, n_pressures)
+    return lambda: LinearStage.optimize_pressure_sweep([0.1, 300], [100, 20000], span, max_eng_quant, pressures, 1.0)
+
+
+def optimize_pareto_map_case(span, max_eng_quant):
+    LinearStage, _ = _stage_classes()
+    LinearStage.load_catalogs()
+    return lambda: LinearStage.optimize_pareto_map([0.1, 300], [100, 20000], span, max_eng_quant, 'vac', 1.0)
+
+
+def optimize_map_sliced_case(span, max_eng_quant, toggle=None):
+    """
+    optimize_map_sliced after a change of the catalog. toggle=None reruns with every slice cached. 'off' disables the
+    Mainsail, so every remaining slice is a hit. 'on' enables it, so only its slices are solved, and deletes them
+    again afterwards. The toggles include rebuilding the catalogs. The other slices are solved in the setup.
+    """
+    import glob
+    import tempfile
+    from MapCache import SliceCache
+    LinearStage, _ = _stage_classes()
+    # A subclass with its own allowed_engines, so the toggles don't change the catalog of the other benchmarks
+    stage = type('ToggledStage', (LinearStage,), {'allowed_engines': dict(LinearStage.allowed_engines)})
+    stage.allowed_engines['Mainsail'] = toggle != 'on'
+    cache = SliceCache(tempfile.mkdtemp(prefix='slices_'))
+    args = ([0.1, 300], [100, 20000], span, max_eng_quant, 'vac', 1.0, cache)
+    stage.optimize_map_sliced(*args)
+    cached = set(glob.glob(os.path.join(cache.directory, '*.npz')))
+
+    def run():
+        if toggle is not None:
+            stage.allowed_engines['Mainsail'] = toggle == 'on'
+            stage.reload_catalogs()
+        stage.optimize_map_sliced(*args)
+        for path in set(glob.glob(os.path.join(cache.directory, '*.npz'))) - cached:
+            os.remove(path)
+    return run
+
+
+def optimize_point_case(max_eng_quant, min_type):
+    LinearStage, _ = _stage_classes()
+    LinearStage.load_catalogs()
+    return lambda: LinearStage.optimize_point(5, 3400, max_eng_quant, 'asl', 1.5, min_type)
+
+
+def surrogate_point_case(max_eng_quant, min_type):
+    """
+    A query of a prebuilt SurrogateTable, the table is built in the setup.
+    """
+    from SurrogateTable import SurrogateTable
+    LinearStage, _ = _stage_classes()
+    table = SurrogateTable.for_stage(LinearStage, [0.1, 300], [100, 20000], max_eng_quant, 'asl', 1.5)
+    return lambda: table.optimize_point(5, 3400, min_type)
+
+
+def pareto_case(n_points, n_objectives):
+    from utils import pareto
+    # A cloud with a frontier of realistic size: most points are dominated, as for the stage options of a cell
+    x = np.random.default_rng(0).lognormal(size=(n_points, n_objectives))
+    return lambda: pareto(x, [-1] * n_objectives)
+
+
+def fuel_tank_case():
+    from FuelTank import FuelTank
+    return FuelTank
+
+
+def setup_engines_case():
+    from Engine import Engine
+    from utils import get_allow_engines
+    allowed = get_allow_engines()
+    return lambda: Engine.setupEngines(allowed)
+
+
+def forward_generator_case(span):
+    LinearStage, _ = _stage_classes()
+    eng = LinearStage.engines[10]
+    return lambda: LinearStage.forward_data_generator(eng, 'vac', [0.1, 300], [0.1, 3000], span, span, 3)
+
+
+def forward_optimizer_case(span, method):
+    LinearStage, _ = _stage_classes()
+    eng = LinearStage.engines[10]
+    return lambda: LinearStage.iterative_forward_optimizer(eng, 'vac', [0.1, 300], [100, 5000], span, 3,
+                                                           method=method)
+
+
+def cold_import_case(module='Stages.LinearStage'):
+    """
+    Imports a module in a fresh interpreter. The time includes the interpreter start up, so compare it against
+    the 'python_startup' case.
+    """
+    command = [sys.executable, '-c', 'import ' + module] if module else [sys.executable, '-c', 'pass']
+    here = os.path.dirname(os.path.abspath(__file__))
+    return lambda: subprocess.run(command, cwd=here, check=True)
+
+
+def get_benchmarks(quick=False):
+    """
+    Returns a dict of benchmark name -> (setup, args). setup(*args) prepares the inputs and returns the function
+    that is timed, so file parsing and catalog building only count where they are the subject of the benchmark.
+    """
+    spans = [100, 300] if quick else [100, 300, 1000]
+    sizes = [1000, 10000] if quick else [1000, 10000, 100000]
+    benchmarks = {}
+    for span in spans:
+        for max_eng_quant in [1, 3]:
+            benchmarks[f'optimize_plot span={span} max_eng_quant={max_eng_quant}'] = \
+                (optimize_plot_case, (span, max_eng_quant))
+    benchmarks[f'optimize_plot span={spans[-1]} max_eng_quant=3 float32'] = \
+        (optimize_plot_case, (spans[-1], 3, 'vac', 1.0, 'float32'))
+    import kernels
+    if kernels.available():
+        benchmarks[f'optimize_plot span={spans[-1]} max_eng_quant=3 numba'] = \
+            (optimize_plot_case, (spans[-1], 3, 'vac', 1.0, 'float64', 'numba'))
+    benchmarks['optimize_twr_sweep span=300 max_eng_quant=3 thresholds=5'] = (optimize_twr_sweep_case, (300, 3, 5))
+    benchmarks['optimize_pressure_sweep span=300 max_eng_quant=3 pressures=5'] = \
+        (optimize_pressure_sweep_case, (300, 3, 5))
+    benchmarks['optimize_pareto_map span=100 max_eng_quant=3'] = (optimize_pareto_map_case, (100, 3))
+    benchmarks['optimize_map_sliced span=300 max_eng_quant=3 cached'] = (optimize_map_sliced_case, (300, 3))
+    for toggle in ['off', 'on']:
+        benchmarks[f'optimize_map_sliced span=300 max_eng_quant=3 toggle {toggle}'] = \
+            (optimize_map_sliced_case, (300, 3, toggle))
+    for min_type in ['mass', 'cost']:
+        benchmarks[f'optimize_point {min_type}'] = (optimize_point_case, (3, min_type))
+        benchmarks[f'SurrogateTable.optimize_point {min_type}'] = (surrogate_point_case, (3, min_type))
+    for n_points in sizes:
+        benchmarks[f'pareto n={n_points} k=2'] = (pareto_case, (n_points, 2))
+        benchmarks[f'pareto n={n_points // 10} k=3'] = (pareto_case, (n_points // 10, 3))
+    benchmarks['FuelTank()'] = (fuel_tank_case, ())
+    benchmarks['Engine.setupEngines'] = (setup_engines_case, ())
+    benchmarks['forward_data_generator span=300'] = (forward_generator_case, (300,))
+    for method in ['finite_difference', 'newton']:
+        benchmarks[f'iterative_forward_optimizer span=100 {method}'] = (forward_optimizer_case, (100, method))
+    benchmarks['python_startup'] = (cold_import_case, (None,))
+    benchmarks['cold import Stages.LinearStage'] = (cold_import_case, ('Stages.LinearStage',))
+    return benchmarks
+
+
+def measure(func, repeat):
+    """
+    Measures the best wall time of repeat calls, then the peak traced memory of one more call. The memory is
+    measured in its own call because tracemalloc slows down the code it traces.
+
+    Returns:
+        dict: 'time' in seconds and 'peak_memory' in bytes.
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time': min(times), 'peak_memory': peak}
+
+
+def compare(results, previous, tolerance, min_change=None):
+    """
+    Returns the list of (name, metric, old, new) that got worse than the previous run by more than tolerance.
+    Differences below min_change are ignored, they are timer and allocator noise.
+    """
+    if min_change is None:
+        min_change = {'time': 1e-3, 'peak_memory': 2 ** 16}
+    regressions = []
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        for metric in ['time', 'peak_memory']:
+            old, new = previous[name][metric], result[metric]
+            if new > old * (1 + tolerance) and new - old > min_change[metric]:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def environment():
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the optimizer hot paths and compares them against the '
+                                                 'previous run stored in the baseline file.')
+    parser.add_argument('--baseline', default='benchmark_baseline.json',
+                        help='The JSON file the previous run is read from and this run is written to.')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of timed calls per benchmark.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='The relative slow down or memory growth that counts as a regression.')
+    parser.add_argument('--filter', default='', help='Only run the benchmarks whose name contains this string.')
+    parser.add_argument('--quick', action='store_true', help='Skip the largest problem sizes.')
+    parser.add_argument('--no-save', action='store_true', help='Do not overwrite the baseline file.')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Overwrite the baseline file even if this run has regressions, to accept them.')
+    args = parser.parse_args(argv)
+
+    previous = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        previous = baseline['results']
+        if baseline.get('environment') != environment():
+            print('Warning: the baseline was recorded in a different environment, timings may not be comparable')
+
+    results = {}
+    print('| {:<56} | {:>10} | {:>12} | {:>8} |'.format('Benchmark', 'Time (s)', 'Peak (MiB)', 'Change'))
+    for name, (setup, setup_args) in get_benchmarks(args.quick).items():
+        if args.filter not in name:
+            continue
+        # tracemalloc only sees this process, so the peak memory of the subprocess benchmarks is not meaningful
+        results[name] = measure(setup(*setup_args), args.repeat)
+        change = ''
+        if name in previous and previous[name]['time'] > 0:
+            change = '{:+.0%}'.format(results[name]['time'] / previous[name]['time'] - 1)
+        print('| {:<56} | {:>10.4f} | {:>12.2f} | {:>8} |'.format(name, results[name]['time'],
+                                                                  results[name]['peak_memory'] / 2 ** 20, change))
+
+    regressions = compare(results, previous, args.tolerance)
+    for name, metric, old, new in regressions:
+        print(f'REGRESSION {name}: {metric} {old:.4g} -> {new:.4g}')
+
+    if regressions and not args.update_baseline:
+        # Saving would make the next run compare against the regressed numbers and hide the regression
+        print('The baseline was not updated, rerun with --update-baseline to accept the new numbers')
+    elif not args.no_save:
+        # Keep the results of benchmarks that were filtered out so a partial run does not lose them
+        with open(args.baseline, 'w') as f:
+            json.dump({'environment': environment(), 'results': {**previous, **results}}, f, indent=2,
+                      sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
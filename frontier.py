@@ -0,0 +1,193 @@
+import numpy as np
+
+
+def pareto_indices(X: np.ndarray, directions: list) -> np.ndarray:
+    """
+    Return the indices of the points in an array that lie on the Pareto frontier.
+
+    The frontier is computed with a sort-and-sweep in O(n log n) for two objectives and with a blocked
+    sort-filter skyline for three or more objectives. The result is identical to the original quadratic loop:
+    every point that is weakly dominated by another point is removed and only the first of several identical
+    points is kept.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        An array of shape (n_samples, n_features) containing the points to evaluate.
+    directions : list
+        The direction of each objective, 1 to maximize it and -1 to minimize it.
+
+    Returns:
+    --------
+    numpy.ndarray
+        A 1D array containing the indices of the non-dominated points in X in ascending order.
+    """
+    costs = X * np.asarray(directions)
+    if np.isnan(costs).any():
+        return _pareto_reference(costs)
+    return np.flatnonzero(_frontier_mask(costs))
+
+
+def pareto_mask(X: np.ndarray, directions: list) -> np.ndarray:
+    """
+    Return a boolean mask that is True for the points of X that lie on the Pareto frontier.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        An array of shape (n_samples, n_features) containing the points to evaluate.
+    directions : list
+        The direction of each objective, 1 to maximize it and -1 to minimize it.
+
+    Returns:
+    --------
+    numpy.ndarray
+        A boolean array of shape (n_samples,).
+    """
+    mask = np.zeros(np.shape(X)[0], dtype=bool)
+    mask[pareto_indices(X, directions)] = True
+    return mask
+
+
+def pareto_mask_batched(X: np.ndarray, directions: list) -> np.ndarray:
+    """
+    Computes many independent Pareto frontiers at once, for example one frontier per grid cell.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        An array of shape (..., n_samples, n_features). Every slice X[i, ..., :, :] is an independent problem.
+    directions : list
+        The direction of each objective, 1 to maximize it and -1 to minimize it.
+
+    Returns:
+    --------
+    numpy.ndarray
+        A boolean array of shape (..., n_samples) that is True for the points on the frontier of their own batch.
+    """
+    costs = X * np.asarray(directions)
+    batch_shape = costs.shape[:-2]
+    costs = np.reshape(costs, (-1,) + costs.shape[-2:])
+
+    if costs.shape[2] == 2:
+        mask = _frontier_mask_2d_batched(costs)
+    else:
+        mask = np.zeros(costs.shape[:2], dtype=bool)
+        for i in range(costs.shape[0]):
+            mask[i] = _frontier_mask(costs[i])
+
+    for i in np.flatnonzero(np.isnan(costs).any(axis=(1, 2))):
+        mask[i] = False
+        mask[i, _pareto_reference(costs[i])] = True
+
+    return np.reshape(mask, batch_shape + costs.shape[1:2])
+
+
+def pareto_batched(X: np.ndarray, directions: list):
+    """
+    Computes many independent Pareto frontiers at once and returns them as ragged arrays.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        An array of shape (n_batches, n_samples, n_features).
+    directions : list
+        The direction of each objective, 1 to maximize it and -1 to minimize it.
+
+    Returns:
+    --------
+    tuple
+        offsets (numpy.ndarray): An array of shape (n_batches + 1,). The frontier of batch i is
+            indices[offsets[i]:offsets[i + 1]].
+        indices (numpy.ndarray): The sample indices of all frontiers, concatenated in batch order.
+    """
+    return mask_to_csr(pareto_mask_batched(X, directions))
+
+
+def mask_to_csr(mask: np.ndarray):
+    """
+    Converts a boolean mask of shape (n_batches, n_samples) to CSR style offsets and flat column indices.
+    """
+    offsets = np.zeros(mask.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.count_nonzero(mask, axis=1), out=offsets[1:])
+    indices = np.nonzero(mask)[1]
+    return offsets, indices
+
+
+def _frontier_mask(costs):
+    if costs.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+    if costs.shape[1] == 2:
+        return _frontier_mask_2d_batched(costs[np.newaxis])[0]
+    return _frontier_mask_nd(costs)
+
+
+def _frontier_mask_2d_batched(costs):
+    """
+    Sort-and-sweep for two maximized objectives on an array of shape (n_batches, n_samples, 2).
+
+    Points are sorted by the first objective, then the second objective, both descending, and then by index.
+    A point is on the frontier when its second objective beats every point before it in that order.
+    """
+    n_batches, n_points = costs.shape[:2]
+    if n_points == 0:
+        return np.zeros((n_batches, 0), dtype=bool)
+    index = np.broadcast_to(np.arange(n_points), (n_batches, n_points))
+    order = np.lexsort((index, -costs[:, :, 1], -costs[:, :, 0]), axis=-1)
+    second = np.take_along_axis(costs[:, :, 1], order, axis=-1)
+    best = np.maximum.accumulate(second, axis=-1)
+
+    keep = np.empty((n_batches, n_points), dtype=bool)
+    keep[:, 0] = True
+    keep[:, 1:] = second[:, 1:] > best[:, :-1]
+
+    mask = np.zeros((n_batches, n_points), dtype=bool)
+    np.put_along_axis(mask, order, keep, axis=-1)
+    return mask
+
+
+def _frontier_mask_nd(costs, block_size=256):
+    """
+    Blocked sort-filter skyline for any number of maximized objectives.
+
+    After a lexicographic descending sort, a point can only be weakly dominated by points that come before it.
+    The sorted points are processed in blocks, and each block is compared against the frontier found so far and
+    against the earlier points of the block itself.
+    """
+    n_points, n_obj = costs.shape
+    keys = [np.arange(n_points)] + [-costs[:, j] for j in range(n_obj - 1, -1, -1)]
+    order = np.lexsort(keys)
+    ordered = costs[order]
+
+    keep = np.zeros(n_points, dtype=bool)
+    frontier = np.empty((0, n_obj), dtype=ordered.dtype)
+    for start in range(0, n_points, block_size):
+        block = ordered[start:start + block_size]
+        dominated = np.zeros(block.shape[0], dtype=bool)
+        if frontier.shape[0]:
+            dominated |= np.any(np.all(frontier[np.newaxis, :, :] >= block[:, np.newaxis, :], axis=2), axis=1)
+        earlier = np.all(block[:, np.newaxis, :] >= block[np.newaxis, :, :], axis=2)
+        dominated |= np.any(np.triu(earlier, 1), axis=0)
+        keep[start:start + block.shape[0]] = ~dominated
+        frontier = np.concatenate((frontier, block[~dominated]), axis=0)
+
+    mask = np.zeros(n_points, dtype=bool)
+    mask[order[keep]] = True
+    return mask
+
+
+def _pareto_reference(costs):
+    """
+    The original quadratic frontier loop on already directed costs. It is kept for inputs that contain NaN, where
+    the result depends on the processing order.
+    """
+    is_efficient = np.arange(costs.shape[0])
+    next_point_index = 0  # Next index in the is_efficient array to search for
+    while next_point_index < len(costs):
+        nondominated_point_mask = np.any(costs > costs[next_point_index], axis=1)
+        nondominated_point_mask[next_point_index] = True
+        is_efficient = is_efficient[nondominated_point_mask]  # Remove dominated points
+        costs = costs[nondominated_point_mask]
+        next_point_index = np.sum(nondominated_point_mask[:next_point_index]) + 1
+
+    return is_efficient
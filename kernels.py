@@ -0,0 +1,99 @@
+"""
+Fused per-cell kernels for the optimizer hot paths.
+
+The NumPy path of LinearStage builds full size arrays for every intermediate of the rocket equation (exp, m100, ms,
+mf, fuel_units, costs, m_tot, TWR0 and the feasibility masks) and streams each of them through memory. The kernels
+here evaluate every configuration of one grid cell in registers and fold it into the running minimum right away, so
+no intermediate array exists. With numba installed they are compiled and the rows of the grid run in parallel;
+without it they are plain Python functions, which give the same results but are only fast enough for tests.
+"""
+import math
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+prange = numba.prange if numba is not None else range
+
+
+def available():
+    """
+    Returns True if numba is installed, so the kernels are compiled.
+    """
+    return numba is not None
+
+
+def jit(func):
+    return numba.njit(parallel=True, cache=True)(func) if numba is not None else func
+
+
+@jit
+def reduce_linear(dv, pl, TWR_req, g, isp, T, eng_mass, eng_cost, built_in_fuel, check_built_in_fuel, empty_fraction,
+                  density, fuel_cost, table_start, table_stop, tank_capacity, tank_cost, min_mtot, min_mtot_idx,
+                  min_costs, min_costs_idx):
+    """
+    Folds every LinearStage configuration of a dv x pl grid into min/argmin accumulators in place.
+
+    The arithmetic follows LinearStage.solve_fuel_type operation by operation, and the tank cost lookup follows
+    FuelTank.best_cost_per_ton_structure with a binary search. Configurations are visited in column order and only
+    replace the minimum when they are strictly better, so ties keep the lower column like RocketStage.running_argmin.
+    math.exp can round the last bit differently than the vectorized np.exp, so the minima agree with the NumPy path
+    to about 1e-15 relative rather than bit for bit, and configurations that close to each other can swap places.
+
+    Args:
+        dv (numpy.ndarray): The delta-v values of the rows.
+        pl (numpy.ndarray): The payload values of the columns.
+        TWR_req (float): The minimum thrust to weight ratio.
+        g (float): The gravity of the specific impulse.
+        isp, T, eng_mass, eng_cost, built_in_fuel (numpy.ndarray): The engine arrays of every configuration, see
+            RocketStage.engine_arrays.
+        check_built_in_fuel (numpy.ndarray): True for configurations that have to fit their fuel in the engine.
+        empty_fraction, density, fuel_cost (numpy.ndarray): The tank and fuel data of every configuration.
+        table_start, table_stop (numpy.ndarray): The slice of tank_capacity and tank_cost of every configuration.
+        tank_capacity, tank_cost (numpy.ndarray): The concatenated FuelTank.cost_table of every fuel type.
+        min_mtot, min_mtot_idx, min_costs, min_costs_idx (numpy.ndarray): The accumulators with shape
+            (len(dv), len(pl)), initialized to np.inf and 0.
+    """
+    for i in prange(len(dv)):
+        for j in range(len(pl)):
+            best_mtot = min_mtot[i, j]
+            best_mtot_idx = min_mtot_idx[i, j]
+            best_costs = min_costs[i, j]
+            best_costs_idx = min_costs_idx[i, j]
+            for k in range(len(isp)):
+                exp = math.exp(dv[i] / (isp[k] * g))
+                m100 = (pl[j] + eng_mass[k]) * (1 - exp) / (empty_fraction[k] * exp - 1)
+                m_tot = m100 + pl[j] + eng_mass[k]
+                TWR0 = T[k] / (m_tot * 9.8)
+                if m100 <= 0 or TWR0 < TWR_req:
+                    continue
+                ms = m100 * empty_fraction[k]
+                mf = m100 - ms
+                fuel_units = mf / density[k]
+                if check_built_in_fuel[k] and built_in_fuel[k] < fuel_units:
+                    continue
+
+                # np.searchsorted(capacities, fuel_units), bounded to the largest tank
+                lo = table_start[k]
+                hi = table_stop[k]
+                if fuel_units != fuel_units:
+                    lo = hi
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if tank_capacity[mid] < fuel_units:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                costs = ms * tank_cost[min(lo, table_stop[k] - 1)] + eng_cost[k] + mf * fuel_cost[k]
+
+                if m_tot < best_mtot:
+                    best_mtot = m_tot
+                    best_mtot_idx = k
+                if costs < best_costs:
+                    best_costs = costs
+                    best_costs_idx = k
+            min_mtot[i, j] = best_mtot
+            min_mtot_idx[i, j] = best_mtot_idx
+            min_costs[i, j] = best_costs
+            min_costs_idx[i, j] = best_costs_idx
@@ -0,0 +1,218 @@
+import json
+import time
+import tracemalloc
+
+# The innermost active Profiler, phase() is a no-op while this is None
+_active = None
+
+
+class _NullPhase:
+    """
+    The phase returned while no Profiler is active. Entering it and updating it do nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, **meta):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, profiler, name, meta):
+        self.profiler = profiler
+        self.record = {'name': name, 'meta': meta}
+
+    def __enter__(self):
+        self.profiler._enter(self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._exit(self.record)
+        return False
+
+    def update(self, **meta):
+        """
+        Adds metadata that is only known inside the phase, e.g. the size of the arrays it created.
+        """
+        self.record['meta'].update(meta)
+
+
+def phase(name, **meta):
+    """
+    Marks a phase of the computation for the active Profiler.
+
+    Example:
+        >>> with phase('rocket_equation', fuel_type='LFOX') as p:
+        ...     m_tot = ...
+        ...     p.update(nbytes=m_tot.nbytes)
+
+    Args:
+        name (str): The name of the phase. Phases with the same name are aggregated in the report.
+        **meta: Metadata stored with the phase, e.g. the fuel type or the number of grid cells.
+
+    Returns:
+        A context manager. While no Profiler is active it is a shared no-op object, so instrumented code only pays
+        for one function call and one global lookup per phase.
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _Phase(_active, name, meta)
+
+
+def nbytes(*arrays):
+    """
+    Returns the total number of bytes of numpy arrays, ignoring scalars.
+    """
+    return sum(getattr(array, 'nbytes', 0) for array in arrays)
+
+
+class Profiler:
+    """
+    Records the wall time, metadata and optionally the memory of every phase() entered while it is active.
+
+    Phases run in worker processes (RocketStage.optimize_map with workers > 1) are not recorded.
+
+    Example:
+        >>> with Profiler(trace_memory=True) as profiler:
+        ...     LinearStage.optimize_plot([0.1, 300], [100, 20000], 500, 3, 'vac', 1.0)
+        >>> profiler.report()
+        >>> profiler.save_chrome_trace('trace.json')
+
+    Attributes:
+    -----------
+    records: list
+        One dict per finished phase with 'name', 'meta', 'start' and 'duration' in seconds, 'depth' (the nesting
+        level) and, with trace_memory, 'allocated' (the net change of traced memory) and 'peak' (the peak traced
+        memory above the start of the phase) in bytes.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        Args:
+            trace_memory (bool): Trace the memory of every phase with tracemalloc. This slows down the profiled code
+                considerably, so the wall times are only comparable between runs with the same setting.
+        """
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []
+        self._previous = None
+        self._started_tracemalloc = False
+        self._t0 = None
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+    def _enter(self, record):
+        record['depth'] = len(self._stack)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # tracemalloc has a single peak counter, fold it into the parent before resetting it
+                parent = self._stack[-1]
+                parent['_peak'] = max(parent['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_current'] = current
+            record['_peak'] = current
+        self._stack.append(record)
+        record['start'] = time.perf_counter() - self._t0
+
+    def _exit(self, record):
+        record['duration'] = time.perf_counter() - self._t0 - record['start']
+        self._stack.pop()
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(record.pop('_peak'), peak)
+            start = record.pop('_current')
+            record['allocated'] = current - start
+            record['peak'] = peak - start
+            if self._stack:
+                parent = self._stack[-1]
+                parent['_peak'] = max(parent['_peak'], peak)
+        self.records.append(record)
+
+    def summary(self, by=('name',), counters=('cells', 'pruned', 'evaluated')):
+        """
+        Aggregates the records.
+
+        Args:
+            by (tuple): 'name' and/or metadata keys to group the records by, e.g. ('name', 'fuel_type').
+            counters (tuple): Metadata keys that are summed over each group.
+
+        Returns:
+            list: One dict per group with the group keys, 'calls', 'total' and 'mean' in seconds, the sum of every
+            counter that occurs in the group and, with trace_memory, the largest 'peak' in bytes, sorted by
+            descending total time.
+        """
+        groups = {}
+        for record in self.records:
+            key = tuple(record['name'] if field == 'name' else record['meta'].get(field) for field in by)
+            group = groups.setdefault(key, dict(zip(by, key), calls=0, total=0.0))
+            group['calls'] += 1
+            group['total'] += record['duration']
+            if 'peak' in record:
+                group['peak'] = max(group.get('peak', 0), record['peak'])
+            for counter in counters:
+                if counter in record['meta']:
+                    group[counter] = group.get(counter, 0) + record['meta'][counter]
+        for group in groups.values():
+            group['mean'] = group['total'] / group['calls']
+        return sorted(groups.values(), key=lambda group: -group['total'])
+
+    def report(self, by=('name',)):
+        """
+        Prints the summary as a table.
+        """
+        header = '| ' + ' | '.join('{:^20}'.format(field) for field in by) + \
+                 ' | {:^8} | {:^12} | {:^12} | {:^12} |'.format('Calls', 'Total (s)', 'Mean (s)', 'Peak (MiB)')
+        print(header)
+        for group in self.summary(by):
+            peak = '{:.2f}'.format(group['peak'] / 2 ** 20) if 'peak' in group else '-'
+            print('| ' + ' | '.join('{:^20}'.format(str(group[field])) for field in by) +
+                  ' | {:^8} | {:^12.4f} | {:^12.6f} | {:^12} |'.format(group['calls'], group['total'],
+                                                                       group['mean'], peak))
+
+    def to_chrome_trace(self):
+        """
+        Returns the records in the Chrome trace event format, which chrome://tracing and Perfetto can display.
+        """
+        events = []
+        for record in self.records:
+            args = {name: value if isinstance(value, (int, float, str, bool)) or value is None else str(value)
+                    for name, value in record['meta'].items()}
+            for name in ['allocated', 'peak']:
+                if name in record:
+                    args[name] = record[name]
+            events.append({'name': record['name'],
+                           'ph': 'X',
+                           'ts': record['start'] * 1e6,
+                           'dur': record['duration'] * 1e6,
+                           'pid': 0,
+                           'tid': 0,
+                           'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+
+def stage_classes():
+    """
+    Returns the stage classes the service answers requests for, by name.
+    """
+    from Stages.LinearStage import LinearStage, LinearStageKSP2
+    from Stages.AsparagusStage import AsparagusStage
+    from Stages.BoostedStage import BoostedStage
+    return {cls.__name__: cls for cls in (LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage)}
+
+
+def warm_catalogs():
+    """
+    Builds the catalogs of every stage class, so no request pays for parsing the CSV files.
+    """
+    for cls in stage_classes().values():
+        cls.load_catalogs()
+
+
+def to_json(value):
+    """
+    Converts numpy arrays and scalars, also nested in lists, tuples and dicts, to plain Python values.
+    """
+    if isinstance(value, dict):
+        return {name: to_json(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == 'f' and not np.all(np.isfinite(value)):
+            value = value.astype(object)
+            value[~np.isfinite(value.astype(float))] = None
+            return value.tolist()
+        if value.dtype.kind in 'biuf':
+            return value.tolist()
+        return to_json(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        # JSON has no infinity, infeasible masses and costs become null
+        return None
+    return value
+
+
+def stage_to_dict(stage):
+    return to_json(vars(stage))
+
+
+def solve_points(stage, params):
+    """
+    Solves a batch of points in one optimize_points call.
+
+    Returns:
+        list: One list of stage dicts per point, see RocketStage.points_to_stages.
+    """
+    cls = stage_classes()[stage]
+    points = cls.optimize_points(params['pl'], params['dv'], params['max_eng_quant'], params['asl_or_vac'],
+                                 params['TWR_req'], min_type=params.get('min_type', 'mass'))
+    return [[stage_to_dict(rocket_stage) for rocket_stage in cls.points_to_stages(points, i)]
+            for i in range(len(points['pl']))]
+
+
+def solve_map(stage, params):
+    """
+    Solves the minimum mass and cost map of a grid, see RocketStage.optimize_map and optimize_map_adaptive.
+    """
+    cls = stage_classes()[stage]
+    args = (params['pl_span'], params['dv_span'], params['span'], params['max_eng_quant'], params['asl_or_vac'],
+            params['TWR_req'])
+    if params.get('adaptive', False):
+        return cls.optimize_map_adaptive(*args, coarse_step=params.get('coarse_step', 16))
+    return cls.optimize_map(*args)
+
+
+def plot_filename(cls, params):
+    """
+    Returns the file name of a plot request. Only the last component of the requested name is kept, so a client
+    can't write outside the plot directory.
+    """
+    filename = os.path.basename(params.get('filename', cls.plot_filename))
+    if filename in ('', '.', '..'):
+        raise ValueError(f'Invalid plot file name {params.get("filename")!r}')
+    return filename
+
+
+def plot_map(stage, maps, params, directory):
+    """
+    Plots a map solved by solve_map into directory and returns the path of the plot.
+    """
+    from matplotlib import pyplot as plt
+    cls = stage_classes()[stage]
+    filename = plot_filename(cls, params)
+    min_idx = maps['min_mtot_idx'] if params.get('min_type', 'mass') == 'mass' else maps['min_costs_idx']
+    os.makedirs(directory, exist_ok=True)
+    try:
+        cls.plotDVPLDiagram(min_idx, maps['engines'], maps['quant_engines'], maps['pl'], maps['dv'], filename,
+                            params['asl_or_vac'], params['TWR_req'], min_label_cells=params.get('min_label_cells', 1),
+                            directory=directory)
+    finally:
+        # The service plots for as long as it runs, every figure would stay open otherwise
+        plt.close('all')
+    return os.path.join(directory, filename)
+
+
+class OptimizationService:
+    """
+    Long-running optimizer that answers JSON requests over a Unix socket or a local TCP port.
+
+    The engine and tank catalogs are built once, in the service and in every worker process, and solved maps are
+    kept in a least recently used cache, so a request only pays for the solve itself. Solves run in a process pool,
+    so the event loop keeps accepting and answering requests while a large map is computed. Identical requests that
+    arrive while the first one is still being solved wait for its result instead of solving it again.
+
+    Every request is one line of JSON, {"id": 1, "method": "optimize_points", "params": {...}}, and is answered by
+    one line {"id": 1, "result": ...} or {"id": 1, "error": {"type": ..., "message": ...}}. A line can also hold a
+    JSON array of requests, which is answered by an array of responses in the same order. Requests on one
+    connection are solved concurrently, so responses can arrive out of order and are matched by their id.
+
+    Methods:
+        optimize_point: pl, dv, max_eng_quant, asl_or_vac, TWR_req, min_type and optionally stage, the name of the
+            stage class (default 'LinearStage'). Returns the list of stage dicts of optimize_point.
+        optimize_points: As optimize_point with lists of pl and dv, solved in one batch. Returns one list of stage
+            dicts per point.
+        optimize_map: pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req and optionally stage, adaptive,
+            coarse_step and fields, the keys of the map to return (default all). Returns the map of optimize_map
+            with np.inf as null.
+        optimize_plot: As optimize_map plus filename, min_type and min_label_cells. Plots the map like optimize_plot
+            into the plot directory of the service and returns the path of the plot. Only the base name of filename
+            is used.
+        stats: Returns the request counters and the number of cached maps.
+
+    Example:
+        $ python service.py --socket /tmp/kem.sock --workers 4
+        >>> with ServiceClient('/tmp/kem.sock') as client:
+        ...     stages = client.call('optimize_point', pl=5, dv=3400, max_eng_quant=3, asl_or_vac='asl', TWR_req=1.5,
+        ...                          min_type='mass')
+    """
+
+    def __init__(self, workers=None, max_maps=32, plot_dir='plots'):
+        """
+        Args:
+            workers (int): The number of worker processes. None uses one per CPU.
+            max_maps (int): The number of solved maps kept in memory.
+            plot_dir (str): The directory optimize_plot writes the plots to.
+        """
+        warm_catalogs()
+        # Forked workers inherit the catalogs built above, the initializer only builds them under spawn
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=warm_catalogs)
+        # The maps to plot are already in this process, a worker would need a pickled copy. pyplot keeps global
+        # state, so one thread draws the plots one at a time
+        self.plot_executor = ThreadPoolExecutor(max_workers=1)
+        self.plot_dir = plot_dir
+        self.max_maps = max_maps
+        self.maps = OrderedDict()
+        self.in_flight = {}
+        self.counters = {'requests': 0, 'solves': 0, 'coalesced': 0, 'map_hits': 0, 'errors': 0}
+        self.handlers = {'optimize_point': self.optimize_point,
+                         'optimize_points': self.optimize_points,
+                         'optimize_map': self.optimize_map,
+                         'optimize_plot': self.optimize_plot,
+                         'stats': self.stats}
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.plot_executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def key(*parts):
+        return json.dumps(parts, sort_keys=True)
+
+    async def run(self, func, *args):
+        self.counters['solves'] += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def coalesce(self, key, factory):
+        """
+        Awaits the result of factory(), or of the identical request that is already being solved.
+        """
+        if key in self.in_flight:
+            self.counters['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # A cancelled waiter must not cancel the solve the other waiters share
+        return await asyncio.shield(self.in_flight[key])
+
+    async def optimize_point(self, params):
+        points = dict(params, pl=[params['pl']], dv=[params['dv']])
+        return (await self.optimize_points(points))[0]
+
+    async def optimize_points(self, params):
+        stage = params.get('stage', 'LinearStage')
+        self.check_stage(stage)
+        return await self.coalesce(self.key('points', stage, params), lambda: self.run(solve_points, stage, params))
+
+    async def get_map(self, params):
+        stage = params.get('stage', 'LinearStage')
+        self.check_stage(stage)
+        map_params = {name: params[name] for name in ['pl_span', 'dv_span', 'span', 'max_eng_quant', 'asl_or_vac',
+                                                      'TWR_req']}
+        map_params.update({name: params[name] for name in ['adaptive', 'coarse_step'] if name in params})
+        key = self.key('map', stage, map_params)
+        if key in self.maps:
+            self.counters['map_hits'] += 1
+            self.maps.move_to_end(key)
+            return self.maps[key]
+        maps = await self.coalesce(key, lambda: self.run(solve_map, stage, map_params))
+        self.maps[key] = maps
+        self.maps.move_to_end(key)
+        while len(self.maps) > self.max_maps:
+            self.maps.popitem(last=False)
+        return maps
+
+    async def optimize_map(self, params):
+        maps = await self.get_map(params)
+        fields = params.get('fields', list(maps))
+        return to_json({name: maps[name] for name in fields})
+
+    async def optimize_plot(self, params):
+        stage = params.get('stage', 'LinearStage')
+        self.check_stage(stage)
+        # An invalid file name fails before the map is solved
+        plot_filename(stage_classes()[stage], params)
+        maps = await self.get_map(params)
+        loop = asyncio.get_running_loop()
+        return await self.coalesce(self.key('plot', stage, params), lambda: loop.run_in_executor(
+            self.plot_executor, plot_map, stage, maps, params, self.plot_dir))
+
+    async def stats(self, params):
+        return dict(self.counters, maps=len(self.maps), in_flight=len(self.in_flight))
+
+    @staticmethod
+    def check_stage(stage):
+        if stage not in stage_classes():
+            raise ValueError(f'Unknown stage class {stage}, expected one of {sorted(stage_classes())}')
+
+    async def handle(self, request):
+        """
+        Answers one request dict with a response dict.
+        """
+        self.counters['requests'] += 1
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or request.get('method') not in self.handlers:
+                raise ValueError(f'Unknown method, expected one of {sorted(self.handlers)}')
+            result = await self.handlers[request['method']](request.get('params', {}))
+            return {'id': request_id, 'result': result}
+        except Exception as e:
+            self.counters['errors'] += 1
+            return {'id': request_id, 'error': {'type': type(e).__name__, 'message': str(e)}}
+
+    async def answer(self, line, writer):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {'id': None, 'error': {'type': 'JSONDecodeError', 'message': str(e)}}
+        else:
+            if isinstance(request, list):
+                response = list(await asyncio.gather(*[self.handle(item) for item in request]))
+            else:
+                response = await self.handle(request)
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+
+    async def serve_connection(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.ensure_future(self.answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=None):
+        """
+        Serves requests until the task is cancelled.
+
+        Args:
+            path (str): The Unix socket to listen on.
+            host (str): The address to listen on when port is given instead of path.
+            port (int): The TCP port to listen on.
+        """
+        # Maps can be large, allow long request and response lines
+        if path is not None:
+            server = await asyncio.start_unix_server(self.serve_connection, path, limit=2 ** 26)
+        else:
+            server = await asyncio.start_server(self.serve_connection, host, port, limit=2 ** 26)
+        async with server:
+            await server.serve_forever()
+
+
+class ServiceClient:
+    """
+    Minimal blocking client of an OptimizationService, for scripts that ask a few questions.
+
+    Example:
+        >>> with ServiceClient(port=8765) as client:
+        ...     maps = client.call('optimize_map', pl_span=[0.1, 300], dv_span=[100, 20000], span=500,
+        ...                        max_eng_quant=3, asl_or_vac='vac', TWR_req=1.0, fields=['min_mtot_idx'])
+    """
+
+    def __init__(self, path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rwb')
+        self.next_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def send(self, request):
+        self.file.write(json.dumps(request).encode() + b'\n')
+        self.file.flush()
+        return json.loads(self.file.readline())
+
+    def call(self, method, **params):
+        """
+        Sends one request and returns its result.
+
+        Raises:
+            RuntimeError: If the service answers with an error.
+        """
+        self.next_id += 1
+        response = self.send({'id': self.next_id, 'method': method, 'params': params})
+        if 'error' in response:
+            raise RuntimeError('{type}: {message}'.format(**response['error']))
+        return response['result']
+
+    def batch(self, requests):
+        """
+        Sends several (method, params) requests in one line, the service solves them concurrently.
+
+        Returns:
+            list: The response dicts in the order of the requests.
+        """
+        ids = range(self.next_id + 1, self.next_id + 1 + len(requests))
+        self.next_id += len(requests)
+        return self.send([{'id': request_id, 'method': method, 'params': params}
+                          for request_id, (method, params) in zip(ids, requests)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serves optimization requests with warm catalogs, see '
+                                                 'OptimizationService for the protocol.')
+    parser.add_argument('--socket', help='The Unix socket to listen on.')
+    parser.add_argument('--host', default='127.0.0.1', help='The address to listen on with --port.')
+    parser.add_argument('--port', type=int, help='The TCP port to listen on instead of a Unix socket.')
+    parser.add_argument('--workers', type=int, help='The number of worker processes, one per CPU by default.')
+    parser.add_argument('--max-maps', type=int, default=32, help='The number of solved maps kept in memory.')
+    parser.add_argument('--plot-dir', default='plots', help='The directory optimize_plot writes the plots to.')
+    args = parser.parse_args(argv)
+    if (args.socket is None) == (args.port is None):
+        parser.error('exactly one of --socket and --port is required')
+
+    service = OptimizationService(workers=args.workers, max_maps=args.max_maps, plot_dir=args.plot_dir)
+    # Stopping the service with SIGTERM shuts it down like Ctrl+C, so the socket file is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(service.serve(path=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
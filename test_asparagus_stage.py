@@ -0,0 +1,77 @@
+import math
+import numpy as np
+import pytest
+from Stages.AsparagusStage import AsparagusStage
+
+G = AsparagusStage.g
+
+
+def scalar_dv(m100, pl, isp, eng_mass, num_engines_array, empty_fraction):
+    # Burn the stack unit by unit: every engine burns the fuel of the outermost group, which is then dropped
+    fuel, dry = m100 * (1 - empty_fraction), m100 * empty_fraction + eng_mass
+    mass = pl + sum(num_engines_array) * (eng_mass + m100)
+    dv = 0.0
+    for group in num_engines_array:
+        dv += isp * G * math.log(mass / (mass - group * fuel))
+        mass -= group * (fuel + dry)
+    return dv
+
+
+def scalar_m100(dv, pl, isp, eng_mass, num_engines_array, empty_fraction):
+    # Bisection on the tank mass per unit, None if no tank mass reaches dv
+    lower, upper = 0.0, 1e6
+    if scalar_dv(upper, pl, isp, eng_mass, num_engines_array, empty_fraction) < dv:
+        return None
+    for _ in range(200):
+        middle = (lower + upper) / 2
+        if scalar_dv(middle, pl, isp, eng_mass, num_engines_array, empty_fraction) < dv:
+            lower = middle
+        else:
+            upper = middle
+    return upper
+
+
+def test_drop_sequences_are_the_compositions():
+    assert AsparagusStage.drop_sequences(3) == [(1, 1, 1), (1, 2), (2, 1), (3,)]
+    assert [len(AsparagusStage.drop_sequences(n)) for n in range(1, 6)] == [1, 2, 4, 8, 16]
+
+
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+def test_vectorized_solver_matches_scalar_bisection(asl_or_vac):
+    dv = np.array([500., 2500., 4500., 7000.])[:, np.newaxis, np.newaxis]
+    pl = np.array([1., 20.])[np.newaxis, :, np.newaxis]
+    for eng_type in AsparagusStage.asparagus_fuel_types():
+        engines, num_engines_arrays = AsparagusStage.engine_columns(eng_type, 2)
+        isp, T, eng_mass, eng_cost, groups, num_units = AsparagusStage.engine_arrays(eng_type, 2, asl_or_vac)
+        empty_fraction = AsparagusStage.get_best_empty_fraction(eng_type, 2, None)
+        m_tot = AsparagusStage.solve_fuel_type(dv, pl, eng_type, 2, asl_or_vac, 0)[0]
+        for column, num_engines_array in enumerate(num_engines_arrays):
+            for i in range(dv.shape[0]):
+                for j in range(pl.shape[1]):
+                    m100 = scalar_m100(dv[i, 0, 0], pl[0, j, 0], isp[0, 0, column], eng_mass[0, 0, column],
+                                       num_engines_array, empty_fraction)
+                    if m100 is None:
+                        assert m_tot[i, j, column] == np.inf
+                    else:
+                        expected = pl[0, j, 0] + num_units[0, 0, column] * (eng_mass[0, 0, column] + m100)
+                        assert m_tot[i, j, column] == pytest.approx(expected, rel=1e-8)
+
+
+def test_points_become_asparagus_stages():
+    points = AsparagusStage.optimize_points([2., 30.], [3000., 6000.], 2, 'asl', 1.2, min_type='cost')
+    for i in range(2):
+        stages = AsparagusStage.points_to_stages(points, i)
+        assert stages
+        for stage in stages:
+            assert stage.num_engines == sum(stage.num_engines_array)
+            assert stage.num_engines_array[-1] == 1
+            assert '(' not in stage.engine
+
+
+def test_optimize_plot_writes_the_asparagus_plot(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'plots').mkdir()
+    assert AsparagusStage.optimize_plot([2, 30], [1000, 4000], 6, 1, 'asl', 1.2) is None
+    assert (tmp_path / 'plots' / 'Asparagus_Rocket_Plot.png').exists()
+    with pytest.raises(ValueError, match='precisions'):
+        AsparagusStage.optimize_plot([2, 30], [1000, 4000], 6, 1, 'asl', 1.2, precision='float32')
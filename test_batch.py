@@ -0,0 +1,92 @@
+import json
+import numpy as np
+import pytest
+import batch
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+
+SWEEPS = [{'name': 'ksp1_vac', 'span': 8, 'max_eng_quant': 2},
+          {'name': 'ksp2_asl', 'dataset': 'KSP2', 'span': 6, 'asl_or_vac': 'asl', 'min_type': 'cost'}]
+
+
+def write_jobs(path, sweeps=SWEEPS):
+    path.write_text(json.dumps({'defaults': {'dv_span': [100, 8000]}, 'sweeps': sweeps}))
+    return str(path)
+
+
+@pytest.mark.parametrize('fmt', ['npz', 'npy'])
+def test_batch_runs_from_another_directory(tmp_path, monkeypatch, fmt):
+    monkeypatch.chdir(tmp_path)
+    # Rebuild the catalogs outside the repository, the parent builds them before the workers start
+    LinearStage.reload_catalogs()
+    jobs = write_jobs(tmp_path / 'jobs.json')
+    assert batch.main([jobs, '--out', 'results', '--format', fmt, '--workers', '2']) == 0
+
+    manifest = json.loads((tmp_path / 'results' / 'manifest.json').read_text())['sweeps']
+    assert [entry['job']['name'] for entry in manifest] == ['ksp1_vac', 'ksp2_asl']
+    for entry, cls in zip(manifest, [LinearStage, LinearStageKSP2]):
+        job = entry['job']
+        assert entry['status'] == 'done' and entry['fields'] == batch.FIELDS[job['min_type']]
+        assert entry['shape'] == [job['span'], job['span']]
+        maps = cls.optimize_map(job['pl_span'], job['dv_span'], job['span'], job['max_eng_quant'],
+                                job['asl_or_vac'], job['TWR_req'])
+        for name in entry['fields']:
+            if fmt == 'npz':
+                with np.load(tmp_path / 'results' / entry['files'][0]) as data:
+                    saved = data[name]
+            else:
+                saved = np.load(tmp_path / 'results' / job['name'] / (name + '.npy'), mmap_mode='r')
+            np.testing.assert_array_equal(saved, maps[name], err_msg=name)
+
+
+def test_finished_sweeps_are_skipped(tmp_path):
+    jobs = batch.load_jobs(write_jobs(tmp_path / 'jobs.json', SWEEPS[:1]))
+    out = str(tmp_path / 'results')
+    assert batch.run_batch(jobs, out)[0]['status'] == 'done'
+    assert batch.run_batch(jobs, out)[0]['status'] == 'skipped'
+    assert batch.run_batch(jobs, out, overwrite=True)[0]['status'] == 'done'
+
+
+@pytest.mark.parametrize('fmt', ['npz', 'npy'])
+def test_interrupted_writes_are_solved_again(tmp_path, monkeypatch, fmt):
+    jobs = batch.load_jobs(write_jobs(tmp_path / 'jobs.json', SWEEPS[:1]))
+    out = str(tmp_path / 'results')
+    writer = batch.WRITERS[fmt]
+
+    def interrupted(path, maps, fields):
+        writer(path, maps, fields)
+        raise KeyboardInterrupt
+
+    monkeypatch.setitem(batch.WRITERS, fmt, interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_batch(jobs, out, fmt)
+    # Neither the output nor its temporary directory is left behind
+    assert sorted(p.name for p in (tmp_path / 'results').iterdir()) == []
+    monkeypatch.setitem(batch.WRITERS, fmt, writer)
+    assert batch.run_batch(jobs, out, fmt)[0]['status'] == 'done'
+    assert batch.run_batch(jobs, out, fmt, overwrite=True)[0]['status'] == 'done'
+    assert sorted(p.name for p in (tmp_path / 'results').iterdir()) == ['ksp1_vac' + ('.npz' if fmt == 'npz' else ''),
+                                                                       'manifest.json']
+
+
+def test_identical_sweeps_share_the_cache(tmp_path):
+    sweeps = [dict(SWEEPS[0], name=name) for name in ['first', 'second', 'third']]
+    jobs = batch.load_jobs(write_jobs(tmp_path / 'jobs.json', sweeps))
+    entries = batch.run_batch(jobs, str(tmp_path / 'results'), workers=3, cache_dir=str(tmp_path / 'cache'))
+    assert [entry['status'] for entry in entries] == ['done'] * 3
+    saved = []
+    for entry in entries:
+        with np.load(tmp_path / 'results' / entry['files'][0]) as data:
+            saved.append({name: data[name] for name in entry['fields']})
+    for maps in saved[1:]:
+        for name in entries[0]['fields']:
+            np.testing.assert_array_equal(maps[name], saved[0][name], err_msg=name)
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+
+def test_invalid_job_files_raise(tmp_path):
+    with pytest.raises(ValueError):
+        batch.load_jobs(write_jobs(tmp_path / 'unknown.json', [{'name': 'a', 'spam': 1}]))
+    with pytest.raises(ValueError):
+        batch.load_jobs(write_jobs(tmp_path / 'twice.json', [{'name': 'a'}, {'name': 'a'}]))
+    with pytest.raises(ValueError):
+        batch.load_jobs(write_jobs(tmp_path / 'dataset.json', [{'dataset': 'KSP3'}]))
@@ -0,0 +1,45 @@
+import json
+import benchmark
+
+NAME = 'optimize_point mass'
+
+
+def write_baseline(path, time, peak_memory):
+    results = {NAME: {'time': time, 'peak_memory': peak_memory}, 'other': {'time': 1.0, 'peak_memory': 0}}
+    path.write_text(json.dumps({'environment': benchmark.environment(), 'results': results}))
+
+
+def run(path, *args):
+    return benchmark.main(['--filter', NAME, '--repeat', '1', '--baseline', str(path), *args])
+
+
+def test_compare_flags_slow_downs_beyond_tolerance():
+    previous = {'a': {'time': 1.0, 'peak_memory': 2 ** 20}, 'b': {'time': 1.0, 'peak_memory': 2 ** 20}}
+    results = {'a': {'time': 1.5, 'peak_memory': 2 ** 20}, 'b': {'time': 1.1, 'peak_memory': 2 ** 22},
+               'new': {'time': 9.0, 'peak_memory': 0}}
+    assert benchmark.compare(results, previous, 0.2) == [('a', 'time', 1.0, 1.5),
+                                                         ('b', 'peak_memory', 2 ** 20, 2 ** 22)]
+
+
+def test_regressions_do_not_overwrite_the_baseline(tmp_path, monkeypatch):
+    # A fixed measurement, a fast machine can run the benchmark within the noise floor of compare
+    monkeypatch.setattr(benchmark, 'measure', lambda func, repeat: {'time': 1.0, 'peak_memory': 0})
+    path = tmp_path / 'baseline.json'
+    write_baseline(path, 1e-9, 0)
+    before = path.read_text()
+    assert run(path) == 1
+    assert path.read_text() == before
+
+    assert run(path, '--update-baseline') == 1
+    results = json.loads(path.read_text())['results']
+    assert results[NAME]['time'] == 1.0
+    assert results['other'] == {'time': 1.0, 'peak_memory': 0}
+
+
+def test_clean_runs_update_the_baseline(tmp_path):
+    path = tmp_path / 'baseline.json'
+    write_baseline(path, 1e3, 2 ** 40)
+    assert run(path, '--no-save') == 0
+    assert json.loads(path.read_text())['results'][NAME]['time'] == 1e3
+    assert run(path) == 0
+    assert json.loads(path.read_text())['results'][NAME]['time'] < 1e3
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from profiling import Profiler
+from FuelTank import FuelTank, FuelTankKSP2
+from Stages.BoostedStage import BoostedStage
+from utils import LazyCatalog
+
+SWEEP = dict(pl_span=[0.1, 300], dv_span=[100, 8000], span=16, max_eng_quant=2, TWR_req=1.2)
+
+
+class FreeStructureTanks(FuelTank):
+    # The KSP1 tank tables priced like KSP2, where the structure is free but the tables are not
+    best_cost_per_ton_structure = FuelTankKSP2.best_cost_per_ton_structure
+    cost_table = FuelTankKSP2.cost_table
+
+
+class FreeStructureBoostedStage(BoostedStage):
+    tanks = LazyCatalog(lambda cls: FreeStructureTanks())
+
+
+def full_cube(asl_or_vac, pl_span, dv_span, span, max_eng_quant, TWR_req, cls=BoostedStage):
+    # Explicit columns disable the pruning against the incumbent, every combination that meets the TWR bound is solved
+    pl, dv = cls.make_grid(pl_span, dv_span, span)
+    columns = np.arange(len(cls.configuration_labels(max_eng_quant)[0]))
+    blocks = list(cls._configuration_blocks(dv[:, np.newaxis, np.newaxis], pl[np.newaxis, :, np.newaxis],
+                                            max_eng_quant, asl_or_vac, TWR_req, columns=columns))
+    return [np.concatenate([block[k] for block in blocks], axis=2) for k in (0, 1)]
+
+
+@pytest.mark.parametrize('cls', [BoostedStage, FreeStructureBoostedStage])
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+def test_booster_pruning_keeps_every_winner(cls, asl_or_vac):
+    with Profiler() as profiler:
+        maps = cls.optimize_map(**SWEEP, asl_or_vac=asl_or_vac)
+    summary = {group['name']: group for group in profiler.summary()}
+    assert summary['booster_search']['pruned'] > 0
+
+    for name, cube in zip(['min_mtot', 'min_costs'], full_cube(asl_or_vac, **SWEEP, cls=cls)):
+        np.testing.assert_array_equal(maps[name], np.min(cube, axis=2), err_msg=name)
+        idx = np.where(np.isinf(maps[name]), -1, np.argmin(cube, axis=2))
+        np.testing.assert_array_equal(maps[name + '_idx'], idx, err_msg=name)
+    # Boosters win some of the cells
+    n_linear = len(super(BoostedStage, cls).configuration_labels(SWEEP['max_eng_quant'])[0])
+    assert np.any(maps['min_mtot_idx'] >= n_linear)
+
+
+def test_solved_core_tank_reaches_the_delta_v():
+    pl, dv = BoostedStage.make_grid(SWEEP['pl_span'], SWEEP['dv_span'], SWEEP['span'])
+    dv_array, pl_array = dv[:, np.newaxis, np.newaxis], pl[np.newaxis, :, np.newaxis]
+    n_feasible = 0
+    for eng_type, booster, num_boosters, n_columns in BoostedStage.booster_blocks(2)[::7]:
+        m_tot = BoostedStage.solve_boosted(dv_array, pl_array, eng_type, booster, num_boosters, 2, 'asl', 1.2)[0]
+        isp, T, eng_mass, eng_cost, eng_name, num_engines, built_in_fuel = \
+            BoostedStage.engine_arrays(eng_type, 2, 'asl')
+        empty_fraction = BoostedStage.get_best_empty_fraction(eng_type, 2, num_engines)
+        T_b, isp_b, mass_full_b, mass_empty_b, fuel_mass_b, fuel_units_b, cost_b, burn_time = \
+            BoostedStage.booster_arrays(booster, num_boosters, 'asl')
+        core_fuel = burn_time * T / (isp * BoostedStage.g)
+        m100 = m_tot - pl_array - eng_mass - mass_full_b
+        feasible = np.isfinite(m_tot)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dv_solved, TWR = BoostedStage.boosted_dv(m100, pl_array, isp, T, eng_mass, T_b, isp_b, mass_full_b,
+                                                     mass_empty_b, fuel_mass_b, core_fuel, empty_fraction)
+        dv_grid = np.broadcast_to(dv_array, m_tot.shape)
+        # The smallest core tank can overshoot the delta-v, a refined tank hits it
+        assert np.all(dv_solved[feasible] >= dv_grid[feasible] * (1 - 1e-8))
+        refined = feasible & (m100 > core_fuel / (1 - empty_fraction) * (1 + 1e-6))
+        np.testing.assert_allclose(dv_solved[refined], dv_grid[refined], rtol=1e-8)
+        assert np.all(TWR[feasible] >= 1.2 * (1 - 1e-12))
+        n_feasible += np.count_nonzero(refined)
+    assert n_feasible > 0
@@ -0,0 +1,97 @@
+import csv
+import os
+import numpy as np
+import pytest
+from Fuels import Fuels
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from utils import DATA_DIR
+
+
+def csv_engines(cls):
+    # The allowed engines of the class, read row by row from the CSV files like setupEngines did before the
+    # columnar catalog. KSP2 parts have no cost.
+    ksp2 = cls is LinearStageKSP2
+    rows = []
+    for filename, is_srb in [('RFEngines_KSP2.csv' if ksp2 else 'RFEngines.csv', False), ('SRB.csv', True)]:
+        with open(os.path.join(DATA_DIR, filename), encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                name = row['Name']
+                if not cls.allowed_engines.get(name, False):
+                    continue
+                engine = {'name': name, 'thrust_asl': float(row['Thrust ASL']), 'thrust_vac': float(row['Thrust VAC']),
+                          'isp_asl': float(row['ISP ASL']), 'isp_vac': float(row['ISP VAC']),
+                          'is_radial': row['Size'] == 'Radial mounted'}
+                if is_srb:
+                    engine.update(mass=float(row['Mass Empty']), fuel_type='SolidFuel',
+                                  built_in_fuel=float(row['Solid Fuel']),
+                                  cost=0.0 if ksp2 else float(row['Cost']) - Fuels.SolidFuel['Cost'] *
+                                  float(row['Solid Fuel']),
+                                  empty_ratio=float(row['Mass Empty']) / float(row['Mass Full']))
+                else:
+                    if ksp2:
+                        fuel_type = 'Hydrogen' if name in ('Nerv', 'SWERV') else 'Xenon' if name == 'Dawn' else 'LFOX'
+                    else:
+                        fuel_type = 'LF' if name == 'Nerv' else 'Xenon' if name == 'Dawn' else 'LFOX'
+                    engine.update(mass=float(row['Mass']), fuel_type=fuel_type,
+                                  built_in_fuel=6400.0 if name == 'Twin-Boar' and not ksp2 else 0.0,
+                                  cost=0.0 if ksp2 else float(row['Cost']), empty_ratio=np.nan)
+                rows.append(engine)
+    return rows
+
+
+def loop_physics_arrays(cls, eng_type, max_eng_quant, asl_or_vac):
+    # The per-Engine loop setup_physics_arrays used before the columnar catalog, over the engines read from the CSV
+    engines = [eng for eng in csv_engines(cls) if eng['fuel_type'] == eng_type]
+    num_engines = cls.count_rep(max_eng_quant, len(engines))
+    is_radial = np.tile([eng['is_radial'] for eng in engines], max_eng_quant)
+    num_engines[np.where(is_radial & num_engines == 1)] = 2
+    shape = [1, 1, len(num_engines)]
+
+    def column(values, scale=True):
+        values = np.tile(values, max_eng_quant) * (num_engines if scale else 1)
+        return np.reshape(values, shape)
+
+    isp = [eng['isp_' + asl_or_vac] for eng in engines]
+    T = [eng['thrust_' + asl_or_vac] for eng in engines]
+    return (column(isp, scale=False), column(T), column([eng['mass'] for eng in engines]),
+            column([eng['cost'] for eng in engines]), np.tile([eng['name'] for eng in engines], max_eng_quant),
+            num_engines, column([eng['built_in_fuel'] for eng in engines]))
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+def test_catalog_matches_csv_rows(cls):
+    expected = csv_engines(cls)
+    catalog = cls.catalog
+    assert len(expected) > 10 and catalog.name.tolist() == [eng['name'] for eng in expected]
+    assert catalog.fuel_type.tolist() == [eng['fuel_type'] for eng in expected]
+    for column in ['mass', 'thrust_asl', 'thrust_vac', 'isp_asl', 'isp_vac', 'cost', 'is_radial', 'built_in_fuel',
+                   'empty_ratio']:
+        np.testing.assert_allclose(getattr(catalog, column).astype(float), [eng[column] for eng in expected],
+                                   rtol=1e-12, err_msg=column)
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+@pytest.mark.parametrize('max_eng_quant', [1, 3])
+def test_physics_arrays_match_engine_loop(cls, asl_or_vac, max_eng_quant):
+    dv, pl = np.linspace(100, 5000, 4), np.linspace(1, 50, 3)
+    for eng_type in cls.fuel_types():
+        arrays = cls.setup_physics_arrays(dv, pl, eng_type, max_eng_quant, asl_or_vac)
+        assert arrays[0].shape == (4, 3, 1) and arrays[1].shape == (4, 3, 1)
+        for got, expected in zip(arrays[2:], loop_physics_arrays(cls, eng_type, max_eng_quant, asl_or_vac)):
+            np.testing.assert_array_equal(np.asarray(got), np.asarray(expected))
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+def test_catalog_round_trips_to_engines(cls):
+    catalog = cls.catalog
+    engines = catalog.to_engines()
+    assert [eng.name for eng in engines] == catalog.name.tolist()
+    assert [eng.fuel_type for eng in engines] == catalog.fuel_type.tolist()
+    enabled = {name for name, allowed in cls.allowed_engines.items() if allowed}
+    assert set(catalog.name) <= enabled
+
+    for eng_type in cls.fuel_types():
+        subset = catalog.filter(catalog.mask(fuel_type=eng_type))
+        assert subset.name.tolist() == [eng.name for eng in engines if eng.fuel_type == eng_type]
+    assert not catalog.mask(fuel_type='Unobtainium').any()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from frontier import pareto_indices, pareto_mask_batched, pareto_batched, _pareto_reference
+from utils import pareto
+
+
+def random_points(rng, n_points, n_obj):
+    # Small integers so the points have many ties and duplicates
+    return rng.integers(0, 8, size=(n_points, n_obj)).astype(float)
+
+
+@pytest.mark.parametrize('n_obj', [2, 3, 4])
+@pytest.mark.parametrize('n_points', [0, 1, 2, 50, 700])
+def test_pareto_indices_matches_quadratic_loop(n_obj, n_points):
+    rng = np.random.default_rng(n_obj * 1000 + n_points)
+    directions = rng.choice([-1, 1], size=n_obj)
+    for _ in range(5):
+        X = random_points(rng, n_points, n_obj)
+        expected = _pareto_reference(X * directions)
+        np.testing.assert_array_equal(pareto_indices(X, directions), expected)
+        np.testing.assert_array_equal(pareto(X, directions), expected)
+
+
+def test_pareto_indices_with_nan_uses_quadratic_loop():
+    X = np.array([[1., 2.], [np.nan, 3.], [2., 1.], [0., 0.]])
+    np.testing.assert_array_equal(pareto_indices(X, [1, 1]), _pareto_reference(X))
+
+
+@pytest.mark.parametrize('n_obj', [2, 3])
+def test_batched_frontiers_match_single_frontiers(n_obj):
+    rng = np.random.default_rng(n_obj)
+    X = rng.integers(0, 6, size=(4, 3, 40, n_obj)).astype(float)
+    X[1, 2, 5, 0] = np.nan
+    directions = [-1] + [1] * (n_obj - 1)
+
+    mask = pareto_mask_batched(X, directions)
+    assert mask.shape == (4, 3, 40)
+    for i in range(4):
+        for j in range(3):
+            np.testing.assert_array_equal(np.flatnonzero(mask[i, j]), _pareto_reference(X[i, j] * directions))
+
+    offsets, indices = pareto_batched(X.reshape(12, 40, n_obj), directions)
+    flat = mask.reshape(12, 40)
+    for i in range(12):
+        np.testing.assert_array_equal(indices[offsets[i]:offsets[i + 1]], np.flatnonzero(flat[i]))
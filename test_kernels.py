@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import kernels
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.BoostedStage import BoostedStage
+
+SWEEP = dict(pl_span=[0.1, 300], dv_span=[100, 20000], max_eng_quant=2, TWR_req=1.2)
+
+
+def assert_matches_numpy(fused, reference):
+    # The kernel rounds math.exp on its own, so the minima agree to about 1e-15 and near-ties can swap winners
+    for name in ['min_mtot', 'min_costs']:
+        value, idx = fused[name], np.where(np.isinf(fused[name]), -1, fused[name + '_idx'])
+        reference_value = reference[name]
+        reference_idx = np.where(np.isinf(reference_value), -1, reference[name + '_idx'])
+        np.testing.assert_array_equal(np.isinf(value), np.isinf(reference_value), err_msg=name)
+        np.testing.assert_allclose(value, reference_value, rtol=1e-12, err_msg=name)
+        swapped = idx != reference_idx
+        assert np.mean(swapped) <= 1e-3, name
+        assert np.all(idx[~np.isinf(value)] >= 0) and np.all(idx[np.isinf(value)] == -1)
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+def test_python_kernel_matches_numpy_tile(cls, asl_or_vac):
+    pl, dv = cls.make_grid(SWEEP['pl_span'], SWEEP['dv_span'], 12)
+    args = (dv, pl, SWEEP['max_eng_quant'], asl_or_vac, SWEEP['TWR_req'])
+    names = ['min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']
+    for columns in [None, np.arange(0, len(cls.configuration_labels(SWEEP['max_eng_quant'])[0]), 3)]:
+        fused = dict(zip(names, cls._reduce_tile_fused(*args, columns=columns)))
+        reference = dict(zip(names, cls._reduce_tile(*args, columns=columns)))
+        assert np.any(np.isinf(reference['min_mtot'])) and np.any(np.isfinite(reference['min_mtot']))
+        assert_matches_numpy(fused, reference)
+
+
+@pytest.mark.skipif(not kernels.available(), reason='numba is not installed')
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+def test_numba_map_matches_numpy_map(cls, asl_or_vac):
+    for span, tile_size in [(200, None), (61, 16)]:
+        reference = cls.optimize_map(**SWEEP, span=span, asl_or_vac=asl_or_vac)
+        fused = cls.optimize_map(**SWEEP, span=span, asl_or_vac=asl_or_vac, backend='numba', tile_size=tile_size)
+        assert np.any(reference['min_mtot_idx'] < 0)
+        assert_matches_numpy(fused, reference)
+        np.testing.assert_array_equal(fused['min_mtot_idx'] < 0, reference['min_mtot_idx'] < 0)
+
+
+def test_backend_resolution():
+    assert LinearStage.resolve_backend('auto') == ('numba' if kernels.available() else 'numpy')
+    assert LinearStage.resolve_backend('auto', 'float32') == 'numpy'
+    assert BoostedStage.resolve_backend('auto') == 'numpy'
+    with pytest.raises(ValueError):
+        BoostedStage.resolve_backend('numba')
+    if not kernels.available():
+        with pytest.raises(ImportError):
+            LinearStage.resolve_backend('numba')
+    else:
+        with pytest.raises(ValueError):
+            LinearStage.resolve_backend('numba', 'float32')
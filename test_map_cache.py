@@ -0,0 +1,141 @@
+import multiprocessing
+import os
+import numpy as np
+import pytest
+from Engine import Engine
+from MapCache import MapCache, SliceCache
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.AsparagusStage import AsparagusStage
+from Stages.BoostedStage import BoostedStage
+from utils import LazyCatalog, get_allow_engines
+
+SWEEP = dict(pl_span=[0.1, 300], dv_span=[100, 8000], span=16, max_eng_quant=1, asl_or_vac='vac', TWR_req=1.0)
+MAP_KEYS = ['pl', 'dv', 'min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']
+
+
+def stage_without(name):
+    allowed = dict(get_allow_engines(), **{name: False})
+
+    class Stage(LinearStage):
+        allowed_engines = allowed
+        catalog = LazyCatalog(lambda cls: Engine.catalog(cls.allowed_engines))
+        engines = LazyCatalog(lambda cls: cls.catalog.to_engines())
+    return Stage
+
+
+def test_cache_hit_returns_the_solved_map(tmp_path):
+    cache = MapCache(str(tmp_path))
+    solved = LinearStage.optimize_map(**SWEEP, cache=cache)
+    cached = LinearStage.optimize_map(**SWEEP, cache=cache)
+    for name in MAP_KEYS:
+        np.testing.assert_array_equal(cached[name], solved[name])
+    assert cached['engines'] == list(solved['engines'])
+    assert len(list(tmp_path.glob('*.npz'))) == 1
+
+    LinearStage.optimize_map(**dict(SWEEP, TWR_req=1.5), cache=cache)
+    assert len(list(tmp_path.glob('*.npz'))) == 2
+
+
+def test_key_follows_the_built_catalog():
+    cache = MapCache()
+    # Both classes have the same qualified name, only their catalogs differ
+    stage = stage_without('Mainsail')
+    assert cache.key(stage, **SWEEP) != cache.key(stage_without('Rhino'), **SWEEP)
+    assert cache.key(stage, **SWEEP) == cache.key(stage_without('Mainsail'), **SWEEP)
+
+    # Toggling an engine after the catalog is built does not change what the map is solved from, so neither may the
+    # key change
+    key = cache.key(stage, **SWEEP)
+    stage.allowed_engines['Mainsail'] = True
+    assert cache.key(stage, **SWEEP) == key
+    assert 'Mainsail' not in stage.catalog.name
+    stage.reload_catalogs()
+    assert cache.key(stage, **SWEEP) != key
+    assert 'Mainsail' in stage.catalog.name
+
+
+def assert_same_map(maps, reference):
+    for name in MAP_KEYS:
+        np.testing.assert_array_equal(maps[name], reference[name], err_msg=name)
+    assert list(maps['engines']) == list(reference['engines'])
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage])
+def test_sliced_map_matches_optimize_map(tmp_path, cls):
+    sweep = dict(SWEEP, max_eng_quant=2)
+    cache = SliceCache(str(tmp_path))
+    reference = cls.optimize_map(**sweep)
+    assert_same_map(cls.optimize_map_sliced(**sweep, cache=cache), reference)
+    n_slices = cache.misses
+    assert cache.hits == 0 and n_slices == len(set(cls.column_engines(2)))
+    assert_same_map(cls.optimize_map_sliced(**sweep, cache=cache, workers=2), reference)
+    assert cache.hits == n_slices and cache.misses == n_slices
+
+
+def test_toggling_an_engine_only_solves_its_slices(tmp_path):
+    sweep = dict(SWEEP, max_eng_quant=2)
+    stage = stage_without('Mainsail')
+    cache = SliceCache(str(tmp_path))
+    assert_same_map(stage.optimize_map_sliced(**sweep, cache=cache), stage.optimize_map(**sweep))
+    n_slices = cache.misses
+
+    # The engine is added in the middle of the catalog, so the global column indices of the later engines shift
+    stage.allowed_engines['Mainsail'] = True
+    stage.reload_catalogs()
+    cache.hits = cache.misses = 0
+    maps = stage.optimize_map_sliced(**sweep, cache=cache)
+    assert cache.misses == 1 and cache.hits == n_slices
+    assert_same_map(maps, stage.optimize_map(**sweep))
+    assert_same_map(maps, LinearStage.optimize_map(**sweep))
+
+    stage.allowed_engines['Rhino'] = False
+    stage.reload_catalogs()
+    cache.hits = cache.misses = 0
+    maps = stage.optimize_map_sliced(**sweep, cache=cache)
+    assert cache.misses == 0 and cache.hits == n_slices
+    assert_same_map(maps, stage_without('Rhino').optimize_map(**sweep))
+
+
+def small_map(value):
+    maps = LinearStage.optimize_map(**dict(SWEEP, span=4))
+    return dict(maps, min_mtot=np.full((4, 4), float(value)))
+
+
+def test_least_recently_used_maps_are_evicted(tmp_path):
+    cache = MapCache(str(tmp_path))
+    cache.save('a', small_map(0))
+    size = (tmp_path / 'a.npz').stat().st_size
+    cache.max_bytes = 2 * size
+    cache.save('b', small_map(1))
+    # Loading a map marks it as recently used, so b is the oldest when c is added
+    for key, mtime in [('a', 1000), ('b', 2000)]:
+        os.utime(cache.path(key), (mtime, mtime))
+    assert cache.load('a') is not None
+    cache.save('c', small_map(2))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a.npz', 'c.npz']
+    assert cache.load('b') is None and cache.load('c')['min_mtot'][0, 0] == 2
+
+    cache.max_bytes = 0
+    cache.evict()
+    assert list(tmp_path.iterdir()) == []
+
+
+def save_many(directory, key, value):
+    cache = MapCache(directory, max_bytes=0)
+    maps = small_map(value)
+    for _ in range(20):
+        cache.save(key, maps)
+        MapCache(directory).save(key + '_kept', maps)
+
+
+def test_concurrent_writers_of_one_key(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=save_many, args=(str(tmp_path), 'shared', i)) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    assert not list(tmp_path.glob('*.tmp'))
+    maps = MapCache(str(tmp_path)).load('shared_kept')
+    assert maps is not None and maps['min_mtot'][0, 0] in range(4)
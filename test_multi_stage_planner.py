@@ -0,0 +1,45 @@
+import numpy as np
+from Stages.LinearStage import LinearStage
+from Stages.MultiStagePlanner import MultiStagePlanner, RocketPlan
+from frontier import _pareto_reference
+
+
+def brute_force(pl, stages):
+    # Every combination of per-stage Pareto options, without pruning between the stages
+    plans = [(pl, 0.0)]
+    for dv, asl_or_vac, TWR_req, max_eng_quant in stages:
+        plans = [(option.mass, cost + option.cost) for mass, cost in plans
+                 for option in LinearStage.optimize_point(mass, dv, max_eng_quant, asl_or_vac, TWR_req, 'cost')]
+    x = np.array(plans)
+    return x[_pareto_reference(-x)]
+
+
+def test_exact_frontier_matches_brute_force():
+    stages = [(1500, 'vac', 0.5, 1), (2500, 'asl', 1.2, 2)]
+    planner = MultiStagePlanner(pl=3, epsilon=0)
+    for stage in stages:
+        planner.add_stage(*stage)
+    plans = planner.optimize()
+
+    expected = brute_force(3, stages)
+    got = np.array([[plan.mass, plan.cost] for plan in plans])
+    order = np.lexsort((expected[:, 1], expected[:, 0]))
+    np.testing.assert_allclose(got, expected[order], rtol=1e-12)
+    assert all(len(plan.stages) == 2 for plan in plans)
+
+
+def test_prune_keeps_an_epsilon_dominator_of_every_plan():
+    rng = np.random.default_rng(0)
+    plans = [RocketPlan([], mass, cost) for mass, cost in rng.uniform(1, 100, size=(300, 2))]
+    x = np.array([[plan.mass, plan.cost] for plan in plans])
+
+    exact = MultiStagePlanner.prune(plans, 0)
+    assert sorted(id(plan) for plan in exact) == sorted(id(plans[i]) for i in _pareto_reference(-x))
+    masses = [plan.mass for plan in exact]
+    assert masses == sorted(masses)
+
+    epsilon = 0.05
+    kept = MultiStagePlanner.prune(plans, epsilon)
+    assert kept[0] is exact[0]
+    for plan in plans:
+        assert any(k.mass <= plan.mass and k.cost <= (1 + epsilon) * plan.cost for k in kept)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from Stages.LinearStage import LinearStage
+
+
+def closed_form_m100(eng, dv_array, pl_array, n_eng_max):
+    # The rocket equation solved for the tank mass, as in LinearStage.solve_fuel_type
+    num_eng = np.arange(1, n_eng_max + 1)
+    empty_fraction = LinearStage.get_best_empty_fraction(eng.fuel_type, n_eng_max, num_eng)
+    exp = np.exp(dv_array / (eng.isp_vac * 9.8))
+    return (pl_array[:, :, np.newaxis] + num_eng * eng.mass) * (1 - exp) / (empty_fraction * exp - 1)
+
+
+@pytest.mark.parametrize('name', ['Terrier', 'Poodle', 'Nerv'])
+def test_newton_matches_finite_difference_and_closed_form(name):
+    eng = next(eng for eng in LinearStage.engines if eng.name == name)
+    args = (eng, 'vac', [0.5, 20], [100, 3000], 10, 3)
+    dv, pl, newton, info = LinearStage.iterative_forward_optimizer(*args, max_iter=50, min_error=1e-6,
+                                                                   method='newton', return_info=True)
+    fd_dv, fd_pl, finite_difference = LinearStage.iterative_forward_optimizer(*args, max_iter=50, min_error=1e-6)
+    np.testing.assert_array_equal(fd_dv, dv)
+    np.testing.assert_array_equal(fd_pl, pl)
+
+    expected = closed_form_m100(eng, dv, pl, 3)
+    assert info['converged'].all()
+    assert np.all(np.abs(info['residual']) < 1e-3)
+    np.testing.assert_allclose(newton, expected, rtol=1e-4)
+    np.testing.assert_allclose(newton, finite_difference, rtol=1e-4)
+
+
+def test_newton_marks_unreachable_delta_v_infeasible():
+    eng = next(eng for eng in LinearStage.engines if eng.name == 'Terrier')
+    dv, pl, m100, info = LinearStage.iterative_forward_optimizer(eng, 'vac', [0.5, 20], [1000, 20000], 12, 2,
+                                                                 max_iter=50, min_error=1e-6, method='newton',
+                                                                 return_info=True)
+    limit = LinearStage._forward_dv_limit(eng, 'vac', 2)
+    np.testing.assert_array_equal(info['feasible'], dv < limit)
+    assert np.isnan(m100[~info['feasible']]).all()
+    assert info['converged'][info['feasible']].all()
+    assert not info['feasible'].all() and info['feasible'].any()
+    np.testing.assert_allclose(m100[info['feasible']], closed_form_m100(eng, dv, pl, 2)[info['feasible']],
+                               rtol=1e-4)
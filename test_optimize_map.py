@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from MapCache import MapCache
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.AsparagusStage import AsparagusStage
+from Stages.BoostedStage import BoostedStage
+
+STAGES = [LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage]
+MAP_KEYS = ['min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']
+SWEEP = dict(pl_span=[0.1, 300], dv_span=[100, 8000], span=24, max_eng_quant=2, asl_or_vac='asl', TWR_req=1.2)
+
+
+def assert_same_map(maps, reference):
+    for name in MAP_KEYS:
+        np.testing.assert_array_equal(maps[name], reference[name], err_msg=name)
+
+
+def cube_reference(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req):
+    # The original optimize_plot: concatenate every configuration of the whole grid and take the argmin
+    pl, dv = cls.make_grid(pl_span, dv_span, span)
+    blocks = list(cls._configuration_blocks(dv[:, np.newaxis, np.newaxis], pl[np.newaxis, :, np.newaxis],
+                                            max_eng_quant, asl_or_vac, TWR_req))
+    maps = {}
+    for name, k in [('min_mtot', 0), ('min_costs', 1)]:
+        cube = np.concatenate([block[k] for block in blocks], axis=2)
+        maps[name] = np.min(cube, axis=2)
+        maps[name + '_idx'] = np.where(maps[name] == np.inf, -1, np.argmin(cube, axis=2))
+    return maps
+
+
+@pytest.mark.parametrize('cls', STAGES)
+@pytest.mark.parametrize('tile_size', [None, 5, 24])
+def test_tiled_map_matches_full_cube(cls, tile_size):
+    maps = cls.optimize_map(**SWEEP, tile_size=tile_size, prune=False)
+    assert_same_map(maps, cube_reference(cls, **SWEEP))
+    assert np.any(maps['min_mtot_idx'] >= 0) and np.any(maps['min_mtot_idx'] < 0)
+
+
+@pytest.mark.parametrize('cls', STAGES)
+def test_worker_map_matches_serial_map(cls):
+    serial = cls.optimize_map(**SWEEP)
+    assert_same_map(cls.optimize_map(**SWEEP, workers=2), serial)
+    assert_same_map(cls.optimize_map(**SWEEP, tile_size=7, workers=3), serial)
+
+
+@pytest.mark.parametrize('cls', STAGES)
+@pytest.mark.parametrize('span, coarse_step', [(80, 8), (61, 16)])
+def test_adaptive_map_is_exact_where_solved_and_never_better(cls, span, coarse_step):
+    sweep = dict(SWEEP, span=span)
+    maps = cls.optimize_map_adaptive(**sweep, coarse_step=coarse_step)
+    reference = cls.optimize_map(**sweep)
+    assert 0 < maps['n_evaluated'] < span * span
+    # A winner inside a block can be missed, but the minimum over fewer configurations is never lower
+    for name in ['min_mtot', 'min_costs']:
+        assert np.all(maps[name] >= reference[name])
+        same = maps[name + '_idx'] == reference[name + '_idx']
+        np.testing.assert_array_equal(maps[name][same], reference[name][same])
+    np.testing.assert_array_equal(maps['min_mtot_idx'], reference['min_mtot_idx'])
+    if cls in (LinearStage, LinearStageKSP2):
+        assert_same_map(maps, reference)
+
+
+@pytest.mark.parametrize('span', [1, 2, 3])
+def test_adaptive_map_of_tiny_grids(span):
+    sweep = dict(SWEEP, span=span)
+    assert_same_map(LinearStage.optimize_map_adaptive(**sweep), LinearStage.optimize_map(**sweep))
+
+
+@pytest.mark.parametrize('cls', STAGES)
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+@pytest.mark.parametrize('TWR_req', [0.5, 1.2, 3.0])
+def test_pruned_map_matches_unpruned_map(cls, asl_or_vac, TWR_req):
+    # Only the linear classes prune, the others solve every configuration against their own bounds
+    prunes = cls in (LinearStage, LinearStageKSP2)
+    sweeps = [dict(SWEEP, asl_or_vac=asl_or_vac, TWR_req=TWR_req)]
+    if prunes:
+        # A narrow grid prunes more configurations against each other
+        sweeps.append(dict(SWEEP, asl_or_vac=asl_or_vac, TWR_req=TWR_req, pl_span=[20, 40], dv_span=[3000, 3500],
+                           max_eng_quant=3))
+    for sweep in sweeps:
+        maps = cls.optimize_map(**sweep, tile_size=7)
+        assert_same_map(maps, cls.optimize_map(**sweep, prune=False))
+        assert maps['n_pruned'] > 0 if prunes else maps['n_pruned'] == 0
+
+
+def test_map_cache_hit_keeps_n_pruned(tmp_path):
+    cache = MapCache(str(tmp_path))
+    sweep = dict(SWEEP, pl_span=[20, 40], dv_span=[3000, 3500], max_eng_quant=3)
+    solved = LinearStage.optimize_map(**sweep, cache=cache)
+    hit = LinearStage.optimize_map(**sweep, cache=cache)
+    assert hit is not solved
+    assert_same_map(hit, solved)
+    assert hit['n_pruned'] == solved['n_pruned'] > 0
+    assert type(hit['n_pruned']) is int
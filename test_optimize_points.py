@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.AsparagusStage import AsparagusStage
+from Stages.BoostedStage import BoostedStage
+
+STAGES = [LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage]
+
+
+def grid_points(cls, span=12):
+    pl, dv = cls.make_grid([0.5, 200], [200, 7000], span)
+    dv_grid, pl_grid = np.meshgrid(dv, pl, indexing='ij')
+    return pl_grid.ravel(), dv_grid.ravel()
+
+
+@pytest.mark.parametrize('cls', STAGES)
+def test_mass_points_match_the_map(cls):
+    pl, dv = grid_points(cls)
+    maps = cls.optimize_map([0.5, 200], [200, 7000], 12, 2, 'asl', 1.2, prune=False)
+    points = cls.optimize_points(pl, dv, 2, 'asl', 1.2)
+    np.testing.assert_array_equal(points['engine_idx'], maps['min_mtot_idx'].ravel())
+    np.testing.assert_array_equal(points['mass'], maps['min_mtot'].ravel())
+
+    chunked = cls.optimize_points(pl, dv, 2, 'asl', 1.2, chunk_size=7)
+    for name in ['engine_idx', 'mass', 'cost', 'fuel', 'num_engines']:
+        np.testing.assert_array_equal(chunked[name], points[name])
+
+
+@pytest.mark.parametrize('cls', STAGES)
+def test_cost_points_hold_the_frontier_of_every_point(cls):
+    pl, dv = grid_points(cls)
+    maps = cls.optimize_map([0.5, 200], [200, 7000], 12, 2, 'asl', 1.2, prune=False)
+    points = cls.optimize_points(pl, dv, 2, 'asl', 1.2, min_type='cost')
+    offsets = points['offsets']
+    for i, (min_mtot, min_costs) in enumerate(zip(maps['min_mtot'].ravel(), maps['min_costs'].ravel())):
+        frontier = slice(offsets[i], offsets[i + 1])
+        if min_mtot == np.inf:
+            assert offsets[i] == offsets[i + 1]
+            assert cls.optimize_point(pl[i], dv[i], 2, 'asl', 1.2, 'cost') == []
+            continue
+        assert np.min(points['mass'][frontier]) == min_mtot
+        assert np.min(points['cost'][frontier]) == min_costs
+        # Sorted by mass, a frontier gets cheaper with every step
+        order = np.argsort(points['mass'][frontier])
+        assert np.all(np.diff(points['cost'][frontier][order]) < 0)
+    stages = cls.optimize_point(pl[-1], dv[-1], 2, 'asl', 1.2, 'cost')
+    assert [stage.mass for stage in stages] == points['mass'][offsets[-2]:offsets[-1]].tolist()
+
+
+@pytest.mark.parametrize('min_type', ['mass', 'cost'])
+def test_shared_delta_v_is_broadcast_to_every_point(min_type):
+    pl = np.array([1., 10., 50.])
+    shared = LinearStage.optimize_points(pl, [3000], 2, 'asl', 1.2, min_type=min_type)
+    expected = LinearStage.optimize_points(pl, np.full(3, 3000.), 2, 'asl', 1.2, min_type=min_type)
+    np.testing.assert_array_equal(shared['dv'], expected['dv'])
+    for i in range(3):
+        stages = LinearStage.points_to_stages(shared, i)
+        assert stages and [stage.mass for stage in stages] == \
+            [stage.mass for stage in LinearStage.points_to_stages(expected, i)]
+
+
+def test_mismatched_point_lengths_raise():
+    with pytest.raises(ValueError):
+        LinearStage.optimize_points([1., 2., 3.], [1000., 2000.], 2, 'asl', 1.2)
+    with pytest.raises(ValueError):
+        LinearStage.optimize_points(np.ones((2, 2)), np.ones((2, 2)), 2, 'asl', 1.2)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.AsparagusStage import AsparagusStage
+from Stages.BoostedStage import BoostedStage
+
+SWEEP = dict(pl_span=[0.1, 300], dv_span=[100, 8000], span=5, max_eng_quant=2, asl_or_vac='asl', TWR_req=1.2)
+
+
+def summary(stages):
+    return [(stage.engine, stage.num_engines, stage.mass, stage.cost) for stage in stages]
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage])
+def test_pareto_map_matches_optimize_point_per_cell(cls):
+    pareto_map = cls.optimize_plot(**SWEEP, plot=False, min_type='cost')
+    span = SWEEP['span']
+    assert pareto_map['shape'] == (span, span) and len(pareto_map['offsets']) == span * span + 1
+    pl, dv = cls.make_grid(SWEEP['pl_span'], SWEEP['dv_span'], span)
+    sizes = []
+    for i in range(span):
+        for j in range(span):
+            expected = cls.optimize_point(pl[j], dv[i], SWEEP['max_eng_quant'], SWEEP['asl_or_vac'],
+                                          SWEEP['TWR_req'], 'cost')
+            stages = cls.points_to_stages(pareto_map, i * span + j)
+            assert summary(stages) == summary(expected)
+            sizes.append(len(stages))
+    # Empty and multi-member sets are both covered, except for KSP2 where every tank is free and the lightest
+    # configuration is also the cheapest
+    assert min(sizes) == 0 and max(sizes) > (1 if cls is not LinearStageKSP2 else 0)
+
+
+def brute_force_pareto_sets(cls, pl_span, dv_span, span, max_eng_quant, asl_or_vac, TWR_req):
+    # Every configuration of every cell, explicit columns also disable the incumbent pruning of BoostedStage
+    pl, dv = cls.make_grid(pl_span, dv_span, span)
+    columns = np.arange(len(cls.configuration_labels(max_eng_quant)[0]))
+    blocks = list(cls._configuration_blocks(dv[:, np.newaxis, np.newaxis], pl[np.newaxis, :, np.newaxis],
+                                            max_eng_quant, asl_or_vac, TWR_req, columns=columns))
+    m_tot, costs = [np.concatenate([block[k] for block in blocks], axis=2).reshape(span * span, -1) for k in (0, 1)]
+    sets = []
+    for mass, cost in zip(m_tot, costs):
+        members = []
+        for a in np.flatnonzero(np.isfinite(mass) & np.isfinite(cost)):
+            weakly_dominated = (cost <= cost[a]) & (mass <= mass[a])
+            identical = (cost == cost[a]) & (mass == mass[a])
+            # Of several identical configurations only the first is a member
+            if not np.any(weakly_dominated & ~identical | identical & (columns < a)):
+                members.append(a)
+        sets.append((members, mass, cost))
+    return sets
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage])
+def test_pareto_map_matches_brute_force(cls):
+    pareto_map = cls.optimize_pareto_map(**SWEEP, chunk_size=7)
+    n_ties = 0
+    for k, (members, mass, cost) in enumerate(brute_force_pareto_sets(cls, **SWEEP)):
+        entries = slice(pareto_map['offsets'][k], pareto_map['offsets'][k + 1])
+        engine_idx = pareto_map['engine_idx'][entries]
+        assert sorted(engine_idx.tolist()) == members
+        np.testing.assert_array_equal(pareto_map['mass'][entries], mass[engine_idx])
+        np.testing.assert_array_equal(pareto_map['cost'][entries], cost[engine_idx])
+        for a in engine_idx:
+            # A member with an identical configuration, e.g. a duplicate catalog row, is the first of them
+            identical = np.flatnonzero((cost == cost[a]) & (mass == mass[a]))
+            assert identical[0] == a and not np.isin(identical[1:], engine_idx).any()
+            n_ties += len(identical) - 1
+    # The duplicate Twitch rows of KSP1 and the equal Rhino and Vector rows of KSP2 tie on some frontiers
+    assert n_ties > 0 if cls is not AsparagusStage else n_ties == 0
+
+
+def test_minimum_mass_pareto_map_matches_optimize_map():
+    pareto_map = LinearStage.optimize_pareto_map(**SWEEP, min_type='mass', chunk_size=7)
+    maps = LinearStage.optimize_map(**SWEEP)
+    np.testing.assert_array_equal(np.reshape(pareto_map['engine_idx'], pareto_map['shape']), maps['min_mtot_idx'])
+    feasible = maps['min_mtot_idx'] >= 0
+    np.testing.assert_array_equal(np.reshape(pareto_map['mass'], pareto_map['shape'])[feasible],
+                                  maps['min_mtot'][feasible])
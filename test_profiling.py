@@ -0,0 +1,46 @@
+import json
+import numpy as np
+import profiling
+from profiling import Profiler, phase
+from Stages.LinearStage import LinearStage
+
+
+def test_phase_is_a_no_op_without_profiler():
+    with phase('outside', cells=3) as p:
+        p.update(nbytes=1)
+    assert profiling._active is None
+
+
+def test_profiled_map_is_unchanged_and_counts_every_cell(tmp_path):
+    args = ([0.1, 300], [100, 8000], 20, 2, 'vac', 1.0)
+    reference = LinearStage.optimize_map(*args, tile_size=8)
+    with Profiler(trace_memory=True) as profiler:
+        maps = LinearStage.optimize_map(*args, tile_size=8)
+    assert profiling._active is None
+    np.testing.assert_array_equal(maps['min_mtot_idx'], reference['min_mtot_idx'])
+    np.testing.assert_array_equal(maps['min_costs'], reference['min_costs'])
+
+    summary = {group['name']: group for group in profiler.summary()}
+    assert summary['tile']['calls'] == 9 and summary['tile']['cells'] == 20 * 20
+    assert summary['optimize_map']['calls'] == 1
+    assert all(group['total'] >= 0 and 'peak' in group for group in summary.values())
+    outer = next(record for record in profiler.records if record['name'] == 'optimize_map')
+    assert outer['depth'] == 0
+    assert all(record['depth'] > 0 for record in profiler.records if record['name'] == 'tile')
+
+    path = tmp_path / 'trace.json'
+    profiler.save_chrome_trace(str(path))
+    events = json.loads(path.read_text())['traceEvents']
+    assert len(events) == len(profiler.records) and all(event['ph'] == 'X' for event in events)
+
+
+def test_nested_profilers_restore_the_outer_one():
+    with Profiler() as outer:
+        with phase('a'):
+            with Profiler() as inner:
+                with phase('b'):
+                    pass
+            with phase('c'):
+                pass
+    assert [record['name'] for record in inner.records] == ['b']
+    assert [record['name'] for record in outer.records] == ['c', 'a']
@@ -0,0 +1,103 @@
+import asyncio
+import numpy as np
+import pytest
+from service import OptimizationService, ServiceClient, solve_points, to_json
+from Stages.LinearStage import LinearStage
+
+POINTS = dict(pl=[5, 40], dv=[3400, 1200], max_eng_quant=2, asl_or_vac='asl', TWR_req=1.5, min_type='mass')
+MAP = dict(pl_span=[0.1, 300], dv_span=[100, 8000], span=10, max_eng_quant=2, asl_or_vac='vac', TWR_req=1.0)
+
+
+@pytest.fixture
+def service():
+    service = OptimizationService(workers=1, max_maps=1)
+    yield service
+    service.close()
+
+
+def request(method, **params):
+    return {'id': method, 'method': method, 'params': params}
+
+
+def test_identical_concurrent_requests_are_solved_once(service):
+    async def main():
+        return await asyncio.gather(service.handle(request('optimize_points', **POINTS)),
+                                    service.handle(request('optimize_points', **POINTS)),
+                                    service.handle(request('optimize_point', **dict(POINTS, pl=5, dv=3400))))
+
+    first, second, point = asyncio.run(main())
+    assert service.counters['solves'] == 2 and service.counters['coalesced'] == 1
+    assert first == second and first['result'] == solve_points('LinearStage', POINTS)
+    assert point['result'] == first['result'][0]
+    assert not service.in_flight
+
+
+def test_maps_are_cached_and_evicted(service):
+    async def main():
+        first = await service.handle(request('optimize_map', **MAP, fields=['min_mtot', 'min_mtot_idx']))
+        second = await service.handle(request('optimize_map', **MAP))
+        await service.handle(request('optimize_map', **dict(MAP, span=4)))
+        await service.handle(request('optimize_map', **MAP))
+        return first, second, await service.handle(request('stats'))
+
+    first, second, stats = asyncio.run(main())
+    reference = to_json(LinearStage.optimize_map(**MAP))
+    assert first['result'] == {name: reference[name] for name in ['min_mtot', 'min_mtot_idx']}
+    assert second['result'] == reference and None in np.ravel(second['result']['min_mtot']).tolist()
+    # max_maps=1 evicts the first map before it is requested again
+    assert stats['result']['map_hits'] == 1 and stats['result']['solves'] == 3 and stats['result']['maps'] == 1
+
+
+def test_errors_are_answered_and_counted(service):
+    async def main():
+        return await asyncio.gather(service.handle(request('unknown')),
+                                    service.handle(request('optimize_points', **POINTS, stage='NoStage')))
+
+    unknown, stage = asyncio.run(main())
+    assert unknown['error']['type'] == 'ValueError' and stage['error']['type'] == 'ValueError'
+    assert service.counters['errors'] == 2
+
+
+def test_client_round_trip_over_a_unix_socket(service, tmp_path):
+    path = str(tmp_path / 'service.sock')
+
+    async def main():
+        server = asyncio.ensure_future(service.serve(path=path))
+        while not (tmp_path / 'service.sock').exists():
+            await asyncio.sleep(0.01)
+
+        def client_calls():
+            with ServiceClient(path) as client:
+                stages = client.call('optimize_point', **dict(POINTS, pl=5, dv=3400))
+                responses = client.batch([('optimize_points', POINTS), ('stats', {})])
+                with pytest.raises(RuntimeError):
+                    client.call('unknown')
+                return stages, responses
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, client_calls)
+        finally:
+            server.cancel()
+
+    stages, responses = asyncio.run(main())
+    assert stages == solve_points('LinearStage', POINTS)[0]
+    assert [response['id'] for response in responses] == [2, 3]
+    assert responses[0]['result'] == solve_points('LinearStage', POINTS)
+
+
+def test_plots_stay_in_the_plot_directory(tmp_path):
+    service = OptimizationService(workers=1, plot_dir=str(tmp_path / 'plots'))
+
+    async def main():
+        return await asyncio.gather(service.handle(request('optimize_plot', **MAP, filename='../../escape.png')),
+                                    service.handle(request('optimize_plot', **MAP, filename='..')))
+
+    try:
+        plot, invalid = asyncio.run(main())
+    finally:
+        service.close()
+    assert plot['result'] == str(tmp_path / 'plots' / 'escape.png')
+    assert (tmp_path / 'plots' / 'escape.png').exists() and not (tmp_path / 'escape.png').exists()
+    assert invalid['error']['type'] == 'ValueError'
+    # The map is solved in a worker, the plot is drawn in the service from the cached map
+    assert service.counters['solves'] == 1
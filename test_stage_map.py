@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from StageMap import StageMap
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.AsparagusStage import AsparagusStage
+
+SWEEP = dict(pl_span=[0.1, 300], dv_span=[100, 20000], span=120, TWR_req=1.2)
+
+
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+@pytest.mark.parametrize('asl_or_vac', ['asl', 'vac'])
+@pytest.mark.parametrize('max_eng_quant', [1, 3])
+def test_float32_map_is_within_the_documented_tolerance(cls, asl_or_vac, max_eng_quant):
+    reference = cls.optimize_map(**SWEEP, max_eng_quant=max_eng_quant, asl_or_vac=asl_or_vac)
+    maps = cls.optimize_map(**SWEEP, max_eng_quant=max_eng_quant, asl_or_vac=asl_or_vac, precision='float32')
+    assert maps['min_mtot'].dtype == np.float32
+    accuracy = StageMap.from_map(maps).accuracy(reference)
+    for min_type in ['mass', 'cost']:
+        assert accuracy[min_type]['max_relative_error'] <= 1e-6
+        # A point within float32 rounding of the TWR requirement may pick another winner, at most one on this grid
+        assert accuracy[min_type]['feasibility_mismatch'] * SWEEP['span'] ** 2 <= 1
+        assert accuracy[min_type]['winner_mismatch'] * SWEEP['span'] ** 2 <= 1
+
+
+def test_unsupported_precision_raises():
+    with pytest.raises(ValueError):
+        AsparagusStage.optimize_map(**SWEEP, max_eng_quant=1, asl_or_vac='vac', precision='float32')
+
+
+@pytest.mark.parametrize('planes', [True, False])
+def test_stage_map_round_trip(tmp_path, planes):
+    maps = LinearStage.optimize_map(**SWEEP, max_eng_quant=2, asl_or_vac='asl')
+    assert np.any(maps['min_mtot_idx'] < 0)
+    stage_map = StageMap.from_map(maps, planes=planes, params=dict(SWEEP, max_eng_quant=2))
+    assert stage_map.mass_winner.dtype == np.uint16
+    assert np.all((stage_map.mass_winner == StageMap.NONE) == (maps['min_mtot_idx'] < 0))
+
+    path = str(tmp_path / 'map.npz')
+    stage_map.save(path)
+    loaded = StageMap.load(path)
+    assert loaded.params == stage_map.params and loaded.nbytes == stage_map.nbytes
+    expanded = loaded.to_map()
+    for name in ['min_mtot_idx', 'min_costs_idx', 'pl', 'dv']:
+        np.testing.assert_array_equal(expanded[name], maps[name], err_msg=name)
+    assert expanded['engines'] == list(maps['engines'])
+    assert expanded['quant_engines'] == list(maps['quant_engines'])
+    if planes:
+        np.testing.assert_allclose(expanded['min_mtot'], maps['min_mtot'], rtol=6e-8)
+        assert np.array_equal(np.isinf(expanded['min_costs']), np.isinf(maps['min_costs']))
+    else:
+        assert expanded['min_mtot'] is None and loaded.accuracy(maps)['mass']['max_relative_error'] is None
+
+    names, counts = loaded.lookup('mass')
+    feasible = maps['min_mtot_idx'] >= 0
+    assert np.all(names[~feasible] == '') and np.all(counts[~feasible] == 0)
+    engines = np.asarray(maps['engines'])
+    np.testing.assert_array_equal(names[feasible], engines[maps['min_mtot_idx'][feasible]])
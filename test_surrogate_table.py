@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from Engine import Engine
+from SurrogateTable import SurrogateTable
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from utils import get_allow_engines, LazyCatalog
+
+TABLE = dict(pl_span=[0.1, 300], dv_span=[100, 8000], max_eng_quant=2, asl_or_vac='asl', TWR_req=1.2, pl_points=33,
+             dv_points=33)
+
+
+def summary(stages):
+    return [(stage.engine, stage.num_engines, stage.mass, stage.cost) for stage in stages]
+
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return zip(np.exp(rng.uniform(np.log(0.1), np.log(300), n)), rng.uniform(100, 8000, n))
+
+
+def direct(cls, pl, dv, min_type):
+    return summary(cls.optimize_point(pl, dv, TABLE['max_eng_quant'], TABLE['asl_or_vac'], TABLE['TWR_req'],
+                                      min_type))
+
+
+@pytest.mark.filterwarnings('error')
+@pytest.mark.parametrize('cls', [LinearStage, LinearStageKSP2])
+def test_surrogate_matches_optimize_point(cls):
+    table = SurrogateTable(cls, **TABLE)
+    heuristic = SurrogateTable(cls, **TABLE, cost_slack=None)
+    assert table.cost_slack == 1
+    assert 0 <= heuristic.cost_slack < 1
+    for pl, dv in random_points(40):
+        assert summary(table.optimize_point(pl, dv, 'mass')) == direct(cls, pl, dv, 'mass')
+        assert summary(table.optimize_point(pl, dv, 'cost')) == direct(cls, pl, dv, 'cost')
+        # The measured slack is a heuristic, but it covers the cost drops of the shipped tanks
+        assert summary(heuristic.optimize_point(pl, dv, 'cost')) == direct(cls, pl, dv, 'cost')
+
+
+def test_free_tanks_have_no_cost_drop():
+    costs = np.array([[0., 0., 5.], [0., np.inf, 4.]])
+    assert SurrogateTable.largest_relative_drop(costs) == pytest.approx(0.2)
+
+
+def test_points_outside_the_table_are_solved_directly():
+    table = SurrogateTable(LinearStage, **TABLE)
+    assert summary(table.optimize_point(500, 3000, 'mass')) == direct(LinearStage, 500, 3000, 'mass')
+    winners, exact = table.lookup([500, 5], [3000, 3000])
+    assert winners[0] == -1 and not exact[0]
+
+
+def test_tables_follow_the_built_catalog():
+    class Stage(LinearStage):
+        allowed_engines = dict(get_allow_engines(), Mainsail=False)
+        catalog = LazyCatalog(lambda cls: Engine.catalog(cls.allowed_engines))
+        engines = LazyCatalog(lambda cls: cls.catalog.to_engines())
+
+    args = (Stage, TABLE['pl_span'], TABLE['dv_span'], TABLE['max_eng_quant'], TABLE['asl_or_vac'], TABLE['TWR_req'])
+    table = SurrogateTable.for_stage(*args, pl_points=9, dv_points=9)
+    assert SurrogateTable.for_stage(*args, pl_points=9, dv_points=9) is table
+
+    Stage.allowed_engines['Mainsail'] = True
+    Stage.reload_catalogs()
+    rebuilt = SurrogateTable.for_stage(*args, pl_points=9, dv_points=9)
+    assert rebuilt is not table
+    assert summary(rebuilt.optimize_point(50, 3000, 'mass')) == direct(Stage, 50, 3000, 'mass')
+    assert any(stage.engine == 'Mainsail' for pl, dv in random_points(40)
+               for stage in rebuilt.optimize_point(pl, dv, 'mass'))
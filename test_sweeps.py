@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from Stages.AsparagusStage import AsparagusStage
+from Stages.BoostedStage import BoostedStage
+
+STAGES = [LinearStage, LinearStageKSP2, AsparagusStage, BoostedStage]
+MAP_KEYS = ['min_mtot', 'min_mtot_idx', 'min_costs', 'min_costs_idx']
+GRID = dict(pl_span=[0.1, 300], dv_span=[100, 8000], span=12, max_eng_quant=2)
+
+
+def assert_same_map(maps, reference, k):
+    for name in MAP_KEYS:
+        np.testing.assert_array_equal(maps[name][k], reference[name], err_msg=name)
+
+
+@pytest.mark.parametrize('cls', STAGES)
+def test_twr_sweep_matches_optimize_map_per_threshold(cls):
+    TWR_reqs = [0.5, 1.2, 2.5]
+    maps = cls.optimize_twr_sweep(**GRID, asl_or_vac='asl', TWR_reqs=TWR_reqs, tile_size=5)
+    assert maps['min_mtot'].shape == (3, GRID['span'], GRID['span'])
+    for k, TWR_req in enumerate(TWR_reqs):
+        assert_same_map(maps, cls.optimize_map(**GRID, asl_or_vac='asl', TWR_req=TWR_req), k)
+
+
+def test_twr_limits_are_the_thresholds_where_winners_change():
+    maps = LinearStage.optimize_twr_sweep(**GRID, asl_or_vac='vac', TWR_reqs=[0.5])
+    feasible = maps['min_mtot_idx'][0] >= 0
+    # max_twr covers every feasible configuration, also those below the requirement
+    assert np.array_equal(maps['max_twr'] >= 0.5, feasible)
+    for name, limit_name in [('min_mtot', 'mtot_twr_limit'), ('min_costs', 'costs_twr_limit')]:
+        limit = maps[limit_name][0]
+        assert np.array_equal(np.isnan(limit), ~feasible)
+        assert np.all(limit[feasible] >= 0.5) and np.all(limit[feasible] <= maps['max_twr'][feasible])
+        # Just below its limit a winner still wins, just above it the winner is infeasible
+        for i, j in np.argwhere(feasible)[::17]:
+            nearby = LinearStage.optimize_twr_sweep(**GRID, asl_or_vac='vac',
+                                                    TWR_reqs=[limit[i, j] * (1 - 1e-9), limit[i, j] * (1 + 1e-9)])
+            assert nearby[name + '_idx'][0, i, j] == maps[name + '_idx'][0, i, j]
+            assert nearby[name + '_idx'][1, i, j] != maps[name + '_idx'][0, i, j]
+    i, j = np.unravel_index(np.argmin(np.where(feasible, maps['max_twr'], np.inf)), feasible.shape)
+    nearby = LinearStage.optimize_twr_sweep(**GRID, asl_or_vac='vac',
+                                            TWR_reqs=[maps['max_twr'][i, j] * (1 - 1e-9),
+                                                      maps['max_twr'][i, j] * (1 + 1e-9)])
+    assert nearby['min_mtot_idx'][0, i, j] >= 0 and nearby['min_mtot_idx'][1, i, j] < 0
+
+
+@pytest.mark.parametrize('cls', STAGES)
+def test_pressure_sweep_matches_optimize_map_per_pressure(cls):
+    pressures = [0, 0.35, 1]
+    maps = cls.optimize_pressure_sweep(**GRID, pressures=pressures, TWR_req=1.2, tile_size=5)
+    assert maps['min_mtot'].shape == (3, GRID['span'], GRID['span'])
+    for k, pressure in enumerate(pressures):
+        assert_same_map(maps, cls.optimize_map(**GRID, asl_or_vac=pressure, TWR_req=1.2), k)
+    # The end points are the vacuum and sea level maps
+    for k, asl_or_vac in [(0, 'vac'), (2, 'asl')]:
+        reference = cls.optimize_map(**GRID, asl_or_vac=asl_or_vac, TWR_req=1.2)
+        for name in ['min_mtot_idx', 'min_costs_idx']:
+            np.testing.assert_array_equal(maps[name][k], reference[name], err_msg=name)
+        for name in ['min_mtot', 'min_costs']:
+            np.testing.assert_allclose(maps[name][k], reference[name], rtol=1e-12, err_msg=name)
+
+
+def test_pressure_outside_the_atmosphere_range_raises():
+    with pytest.raises(ValueError):
+        LinearStage.optimize_pressure_sweep(**GRID, pressures=[0.5, 1.5], TWR_req=1.2)
@@ -0,0 +1,80 @@
+import numpy as np
+from Stages.LinearStage import LinearStage, LinearStageKSP2
+from utils import LazyCatalog, get_allow_engines, region_label_points
+
+
+def subclass_without(name):
+    class Stage(LinearStage):
+        allowed_engines = dict(get_allow_engines(), **{name: False})
+    return Stage
+
+
+def test_lazy_catalog_is_memoized_per_class():
+    calls = []
+
+    class Base:
+        value = LazyCatalog(lambda cls: calls.append(cls) or cls.__name__)
+
+    class Child(Base):
+        pass
+
+    assert Child.value == 'Child'
+    assert Base.value == 'Base'
+    assert Child.value == 'Child' and Base().value == 'Base'
+    assert calls == [Child, Base]
+
+
+def test_subclass_catalog_does_not_leak_into_the_parent():
+    # Build the subclass first, then the parent, and the other way around
+    for subclass_first in (True, False):
+        LinearStage.reload_catalogs()
+        stage = subclass_without('Mainsail')
+        if subclass_first:
+            stage.catalog
+        assert 'Mainsail' in LinearStage.catalog.name
+        assert 'Mainsail' not in stage.catalog.name
+        assert [engine.name for engine in stage.engines] == stage.catalog.name.tolist()
+        assert len(stage.catalog) == len(LinearStage.catalog) - 1
+    assert 'Mainsail' in LinearStageKSP2.catalog.name
+
+
+def test_reload_catalogs_picks_up_allowed_engines():
+    stage = subclass_without('Mainsail')
+    assert 'Mainsail' not in stage.catalog.name
+    stage.allowed_engines['Mainsail'] = True
+    assert 'Mainsail' not in stage.catalog.name
+    stage.reload_catalogs()
+    assert 'Mainsail' in stage.catalog.name
+    assert 'Mainsail' in [engine.name for engine in stage.engines]
+    assert len(stage.catalog) == len(LinearStage.catalog)
+
+
+def test_reload_catalogs_reaches_subclasses():
+    stage = subclass_without('Rhino')
+    catalog = stage.catalog
+    tanks = LinearStageKSP2.tanks
+    LinearStage.reload_catalogs()
+    assert stage.catalog is not catalog
+    assert LinearStageKSP2.tanks is not tanks
+    np.testing.assert_array_equal(stage.catalog.name, catalog.name)
+
+
+def test_region_label_points_pick_the_cell_closest_to_the_centroid():
+    rng = np.random.default_rng(3)
+    label_map = rng.integers(-1, 6, size=(30, 40))
+    label_map[5:20, 10:12] = 7  # A thin region away from the rest of its label
+    label_map[0, 0] = 9  # A single cell
+    labels, points, sizes = region_label_points(label_map, ignore=-1, min_size=1)
+
+    expected_labels = [label for label in np.unique(label_map) if label != -1]
+    np.testing.assert_array_equal(labels, expected_labels)
+    for label, point, size in zip(labels, points, sizes):
+        # A per-label nearest neighbour search, ties go to the first cell in row-major order
+        cells = np.argwhere(label_map == label)
+        distance = np.sum((cells - cells.mean(axis=0)) ** 2, axis=1)
+        np.testing.assert_array_equal(point, cells[np.argmin(distance)])
+        assert label_map[tuple(point)] == label
+        assert size == len(cells)
+
+    large_labels, large_points, large_sizes = region_label_points(label_map, ignore=-1, min_size=2)
+    assert 9 not in large_labels and np.all(large_sizes >= 2)
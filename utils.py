@@ -1,4 +1,10 @@
+import os
+import weakref
 import numpy as np
+from frontier import pareto_indices
+
+# The engine and tank CSV files, found next to this module so the catalogs build from any working directory
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
 
 def pareto(X: np.ndarray, directions: list) -> np.ndarray:
@@ -18,18 +24,41 @@ def pareto(X: np.ndarray, directions: list) -> np.ndarray:
     numpy.ndarray
         A 1D array containing the indices of the non-dominated points in X.
     """
-    costs = X * directions
-    is_efficient = np.arange(costs.shape[0])
-    n_points = costs.shape[0]
-    next_point_index = 0  # Next index in the is_efficient array to search for
-    while next_point_index < len(costs):
-        nondominated_point_mask = np.any(costs > costs[next_point_index], axis=1)
-        nondominated_point_mask[next_point_index] = True
-        is_efficient = is_efficient[nondominated_point_mask]  # Remove dominated points
-        costs = costs[nondominated_point_mask]
-        next_point_index = np.sum(nondominated_point_mask[:next_point_index]) + 1
+    return pareto_indices(X, directions)
+
+
+class LazyCatalog:
+    """
+    Class attribute that is built from the owning class on first access and memoized per class afterwards.
+
+    The engine and tank catalogs are parsed from CSV files, so building them when a module is imported makes every
+    script pay for them even if it never runs an optimization. Every class the attribute is read on gets its own
+    value, so a subclass that overrides allowed_engines gets its own catalog without redeclaring the attribute.
+
+    Example:
+        >>> class Stage:
+        ...     allowed_engines = get_allow_engines()
+        ...     engines = LazyCatalog(lambda cls: Engine.setupEngines(cls.allowed_engines))
+    """
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory (callable): Called with the class the attribute is accessed on and returns the catalog.
+        """
+        self.factory = factory
+        self.values = weakref.WeakKeyDictionary()
 
-    return is_efficient
+    def __get__(self, obj, owner):
+        if owner not in self.values:
+            self.values[owner] = self.factory(owner)
+        return self.values[owner]
+
+    def reload(self, owner):
+        """
+        Drops the value built for owner, so the next access builds it again.
+        """
+        self.values.pop(owner, None)
 
 
 def get_allow_engines():
@@ -106,6 +135,39 @@ def get_allow_engines_KSP2():
     }
 
 
+def region_label_points(label_map, ignore=-1, min_size=1):
+    """
+    Finds a representative point for every labeled region of a 2D label map in a single sweep.
+
+    The representative of a label is the cell of that label closest to the label's centroid, so it always lies
+    inside the region even when the region is not convex. Centroids come from np.bincount over all cells at once
+    and the closest cell from one lexsort, instead of an np.argwhere and a nearest-neighbour fit per label.
+
+    :param label_map: 2D integer array of labels
+    :param ignore: Label that does not get a representative point, e.g. -1 for infeasible cells
+    :param min_size: Labels covering fewer cells than this are skipped
+    :return: labels, points and sizes. points has shape (n_labels, 2) and holds the row and column index of each
+        representative cell, sizes holds the number of cells of each label.
+    """
+    flat = np.ravel(label_map)
+    cells = np.flatnonzero(flat != ignore)
+    labels, inverse, sizes = np.unique(flat[cells], return_inverse=True, return_counts=True)
+    rows, cols = np.unravel_index(cells, np.shape(label_map))
+
+    center_rows = np.bincount(inverse, weights=rows) / sizes
+    center_cols = np.bincount(inverse, weights=cols) / sizes
+    distance = (rows - center_rows[inverse]) ** 2 + (cols - center_cols[inverse]) ** 2
+
+    # Sort by label, then distance, and take the first cell of every label
+    order = np.lexsort((distance, inverse))
+    first = np.searchsorted(inverse[order], np.arange(len(labels)))
+    best = order[first]
+    points = np.stack((rows[best], cols[best]), axis=1)
+
+    large = sizes >= min_size
+    return labels[large], points[large], sizes[large]
+
+
 def rand_cmap(nlabels, type='bright', first_color_black=True, last_color_black=False, verbose=True):
     """
     Creates a random colormap to be used together with matplotlib. Useful for segmentation tasks